@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Create indexes that db.create_all() skips on tables which already exist
+"""
+from app import app, db
+from sqlalchemy import text
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_chat_message_conversation_id ON chat_message (conversation_id)',
+    'CREATE INDEX IF NOT EXISTS ix_doctor_info_approved_specialization ON doctor_info (is_approved, specialization, id)',
+    'CREATE INDEX IF NOT EXISTS ix_doctor_info_approved_experience ON doctor_info (is_approved, experience_years, id)',
+    'CREATE INDEX IF NOT EXISTS ix_doctor_info_user_id ON doctor_info (user_id)',
+    'CREATE INDEX IF NOT EXISTS ix_availability_doctor_active ON availability (doctor_id, is_active)',
+    'CREATE INDEX IF NOT EXISTS ix_user_first_name_lower ON "user" (lower(first_name))',
+    'CREATE INDEX IF NOT EXISTS ix_user_last_name_lower ON "user" (lower(last_name))',
+    'CREATE INDEX IF NOT EXISTS ix_user_username_lower ON "user" (lower(username))',
+    'CREATE INDEX IF NOT EXISTS ix_user_email_lower ON "user" (lower(email))',
+    'CREATE INDEX IF NOT EXISTS ix_doctor_info_specialization_lower ON doctor_info (lower(specialization))',
+]
+
+def add_performance_indexes():
+    with app.app_context():
+        for statement in INDEXES:
+            db.session.execute(text(statement))
+            print(f"Applied: {statement}")
+        db.session.commit()
+        print("Successfully created performance indexes")
+
+if __name__ == '__main__':
+    add_performance_indexes()
@@ -0,0 +1,170 @@
+"""
+Bearer tokens for mobile and integration clients
+
+Access tokens are short-lived HS256 JWTs carrying the user id and role.
+A bearer request resolves its user through the per-worker user cache
+(usually without a query), so an access token stops working as soon as
+its user is deleted or blocked. Refresh tokens are long-lived JWTs whose
+jti is stored in RefreshToken; exchanging one checks that row, and
+revoking a user (block_user, delete_user) marks every row revoked.
+"""
+import functools
+import uuid
+from datetime import datetime, timedelta
+
+import jwt
+from flask import current_app, request, jsonify, g
+from flask_login import login_required
+
+from extensions import db
+from models import User, RefreshToken, load_user
+
+ALGORITHM = 'HS256'
+
+
+def _signing_key():
+    return current_app.config.get('JWT_SECRET_KEY') or current_app.secret_key
+
+
+def _encode(claims, lifetime):
+    now = datetime.utcnow()
+    claims = dict(claims, iat=now, exp=now + timedelta(seconds=lifetime))
+    return jwt.encode(claims, _signing_key(), algorithm=ALGORITHM)
+
+
+def _decode(token, token_type):
+    try:
+        claims = jwt.decode(token, _signing_key(), algorithms=[ALGORITHM],
+                            options={'require': ['exp', 'sub', 'type']})
+    except jwt.InvalidTokenError:
+        return None
+    if claims.get('type') != token_type:
+        return None
+    return claims
+
+
+def issue_access_token(user):
+    return _encode({'sub': str(user.id), 'role': user.role, 'type': 'access'},
+                   current_app.config.get('ACCESS_TOKEN_TTL', 600))
+
+
+def issue_refresh_token(user):
+    """Create a refresh token and record it so it can be revoked (caller commits)"""
+    lifetime = current_app.config.get('REFRESH_TOKEN_TTL', 30 * 24 * 3600)
+    record = RefreshToken()
+    record.jti = uuid.uuid4().hex
+    record.user_id = user.id
+    record.expires_at = datetime.utcnow() + timedelta(seconds=lifetime)
+    db.session.add(record)
+    return _encode({'sub': str(user.id), 'type': 'refresh', 'jti': record.jti}, lifetime)
+
+
+def issue_token_pair(user):
+    """Access and refresh tokens as returned by the token endpoints (caller commits)"""
+    return {
+        'access_token': issue_access_token(user),
+        'refresh_token': issue_refresh_token(user),
+        'token_type': 'Bearer',
+        'expires_in': current_app.config.get('ACCESS_TOKEN_TTL', 600),
+    }
+
+
+def verify_access_token(token):
+    """Claims of a valid access token, or None; never touches the database"""
+    return _decode(token, 'access')
+
+
+def use_refresh_token(token):
+    """
+    Validate a refresh token against the revocation list and revoke it
+
+    Each refresh token is single-use: the caller issues a new pair.
+
+    Returns:
+        The token's active User, or None if it is invalid, expired or revoked
+    """
+    claims = _decode(token, 'refresh')
+    if claims is None or 'jti' not in claims:
+        return None
+
+    record = RefreshToken.query.filter_by(jti=claims['jti']).first()
+    if record is None or record.revoked_at is not None or str(record.user_id) != claims['sub']:
+        return None
+
+    record.revoked_at = datetime.utcnow()
+    user = db.session.get(User, record.user_id)
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+def revoke_refresh_token(token):
+    """Revoke one refresh token (client sign-out); returns True if it was live"""
+    claims = _decode(token, 'refresh')
+    if claims is None or 'jti' not in claims:
+        return False
+    return RefreshToken.query.filter_by(jti=claims['jti'], revoked_at=None).update(
+        {'revoked_at': datetime.utcnow()}, synchronize_session=False
+    ) > 0
+
+
+def revoke_user_tokens(user_id):
+    """Revoke every outstanding refresh token of a user (caller commits)"""
+    RefreshToken.query.filter_by(user_id=user_id, revoked_at=None).update(
+        {'revoked_at': datetime.utcnow()}, synchronize_session=False
+    )
+
+
+def _bearer_token():
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    return token.strip()
+
+
+def bearer_user_id():
+    """User id from a valid bearer access token on this request, else None"""
+    token = _bearer_token()
+    if token is None:
+        return None
+    claims = verify_access_token(token)
+    return claims['sub'] if claims else None
+
+
+def _invalid_token(message):
+    response = jsonify({'error': message})
+    response.status_code = 401
+    response.headers['WWW-Authenticate'] = 'Bearer error="invalid_token"'
+    return response
+
+
+def token_or_login_required(view):
+    """
+    Like login_required, but also accepts 'Authorization: Bearer <access token>'
+
+    A bearer request never reads the session cookie; the token's user
+    becomes current_user for the rest of the request.
+    """
+    session_view = login_required(view)
+
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        token = _bearer_token()
+        if token is None:
+            return session_view(*args, **kwargs)
+
+        claims = verify_access_token(token)
+        if claims is None:
+            return _invalid_token('Invalid or expired token')
+
+        # Resolved here, once, so a deleted or blocked user is a 401 rather
+        # than a failure somewhere inside the view
+        user = load_user(claims['sub'])
+        if user is None or not user.is_active:
+            return _invalid_token('Unknown or blocked user')
+
+        # Flask-Login resolves current_user from g._login_user
+        g._login_user = user
+        return view(*args, **kwargs)
+    return wrapped
@@ -3,6 +3,8 @@ import logging
 from flask import Flask
 from werkzeug.middleware.proxy_fix import ProxyFix
 from extensions import db, login_manager
+from compression import CompressionMiddleware
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,7 +14,26 @@ app = Flask(__name__)
 app.secret_key = "counseling_system_secret_key_8675309_secure_strong_key"
 app.config['WTF_CSRF_TIME_LIMIT'] = 3600*24
 app.config['WTF_CSRF_SSL_STRICT'] = False
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+# Response compression (see compression.py); level trades CPU for bytes
+app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+app.config['COMPRESSION_LEVEL'] = int(os.environ.get('COMPRESSION_LEVEL', 6))
+app.config['COMPRESSION_BROTLI_QUALITY'] = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+app.config['COMPRESSION_MIN_SIZE'] = 500
+if app.config['COMPRESSION_ENABLED']:
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app,
+                                         level=app.config['COMPRESSION_LEVEL'],
+                                         brotli_quality=app.config['COMPRESSION_BROTLI_QUALITY'],
+                                         min_size=app.config['COMPRESSION_MIN_SIZE'])
+    app.extensions['compression'] = app.wsgi_app
+# Request metrics served at /metrics (see metrics.py); workers share totals through METRICS_FOLDER.
+# Outside compression so response sizes are as sent
+app.config['METRICS_FOLDER'] = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'metrics')
+app.config['METRICS_FLUSH_INTERVAL'] = 5
+# Bearer token for Prometheus scrapes; admins can also read /metrics with a session or access token
+app.config['METRICS_SCRAPE_TOKEN'] = os.environ.get('METRICS_SCRAPE_TOKEN')
+metrics.init_app(app)
+# x_for=1 so request.remote_addr is the client, not the proxy (used by rate limits)
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 
 # Ensure instance folder exists
 if not os.path.exists('instance'):
@@ -26,6 +47,74 @@ if not database_url:
     database_url = f"sqlite:///{db_path}"
 
 app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+
+# Chat attachment storage (kept out of the public static folder)
+app.config['ATTACHMENT_FOLDER'] = os.environ.get(
+    'ATTACHMENT_FOLDER',
+    os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'attachments')
+)
+app.config['MAX_ATTACHMENT_SIZE'] = 25 * 1024 * 1024
+# Let a fronting nginx/Apache serve files via X-Sendfile when configured
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+
+# Background jobs (report PDFs): 'thread' or 'process' executor per worker
+app.config['JOB_BACKEND'] = os.environ.get('JOB_BACKEND', 'thread')
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_POLL_INTERVAL'] = 15
+
+# PDF rendering backend: auto, pool, wkhtmltopdf or simple (see pdf_renderers.py)
+app.config['PDF_RENDERER'] = os.environ.get('PDF_RENDERER', 'auto')
+app.config['PDF_RENDERER_WORKERS'] = int(os.environ.get('PDF_RENDERER_WORKERS', 2))
+
+# Rendered PDFs keyed by content hash, evicted least-recently-used past the byte budget
+app.config['PDF_CACHE_FOLDER'] = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'pdf_cache')
+app.config['PDF_CACHE_MAX_BYTES'] = int(os.environ.get('PDF_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Report PDFs and recordings, served only through signed URLs (see downloads.py)
+app.config['PRIVATE_FILES_FOLDER'] = os.environ.get(
+    'PRIVATE_FILES_FOLDER',
+    os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'private')
+)
+app.config['DOWNLOAD_URL_TTL'] = 15 * 60
+
+# Public page cache: per-fragment version stamps shared by all workers (see page_cache.py)
+app.config['PAGE_CACHE_ENABLED'] = True
+app.config['CACHE_VERSION_FOLDER'] = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'cache_versions')
+
+# Typeahead search index, rebuilt per worker every SEARCH_INDEX_REFRESH seconds
+app.config['SEARCH_INDEX_ENABLED'] = True
+app.config['SEARCH_INDEX_REFRESH'] = 300
+
+# Compiled templates shared by all workers, and warm-up at startup (see template_cache.py)
+app.config['TEMPLATE_CACHE_FOLDER'] = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'template_cache')
+app.config['TEMPLATE_WARMUP'] = os.environ.get('TEMPLATE_WARMUP', '1') == '1'
+
+# Application cache for query results (see app_cache.py): 'local', 'redis' or 'null'
+app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'local')
+app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/1')
+app.config['CACHE_DEFAULT_TTL'] = 60
+app.config['CACHE_MAX_ENTRIES'] = 10000
+# Seconds a request waits for an identical one's computation before running its own
+app.config['CACHE_FLIGHT_TIMEOUT'] = 10
+
+# Seconds an authenticated user (with role profile) stays in the per-worker cache
+app.config['USER_CACHE_TTL'] = 30
+
+# Password hashing cost (Werkzeug method string) and the bounded hashing pool;
+# see calibrate_password_hashing.py
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_QUEUE'] = 16
+
+# Bearer tokens for API clients (see api_tokens.py)
+app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY')
+app.config['ACCESS_TOKEN_TTL'] = 10 * 60
+app.config['REFRESH_TOKEN_TTL'] = 30 * 24 * 3600
+
+# Rate limits (see ratelimit.py): 'memory' counts per worker, 'redis' shares counts across workers
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+app.config['RATELIMIT_BACKEND'] = os.environ.get('RATELIMIT_BACKEND', 'memory')
+app.config['RATELIMIT_REDIS_URL'] = os.environ.get('RATELIMIT_REDIS_URL', 'redis://localhost:6379/0')
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     'pool_pre_ping': True,
@@ -36,6 +125,23 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 db.init_app(app)
 login_manager.init_app(app)
 
+# Before assets.init_app, which creates the template environment
+import template_cache
+template_cache.init_app(app)
+
+# Fingerprinted, precompressed static files built by build_assets.py (see assets.py)
+import assets
+assets.init_app(app)
+
+# Statements slower than the threshold go to per-worker rotating logs (see slow_queries.py)
+app.config['SLOW_QUERY_ENABLED'] = os.environ.get('SLOW_QUERY_ENABLED', '1') == '1'
+app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+app.config['SLOW_QUERY_FOLDER'] = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'slow_queries')
+app.config['SLOW_QUERY_MAX_BYTES'] = 5 * 1024 * 1024
+app.config['SLOW_QUERY_BACKUPS'] = 3
+import slow_queries
+slow_queries.init_app(app)
+
 # Create tables
 with app.app_context():
     import models
@@ -45,5 +151,10 @@ with app.app_context():
 from auth import *
 from routes import *
 
+if app.config['TEMPLATE_WARMUP']:
+    # With a gunicorn --preload master, workers inherit the compiled templates
+    loaded, seconds, failed = template_cache.warm_templates(app)
+    logging.info(f"Warmed {loaded} templates in {seconds:.2f}s" + (f", {len(failed)} failed" if failed else ""))
+
 if __name__ == '__main__':
     app.run(debug=True)
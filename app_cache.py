@@ -0,0 +1,521 @@
+"""
+Application cache for query results, with tag-based invalidation
+
+    @memoize(ttl=300, tags=('doctor:{doctor_id}',))
+    def compute_slots(doctor_id, slot_date): ...
+
+    invalidate('doctor:7')               # after the change is committed
+    invalidate_after_commit('doctor:7')  # or once the session commits
+
+Every entry carries tags naming what it was built from ('doctor:<doctor
+info id>', 'user:<user id>'); write paths invalidate the tags they touch
+instead of tracking individual keys.
+
+Backends, chosen with CACHE_BACKEND:
+    'local'  per-process LRU with per-entry TTLs (default). Invalidations
+             only reach the worker that issues them; other workers
+             converge within the TTL, so keep TTLs short
+    'redis'  one cache shared by every worker, via CACHE_REDIS_URL
+    'null'   caching disabled
+
+Values must be picklable for 'redis' and are shared between requests,
+so memoized functions should return plain data or detached objects.
+
+Misses are coalesced: concurrent callers missing the same key in one
+process wait for a single loader call (single flight). With 'redis', the
+worker that takes a short lock on the key loads it and the others poll
+for the stored value. coalesce() shares work the same way for results
+that must not be cached past the computation itself.
+
+Metrics (hits, misses, loads, coalesced callers, evictions, ...) per key
+namespace: stats().
+"""
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from extensions import db
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 10000
+# Longest a caller waits for another one's computation before running its own
+DEFAULT_FLIGHT_TIMEOUT = 10
+# How long a coalesce() result stays readable for waiters in other workers
+COALESCE_RESULT_TTL = 5
+POLL_INTERVAL = 0.02
+MISSING = object()
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+
+
+class LocalBackend:
+    """Least-recently-used entries in this process, each with its own expiry"""
+
+    shared = False
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = defaultdict(set)  # tag -> keys
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = (self._clock() + ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags[tag].add(key)
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate(self, tags):
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if self._remove(key):
+                        removed += 1
+        return removed
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def info(self):
+        with self._lock:
+            return {'backend': 'local', 'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class RedisBackend:
+    """
+    Entries shared by all workers through Redis
+
+    Each tag is a Redis set of the keys carrying it. Tag sets live as long
+    as the longest TTL that joined them, so an invalidation always reaches
+    every live entry. Pass client= to use an existing (or fake) client.
+    """
+
+    shared = True
+
+    def __init__(self, url=None, client=None, prefix='cache:'):
+        if client is None:
+            if not REDIS_AVAILABLE:
+                raise RuntimeError("CACHE_BACKEND='redis' requires the redis package")
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._prefix = prefix
+
+    def _key(self, key):
+        return f"{self._prefix}k:{key}"
+
+    def _tag(self, tag):
+        return f"{self._prefix}t:{tag}"
+
+    def _lock(self, key):
+        return f"{self._prefix}l:{key}"
+
+    def acquire(self, key, timeout):
+        """Token if this worker now computes key, None if another one already does"""
+        token = f"{os.getpid()}:{threading.get_ident()}:{time.monotonic_ns()}"
+        if self._client.set(self._lock(key), token, nx=True, px=int(timeout * 1000)):
+            return token
+        return None
+
+    def release(self, key, token):
+        self._client.eval(_RELEASE_SCRIPT, 1, self._lock(key), token)
+
+    def is_locked(self, key):
+        return bool(self._client.exists(self._lock(key)))
+
+    def get(self, key):
+        data = self._client.get(self._key(key))
+        return MISSING if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl, tags=()):
+        ttl = max(1, int(ttl))
+        pipe = self._client.pipeline()
+        pipe.set(self._key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=ttl)
+        for tag in tags:
+            tag_key = self._tag(tag)
+            pipe.sadd(tag_key, key)
+            # Extend, never shorten, the tag set's lifetime
+            pipe.ttl(tag_key)
+        results = pipe.execute()
+        pipe = self._client.pipeline()
+        for tag, remaining in zip(tags, results[2::2]):
+            if remaining is None or remaining < ttl:
+                pipe.expire(self._tag(tag), ttl)
+        pipe.execute()
+
+    def delete(self, key):
+        self._client.delete(self._key(key))
+
+    def invalidate(self, tags):
+        removed = 0
+        for tag in tags:
+            tag_key = self._tag(tag)
+            pipe = self._client.pipeline()
+            pipe.smembers(tag_key)
+            pipe.delete(tag_key)
+            members, _ = pipe.execute()
+            if members:
+                removed += self._client.delete(*[self._key(m.decode() if isinstance(m, bytes) else m)
+                                                 for m in members])
+        return removed
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=f"{self._prefix}*"))
+        if keys:
+            self._client.delete(*keys)
+
+    def info(self):
+        stats = self._client.info('stats')
+        return {'backend': 'redis', 'evictions': stats.get('evicted_keys'),
+                'expirations': stats.get('expired_keys')}
+
+
+class NullBackend:
+
+    shared = False
+
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value, ttl, tags=()):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def invalidate(self, tags):
+        return 0
+
+    def clear(self):
+        pass
+
+    def info(self):
+        return {'backend': 'null'}
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Cache:
+    """
+    Front end over a backend, counting hits and misses per namespace
+
+    The namespace of a key is the part before its first ':'.
+    """
+
+    def __init__(self, backend, default_ttl=DEFAULT_TTL, flight_timeout=DEFAULT_FLIGHT_TIMEOUT):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.flight_timeout = flight_timeout
+        self._metrics = defaultdict(lambda: {'hits': 0, 'misses': 0, 'sets': 0, 'loads': 0, 'load_seconds': 0.0,
+                                             'coalesced': 0, 'coalesced_remote': 0, 'flight_timeouts': 0})
+        self._invalidations = 0
+        self._metrics_lock = threading.Lock()
+        self._flights = {}  # key -> _Flight being computed in this process
+        self._flights_lock = threading.Lock()
+
+    def _count(self, key, field, amount=1):
+        with self._metrics_lock:
+            self._metrics[key.split(':', 1)[0]][field] += amount
+
+    def get(self, key, default=None):
+        value = self.backend.get(key)
+        if value is MISSING:
+            self._count(key, 'misses')
+            return default
+        self._count(key, 'hits')
+        return value
+
+    def set(self, key, value, ttl=None, tags=()):
+        self.backend.set(key, value, self.default_ttl if ttl is None else ttl, tags)
+        self._count(key, 'sets')
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def get_or_set(self, key, loader, ttl=None, tags=()):
+        """
+        Cached value for key, calling loader() and storing its result on a miss
+
+        Concurrent misses on the same key share one loader() call.
+        """
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self._count(key, 'hits')
+            return value
+        self._count(key, 'misses')
+
+        def load():
+            # A flight that just landed may have stored the value already
+            value = self.backend.get(key)
+            if value is MISSING:
+                value = self._load(key, loader)
+                self.set(key, value, ttl, tags)
+            return value
+
+        return self._single_flight(key, lambda: self._shared_flight(key, key, load))
+
+    def coalesce(self, key, fn):
+        """
+        fn() shared by identical concurrent calls, without caching the result
+
+        Callers arriving while a call for key is running get its result;
+        later callers run fn() again.
+        """
+        result_key = f"{key}#flight"
+
+        def run():
+            value = self._load(key, fn)
+            if self.backend.shared:
+                # Read by the workers waiting on this flight
+                self.backend.set(result_key, value, COALESCE_RESULT_TTL)
+            return value
+
+        def run_shared():
+            if self.backend.shared:
+                self.backend.delete(result_key)
+            return run()
+
+        return self._single_flight(key, lambda: self._shared_flight(key, result_key, run_shared))
+
+    def _load(self, key, loader):
+        started = time.perf_counter()
+        value = loader()
+        self._count(key, 'loads')
+        self._count(key, 'load_seconds', time.perf_counter() - started)
+        return value
+
+    def _single_flight(self, key, fn):
+        """fn() once for all threads of this process asking for key at the same time"""
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if not flight.done.wait(self.flight_timeout):
+                self._count(key, 'flight_timeouts')
+                return fn()
+            self._count(key, 'coalesced')
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = fn()
+            return flight.value
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _shared_flight(self, key, result_key, compute):
+        """
+        With a shared backend, compute() in one worker while the others wait
+
+        compute() stores its result at result_key. Waiters poll for it until
+        it appears, the computing worker gives up its lock, or flight_timeout
+        passes; then they compute it themselves.
+        """
+        if not self.backend.shared:
+            return compute()
+        token = self.backend.acquire(key, self.flight_timeout)
+        if token is not None:
+            try:
+                return compute()
+            finally:
+                self.backend.release(key, token)
+
+        deadline = time.monotonic() + self.flight_timeout
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            value = self.backend.get(result_key)
+            if value is not MISSING:
+                self._count(key, 'coalesced_remote')
+                return value
+            if not self.backend.is_locked(key):
+                break
+        self._count(key, 'flight_timeouts')
+        return compute()
+
+    def invalidate(self, *tags):
+        """Drop every entry carrying any of the tags; returns how many were removed"""
+        removed = self.backend.invalidate(tags)
+        with self._metrics_lock:
+            self._invalidations += removed
+        return removed
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._metrics_lock:
+            namespaces = {name: dict(values) for name, values in self._metrics.items()}
+            invalidations = self._invalidations
+        for values in namespaces.values():
+            lookups = values['hits'] + values['misses']
+            values['hit_ratio'] = round(values['hits'] / lookups, 3) if lookups else None
+            # Loader calls saved by waiting on another caller's computation
+            values['deduplicated'] = values['coalesced'] + values['coalesced_remote']
+        return dict(self.backend.info(), invalidations=invalidations, namespaces=namespaces)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def create_cache(config):
+    backend_name = config.get('CACHE_BACKEND', 'local')
+    if backend_name == 'redis':
+        backend = RedisBackend(config['CACHE_REDIS_URL'])
+    elif backend_name == 'null':
+        backend = NullBackend()
+    else:
+        backend = LocalBackend(config.get('CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+    return Cache(backend, config.get('CACHE_DEFAULT_TTL', DEFAULT_TTL),
+                 config.get('CACHE_FLIGHT_TIMEOUT', DEFAULT_FLIGHT_TIMEOUT))
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = create_cache(current_app.config)
+        return _cache
+
+
+def invalidate(*tags):
+    """Invalidate tags in the application cache; a no-op outside an app context"""
+    if has_app_context():
+        return get_cache().invalidate(*tags)
+    return 0
+
+
+def coalesce(key, fn):
+    """Share fn() among identical concurrent calls (see Cache.coalesce)"""
+    return get_cache().coalesce(key, fn)
+
+
+def _key_part(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return repr(value)
+
+
+def memoize(ttl=None, tags=(), namespace=None):
+    """
+    Cache a function's result per argument values
+
+    Args:
+        ttl: Seconds to keep a result (CACHE_DEFAULT_TTL if None)
+        tags: Tag templates formatted with the call's arguments,
+              e.g. 'doctor:{doctor_id}'
+        namespace: Key prefix and metrics bucket (module.function by default)
+
+    The undecorated function stays available as .uncached.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        name = namespace or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = ','.join(_key_part(value) for value in bound.arguments.values())
+            if len(arguments) > 200:
+                arguments = hashlib.sha1(arguments.encode('utf-8')).hexdigest()
+            entry_tags = [tag.format(**bound.arguments) for tag in tags]
+            return get_cache().get_or_set(f"{name}:{arguments}", lambda: func(*args, **kwargs), ttl, entry_tags)
+
+        wrapped.uncached = func
+        return wrapped
+    return decorator
+
+
+# Invalidate once the writing transaction commits, so no reader can refill
+# an entry from data that is about to change
+
+def invalidate_after_commit(*tags, session=None):
+    session = session or db.session()
+    session.info.setdefault('app_cache_tags', set()).update(tags)
+
+
+def _after_commit(session):
+    tags = session.info.pop('app_cache_tags', None)
+    if tags:
+        invalidate(*tags)
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop('app_cache_tags', None)
+
+
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_soft_rollback', _after_rollback)
@@ -0,0 +1,122 @@
+"""
+Fingerprinted static assets with precompressed variants
+
+`python build_assets.py` copies every file under the static folder to
+static/dist/ with its content hash in the name (css/site.css ->
+css/site.3f2a9c1d04be.css), writes .gz (and .br when the brotli package
+is installed) next to compressible ones, and records the mapping in
+static/dist/manifest.json.
+
+At runtime:
+    - url_for('static', filename=...) and the asset_url() template helper
+      emit the fingerprinted path whenever the manifest knows the file
+    - fingerprinted paths are served with a one-year immutable
+      Cache-Control, picking the .br / .gz variant the client accepts
+    - anything else falls through to Flask's normal static handler
+"""
+import json
+import mimetypes
+import os
+import threading
+
+from flask import current_app, request, send_from_directory, url_for
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Tried in order of preference against Accept-Encoding
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_manifest = None  # (mtime, {source path: fingerprinted path}, {fingerprinted path: source path})
+_lock = threading.Lock()
+
+
+def manifest_path(static_folder):
+    return os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+
+
+def get_manifest():
+    """
+    Current manifest as (source -> fingerprinted, fingerprinted -> source)
+
+    Reloaded when build_assets.py rewrites it; empty if it was never built.
+    """
+    global _manifest
+    path = manifest_path(current_app.static_folder)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}, {}
+    with _lock:
+        if _manifest is None or _manifest[0] != mtime:
+            with open(path, encoding='utf-8') as f:
+                files = json.load(f)['files']
+            _manifest = (mtime, files, {fingerprinted: source for source, fingerprinted in files.items()})
+        return _manifest[1], _manifest[2]
+
+
+def asset_url(path):
+    """
+    URL for a static asset, fingerprinted when built
+
+    Accepts a path inside the static folder ('css/site.css') or a stored
+    '/static/...' URL such as a doctor's profile_photo; other URLs are
+    returned unchanged.
+    """
+    if not path:
+        return path
+    static_prefix = current_app.static_url_path.rstrip('/') + '/'
+    if path.startswith(static_prefix):
+        path = path[len(static_prefix):]
+    elif '://' in path or path.startswith('/'):
+        return path
+    return url_for('static', filename=path)
+
+
+def _fingerprint_static_urls(endpoint, values):
+    if endpoint != 'static' or 'filename' not in values:
+        return
+    files, _ = get_manifest()
+    fingerprinted = files.get(values['filename'])
+    if fingerprinted is not None:
+        values['filename'] = f"{DIST_DIR}/{fingerprinted}"
+
+
+def serve_static(filename):
+    """Static view: fingerprinted files get immutable caching and precompressed variants"""
+    prefix = DIST_DIR + '/'
+    if filename.startswith(prefix):
+        _, sources = get_manifest()
+        source = sources.get(filename[len(prefix):])
+        if source is not None:
+            return _send_fingerprinted(filename, source)
+    return current_app.send_static_file(filename)
+
+
+def _send_fingerprinted(filename, source):
+    static_folder = current_app.static_folder
+    mimetype = mimetypes.guess_type(source)[0] or 'application/octet-stream'
+    for encoding, suffix in ENCODINGS:
+        variant = filename + suffix
+        # A listed encoding can still be refused with q=0
+        if request.accept_encodings[encoding] > 0 and os.path.exists(os.path.join(static_folder, variant)):
+            # Same policy as compression.py: ranges of an encoded body are not
+            # offered, so Range is ignored and the whole variant is sent
+            response = send_from_directory(static_folder, variant, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE, conditional=False)
+            response = response.make_conditional(request, accept_ranges=False)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(static_folder, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    app.url_defaults(_fingerprint_static_urls)
+    app.add_template_global(asset_url)
+    if 'static' in app.view_functions:
+        app.view_functions['static'] = serve_static
@@ -0,0 +1,80 @@
+"""
+Content-addressed storage for chat attachments
+
+Blobs are written under their SHA-256 digest, so the same file sent twice
+is stored once. Uploads are copied to disk in fixed-size chunks and never
+held in memory as a whole.
+"""
+import hashlib
+import os
+import tempfile
+
+from flask import current_app
+
+CHUNK_SIZE = 64 * 1024
+# Only raster images are shown inline; anything else (SVG and HTML can carry
+# script) is always downloaded
+INLINE_CONTENT_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+def get_storage_root():
+    """Directory that holds attachment blobs (outside the public static folder)"""
+    root = current_app.config['ATTACHMENT_FOLDER']
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def blob_path(sha256):
+    """Path of a blob, fanned out over two directory levels to keep directories small"""
+    return os.path.join(get_storage_root(), sha256[:2], sha256[2:4], sha256)
+
+
+def store_stream(stream, max_size=None):
+    """
+    Copy a readable stream into the blob store
+
+    Args:
+        stream: File-like object with read(size)
+        max_size: Optional upper bound in bytes
+
+    Returns:
+        Tuple of (sha256 hex digest, size in bytes)
+
+    Raises:
+        AttachmentTooLarge: If the stream exceeds max_size
+    """
+    root = get_storage_root()
+    digest = hashlib.sha256()
+    size = 0
+
+    # Write to a temp file in the same filesystem so the final move is atomic
+    fd, tmp_path = tempfile.mkstemp(dir=root, prefix='upload-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise AttachmentTooLarge(f"Attachment exceeds {max_size} bytes")
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        sha256 = digest.hexdigest()
+        final_path = blob_path(sha256)
+        if os.path.exists(final_path):
+            # Already stored: keep the existing blob
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+        return sha256, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
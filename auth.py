@@ -1,4 +1,4 @@
-from flask import request, redirect, url_for, flash, render_template
+from flask import request, redirect, url_for, flash, render_template, jsonify
 from flask_login import login_user, logout_user, current_user, login_required
 from werkzeug.security import generate_password_hash
 from datetime import datetime
@@ -6,9 +6,42 @@ from datetime import datetime
 from app import app, db
 from models import User, DoctorInfo, PatientInfo
 from forms import LoginForm, PatientRegistrationForm, DoctorRegistrationForm
+from passwords import PasswordHasherBusy
+from user_cache import invalidate_user
+from ratelimit import rate_limit
+from api_tokens import issue_token_pair, use_refresh_token, revoke_refresh_token
+
+
+def login_email():
+    """Rate limit key for login attempts against one account, whatever the source IP"""
+    email = _request_data().get('email', '').strip().lower()
+    return email or None
+
+
+def _request_data():
+    """Form fields, or the JSON body sent by API clients"""
+    if request.is_json:
+        data = request.get_json(silent=True)
+        return data if isinstance(data, dict) else {}
+    return request.form
+
+
+def upgrade_password_hash(user, password):
+    """Re-hash a verified password with the configured parameters (skipped while hashing is saturated)"""
+    if not user.password_needs_rehash():
+        return
+    try:
+        user.set_password(password)
+    except PasswordHasherBusy:
+        # The next sign-in upgrades it
+        return
+    db.session.commit()
+    invalidate_user(user.id)
 
 
 @app.route('/login', methods=['GET', 'POST'])
+@rate_limit('10/minute', key='ip', methods=['POST'])
+@rate_limit('5/minute', key=login_email, methods=['POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
@@ -16,7 +49,16 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('We are handling a lot of sign-ins right now. Please try again in a moment.', 'warning')
+            return render_template('login.html', title='Login', form=form), 503
+        
+        if valid:
+            # Upgrade (or downgrade) the stored hash to the configured parameters
+            upgrade_password_hash(user, form.password.data)
+            
             login_user(user, remember=form.remember.data)
             next_page = request.args.get('next')
             if not next_page or not next_page.startswith('/'):
@@ -28,6 +70,64 @@ def login():
     return render_template('login.html', title='Login', form=form)
 
 
+@app.route('/api/auth/token', methods=['POST'])
+@rate_limit('10/minute', key='ip', as_json=True)
+@rate_limit('5/minute', key=login_email, as_json=True)
+def api_token():
+    data = _request_data()
+    email = data.get('email')
+    password = data.get('password')
+    if not email or not password:
+        return jsonify({'error': 'Missing email or password'}), 400
+    
+    user = User.query.filter_by(email=email).first()
+    try:
+        valid = user is not None and user.check_password(password)
+    except PasswordHasherBusy:
+        return jsonify({'error': 'Too many sign-ins in progress, try again shortly'}), 503
+    
+    if not valid:
+        return jsonify({'error': 'Invalid email or password'}), 401
+    if not user.is_active:
+        return jsonify({'error': 'Account is blocked'}), 403
+    
+    # API-only clients never use the login form: upgrade legacy hashes here too
+    upgrade_password_hash(user, password)
+    
+    tokens = issue_token_pair(user)
+    db.session.commit()
+    return jsonify(tokens)
+
+
+@app.route('/api/auth/refresh', methods=['POST'])
+@rate_limit('30/minute', key='ip', as_json=True)
+def api_refresh_token():
+    refresh_token = _request_data().get('refresh_token')
+    if not refresh_token:
+        return jsonify({'error': 'Missing refresh token'}), 400
+    
+    user = use_refresh_token(refresh_token)
+    if user is None:
+        db.session.rollback()
+        return jsonify({'error': 'Invalid or revoked refresh token'}), 401
+    
+    # The used token was revoked; hand out a fresh pair
+    tokens = issue_token_pair(user)
+    db.session.commit()
+    return jsonify(tokens)
+
+
+@app.route('/api/auth/revoke', methods=['POST'])
+def api_revoke_token():
+    refresh_token = _request_data().get('refresh_token')
+    if not refresh_token:
+        return jsonify({'error': 'Missing refresh token'}), 400
+    
+    revoke_refresh_token(refresh_token)
+    db.session.commit()
+    return jsonify({'success': True})
+
+
 @app.route('/logout')
 def logout():
     logout_user()
@@ -35,6 +135,7 @@ def logout():
 
 
 @app.route('/register/patient', methods=['GET', 'POST'])
+@rate_limit('5/hour', key='ip', methods=['POST'])
 def register_patient():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
@@ -48,7 +149,13 @@ def register_patient():
             last_name=form.last_name.data,
             role='patient'
         )
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('We are handling a lot of sign-ups right now. Please try again in a moment.', 'warning')
+            today = datetime.now().date().strftime('%Y-%m-%d')
+            return render_template('register.html', title='Register as Patient', form=form,
+                                   user_type='patient', today=today), 503
         db.session.add(user)
         db.session.flush()  # Get user ID before committing
         
@@ -69,6 +176,7 @@ def register_patient():
 
 
 @app.route('/register/doctor', methods=['GET', 'POST'])
+@rate_limit('5/hour', key='ip', methods=['POST'])
 def register_doctor():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
@@ -82,7 +190,13 @@ def register_doctor():
             last_name=form.last_name.data,
             role='doctor'
         )
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('We are handling a lot of sign-ups right now. Please try again in a moment.', 'warning')
+            today = datetime.now().date().strftime('%Y-%m-%d')
+            return render_template('register.html', title='Register as Doctor', form=form,
+                                   user_type='doctor', today=today), 503
         db.session.add(user)
         db.session.flush()  # Get user ID before committing
         
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for hot read paths
+
+Runs against a throwaway SQLite database so it never touches real data:
+
+    python benchmarks.py chat_messages --messages 10000
+    python benchmarks.py pdf_renderers --reports 50
+    python benchmarks.py user_loader --requests 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+
+# Point the app at a scratch database before it is imported
+_bench_dir = tempfile.mkdtemp(prefix='psychcare_bench_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_bench_dir, 'bench.db')}"
+
+import logging
+from app import app, db
+from models import User, DoctorInfo, PatientInfo, ChatConversation, ChatMessage, format_full_name
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def measure(label, func, repeat=5):
+    """Run func a few times and print best wall time and peak allocation"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<28} best {min(timings) * 1000:8.1f} ms   peak {peak / 1024 / 1024:7.2f} MiB")
+    return result
+
+
+def create_user(role, username):
+    user = User()
+    user.username = username
+    user.email = f"{username}@example.com"
+    user.role = role
+    user.first_name = username.title()
+    user.last_name = 'Bench'
+    user.password_hash = 'x'
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def bench_chat_messages(args):
+    """Compare ORM hydration with column projection for a large conversation"""
+    from routes import get_chat_message_rows
+
+    doctor = create_user('doctor', 'bench_doctor')
+    patient = create_user('patient', 'bench_patient')
+
+    doctor_info = DoctorInfo()
+    doctor_info.user_id = doctor.id
+    doctor_info.specialization = 'Clinical Psychology'
+    patient_info = PatientInfo()
+    patient_info.user_id = patient.id
+    db.session.add_all([doctor_info, patient_info])
+    db.session.flush()
+
+    conversation = ChatConversation()
+    conversation.patient_id = patient_info.id
+    conversation.doctor_id = doctor_info.id
+    db.session.add(conversation)
+    db.session.flush()
+
+    db.session.execute(ChatMessage.__table__.insert(), [
+        {
+            'conversation_id': conversation.id,
+            'sender_id': patient.id if i % 2 else doctor.id,
+            'message_text': f"Benchmark message number {i} with a little body text",
+            'is_read': False,
+            'message_type': 'text',
+        }
+        for i in range(args.messages)
+    ])
+    db.session.commit()
+    conversation_id = conversation.id
+
+    def orm_entities():
+        db.session.expunge_all()
+        messages = ChatMessage.query.filter_by(conversation_id=conversation_id).order_by(ChatMessage.created_at).all()
+        return [{
+            'id': message.id,
+            'sender_name': message.sender.get_full_name(),
+            'sender_id': message.sender_id,
+            'message_text': message.message_text,
+            'created_at': message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        } for message in messages]
+
+    def column_projection():
+        db.session.expunge_all()
+        return [{
+            'id': message_id,
+            'sender_name': format_full_name(first_name, last_name, username),
+            'sender_id': sender_id,
+            'message_text': message_text,
+            'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        } for message_id, sender_id, message_text, created_at, _, _, first_name, last_name, username
+            in get_chat_message_rows(conversation_id)]
+
+    print(f"Chat messages: {args.messages} rows")
+    before = measure('ORM entities', orm_entities)
+    after = measure('column projection', column_projection)
+    assert before == after, 'projection output differs from ORM output'
+
+
+def bench_pdf_renderers(args):
+    """Reports per second for each PDF renderer backend"""
+    from pdf_renderers import (WkhtmltopdfRenderer, SimplePdfRenderer, RendererPool,
+                               wkhtmltopdf_installed)
+    from utils import build_report_html
+
+    doctor = SimpleNamespace(get_full_name=lambda: 'Jane Bench',
+                             doctor_info=SimpleNamespace(specialization='Clinical Psychology'))
+    patient = SimpleNamespace(get_full_name=lambda: 'John Patient', email='patient@example.com')
+    report = SimpleNamespace(
+        id=1,
+        report_date=datetime(2025, 1, 1),
+        diagnosis='Generalised anxiety with intermittent sleep disturbance. ' * 8,
+        treatment_plan='Weekly CBT sessions for eight weeks, sleep hygiene plan. ' * 8,
+        recommendations='Daily breathing exercises and a mood journal. ' * 8,
+        next_appointment=None
+    )
+    html = build_report_html(report, patient, doctor)
+
+    backends = []
+    if wkhtmltopdf_installed():
+        backends.append(('wkhtmltopdf (spawn per call)', WkhtmltopdfRenderer))
+        backends.append(('pool[wkhtmltopdf]', lambda: RendererPool('wkhtmltopdf', size=args.concurrency)))
+    else:
+        print("wkhtmltopdf not found; skipping wkhtmltopdf backends")
+    backends.append(('pool[simple]', lambda: RendererPool('simple', size=args.concurrency)))
+    backends.append(('simple (in process)', SimplePdfRenderer))
+
+    print(f"PDF renderers: {args.reports} reports, concurrency {args.concurrency}")
+    for label, factory in backends:
+        renderer = factory()
+        try:
+            renderer.render(html)  # warm up
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                list(executor.map(lambda _: renderer.render(html), range(args.reports)))
+            elapsed = time.perf_counter() - start
+        finally:
+            renderer.close()
+        print(f"{label:<28} {args.reports / elapsed:8.1f} reports/s")
+
+
+def bench_user_loader(args):
+    """Queries per request spent loading current_user and its role profile"""
+    from sqlalchemy import event
+    from models import load_user
+    import user_cache
+
+    patient = create_user('patient', 'loader_patient')
+    patient_info = PatientInfo()
+    patient_info.user_id = patient.id
+    db.session.add(patient_info)
+    db.session.commit()
+    user_id = str(patient.id)
+
+    statements = [0]
+
+    def count(*_):
+        statements[0] += 1
+
+    def legacy_loader(uid):
+        # Behaviour before the cached loader: PK get, then a lazy profile query
+        user = db.session.get(User, int(uid))
+        user.patient_info
+        return user
+
+    def cached_loader(uid):
+        user = load_user(uid)
+        user.patient_info
+        return user
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        print(f"User loader: {args.requests} requests")
+        for label, loader in [('PK get + lazy profile', legacy_loader), ('cached joined loader', cached_loader)]:
+            user_cache.clear()
+            statements[0] = 0
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                with app.test_request_context():
+                    loader(user_id)
+                # Request teardown: each request starts with an empty session
+                db.session.remove()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<28} {statements[0] / args.requests:5.2f} queries/request   "
+                  f"{elapsed / args.requests * 1e6:8.1f} us/request")
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+
+BENCHMARKS = {
+    'chat_messages': bench_chat_messages,
+    'pdf_renderers': bench_pdf_renderers,
+    'user_loader': bench_user_loader,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--messages', type=int, default=10000, help='messages in the chat benchmark conversation')
+    parser.add_argument('--reports', type=int, default=50, help='reports rendered per PDF backend')
+    parser.add_argument('--concurrency', type=int, default=2, help='concurrent renders / pool size')
+    parser.add_argument('--requests', type=int, default=1000, help='simulated requests for the user loader benchmark')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
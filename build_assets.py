@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Fingerprint and precompress static assets (see assets.py)
+
+    python build_assets.py            # build static/dist and its manifest
+    python build_assets.py --clean    # also delete outdated fingerprinted files
+
+Run on every deploy after the static files change. Brotli variants are
+produced when the brotli package is installed; gzip always.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from app import app
+from assets import DIST_DIR, MANIFEST_NAME, manifest_path
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Already-compressed formats gain nothing from another pass
+COMPRESSIBLE = {'.css', '.js', '.svg', '.html', '.json', '.txt', '.xml', '.map', '.ico', '.ttf', '.otf', '.eot'}
+MIN_COMPRESS_SIZE = 256
+HASH_LENGTH = 12
+
+
+def fingerprinted_name(path, digest):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def source_files(static_folder):
+    dist = os.path.join(static_folder, DIST_DIR)
+    for directory, subdirs, files in os.walk(static_folder):
+        if os.path.abspath(directory).startswith(os.path.abspath(dist)):
+            continue
+        subdirs.sort()
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            full_path = os.path.join(directory, name)
+            yield os.path.relpath(full_path, static_folder).replace(os.sep, '/'), full_path
+
+
+def write_variant(path, data):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def build(static_folder, level, clean):
+    started = time.perf_counter()
+    dist = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+
+    files = {}
+    totals = {'files': 0, 'bytes': 0, 'gzip': 0, 'br': 0}
+    for relative, full_path in source_files(static_folder):
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        target_name = fingerprinted_name(relative, hashlib.sha256(data).hexdigest())
+        target = os.path.join(dist, target_name)
+        files[relative] = target_name
+        totals['files'] += 1
+        totals['bytes'] += len(data)
+
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(full_path, target)
+
+        if os.path.splitext(relative)[1].lower() not in COMPRESSIBLE or len(data) < MIN_COMPRESS_SIZE:
+            continue
+        # Content-addressed names: existing variants are already correct
+        if not os.path.exists(target + '.gz'):
+            write_variant(target + '.gz', gzip.compress(data, compresslevel=level, mtime=0))
+        totals['gzip'] += os.path.getsize(target + '.gz')
+        if BROTLI_AVAILABLE:
+            if not os.path.exists(target + '.br'):
+                write_variant(target + '.br', brotli.compress(data, quality=11))
+            totals['br'] += os.path.getsize(target + '.br')
+
+    write_variant(manifest_path(static_folder),
+                  json.dumps({'files': files, 'built_at': int(time.time())}, indent=2, sort_keys=True).encode('utf-8'))
+
+    if clean:
+        keep = set(files.values()) | {MANIFEST_NAME}
+        for directory, _, names in os.walk(dist):
+            for name in names:
+                relative = os.path.relpath(os.path.join(directory, name), dist).replace(os.sep, '/')
+                base = relative[:-3] if relative.endswith(('.gz', '.br')) else relative
+                if base not in keep:
+                    os.remove(os.path.join(directory, name))
+
+    elapsed = time.perf_counter() - started
+    print(f"Fingerprinted {totals['files']} files ({totals['bytes'] / 1024:.1f} KiB) in {elapsed:.2f}s")
+    print(f"  gzip variants   {totals['gzip'] / 1024:.1f} KiB")
+    if BROTLI_AVAILABLE:
+        print(f"  brotli variants {totals['br'] / 1024:.1f} KiB")
+    else:
+        print("  brotli variants skipped (pip install brotli)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fingerprint and precompress static assets')
+    parser.add_argument('--level', type=int, default=9, help='gzip compression level')
+    parser.add_argument('--clean', action='store_true', help='Remove fingerprinted files no longer in the manifest')
+    args = parser.parse_args()
+    build(app.static_folder, args.level, args.clean)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Bulk insert helpers for import and data-generation scripts
+
+Rows are plain dicts keyed by column name. On PostgreSQL (psycopg2) they
+are streamed with COPY; elsewhere they go through a single executemany.
+Either way they join the session's current transaction.
+"""
+import csv
+import io
+
+from sqlalchemy import insert, select
+
+from extensions import db
+
+COPY_CHUNK_ROWS = 10000
+
+
+def uses_copy(connection):
+    return connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+
+
+def _fill_defaults(table, rows):
+    """Apply Python-side column defaults, which COPY would otherwise skip"""
+    defaults = {}
+    for column in table.columns:
+        if column.default is None or column.primary_key:
+            continue
+        if column.default.is_scalar:
+            defaults[column.name] = column.default.arg
+        elif column.default.is_callable:
+            defaults[column.name] = column.default.arg(None)
+    # Callers that supply every column skip the per-row copy
+    missing = {name: value for name, value in defaults.items() if name not in rows[0]}
+    if not missing:
+        return rows
+    return [dict(missing, **row) for row in rows]
+
+
+def _copy_rows(connection, table, rows):
+    columns = list(rows[0].keys())
+    sql = f'COPY "{table.name}" ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+    cursor = connection.connection.cursor()
+    try:
+        for start in range(0, len(rows), COPY_CHUNK_ROWS):
+            buffer = io.StringIO()
+            # Quoting every string keeps '' distinct from NULL (an empty field)
+            writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+            for row in rows[start:start + COPY_CHUNK_ROWS]:
+                writer.writerow([row[column] for column in columns])
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+def bulk_insert(table, rows):
+    """
+    Insert many rows into a table in the current transaction
+
+    Args:
+        table: Table object or model class
+        rows: List of dicts with the same keys
+    """
+    if not rows:
+        return
+    table = getattr(table, '__table__', table)
+    connection = db.session.connection()
+    rows = _fill_defaults(table, rows)
+    if uses_copy(connection):
+        _copy_rows(connection, table, rows)
+    else:
+        connection.execute(insert(table), rows)
+
+
+def bulk_insert_returning_ids(table, rows, key):
+    """
+    Insert rows and map each row's unique key column to its new id
+
+    Returns:
+        Dict of key value -> id
+    """
+    if not rows:
+        return {}
+    table = getattr(table, '__table__', table)
+    bulk_insert(table, rows)
+    key_column = table.c[key]
+    values = [row[key] for row in rows]
+    return dict(db.session.connection().execute(
+        select(key_column, table.c.id).where(key_column.in_(values))
+    ).all())
+
+
+def next_id(table):
+    """First free id, for callers that assign ids themselves"""
+    table = getattr(table, '__table__', table)
+    return (db.session.connection().execute(select(db.func.max(table.c.id))).scalar() or 0) + 1
+
+
+def sync_id_sequence(table):
+    """Move a PostgreSQL id sequence past ids that were inserted explicitly"""
+    table = getattr(table, '__table__', table)
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        return
+    connection.exec_driver_sql(
+        f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+        f"COALESCE((SELECT MAX(id) FROM \"{table.name}\"), 1))"
+    )
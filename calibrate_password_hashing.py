@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Pick password hashing parameters for a target latency on this host
+
+    python calibrate_password_hashing.py --target-ms 250
+    python calibrate_password_hashing.py --algorithm pbkdf2 --target-ms 150
+
+Prints the strongest setting that stays under the target; export it as
+PASSWORD_HASH_METHOD. Existing hashes are migrated on each user's next login.
+"""
+import argparse
+import time
+
+from werkzeug.security import generate_password_hash
+
+def time_method(method, rounds):
+    """Median seconds per hash for a method string"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        generate_password_hash('calibration-password', method=method)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+def candidates(algorithm):
+    if algorithm == 'scrypt':
+        # Memory cost doubles each step: 2 MiB .. 128 MiB with r=8
+        for exponent in range(11, 18):
+            yield f"scrypt:{2 ** exponent}:8:1"
+    else:
+        for iterations in (100000, 200000, 400000, 600000, 800000, 1000000, 1500000, 2000000):
+            yield f"pbkdf2:sha256:{iterations}"
+
+def calibrate(algorithm, target_ms, rounds):
+    chosen = None
+    for method in candidates(algorithm):
+        elapsed_ms = time_method(method, rounds) * 1000
+        print(f"{method:<24} {elapsed_ms:8.1f} ms")
+        if elapsed_ms > target_ms:
+            break
+        chosen = method
+    return chosen
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate password hashing cost')
+    parser.add_argument('--algorithm', choices=['scrypt', 'pbkdf2'], default='scrypt')
+    parser.add_argument('--target-ms', type=float, default=250, help='maximum time per hash')
+    parser.add_argument('--rounds', type=int, default=5, help='hashes timed per candidate')
+    args = parser.parse_args()
+
+    chosen = calibrate(args.algorithm, args.target_ms, args.rounds)
+    if chosen is None:
+        print(f"Even the cheapest {args.algorithm} setting exceeds {args.target_ms} ms on this host")
+        return
+    print(f"\nRecommended: PASSWORD_HASH_METHOD={chosen}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+WSGI middleware compressing text responses with gzip or brotli
+
+Wraps the Flask WSGI app (see app.py) and compresses each chunk as the
+app yields it, so streamed responses (chat history, exports of JSON or
+CSV) are never buffered whole. Streamed bodies are flushed per chunk so
+the client keeps receiving data as it is produced.
+
+Skipped:
+    - HEAD requests and statuses without a full body (204, 206, 304, ...)
+    - responses that already carry a Content-Encoding, such as the
+      precompressed static files from assets.py
+    - content types outside COMPRESSIBLE_TYPES (PDFs, images, zips)
+    - bodies with a Content-Length under min_size
+    - Cache-Control: no-transform
+
+Strong ETags become weak ones on compressed responses, as the encoded
+bytes differ from the identity representation, and Accept-Ranges is
+dropped so clients do not resume them with byte ranges. Per route it records
+bytes in / out and the CPU time spent compressing (stats()).
+"""
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript', 'text/xml',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+NO_BODY_STATUSES = {204, 206, 304}
+
+
+class _GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level):
+        # wbits 31: zlib stream with a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Args:
+        app: WSGI application to wrap
+        level: gzip level (1-9)
+        brotli_quality: brotli quality (0-11); used only if brotli is installed
+        min_size: Responses with a smaller Content-Length are sent as is
+    """
+
+    def __init__(self, app, level=6, brotli_quality=4, min_size=500):
+        self.app = app
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
+        self._stats = defaultdict(lambda: {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0})
+        self._stats_lock = threading.Lock()
+
+    def _choose_encoding(self, environ):
+        offered = set()
+        for item in environ.get('HTTP_ACCEPT_ENCODING', '').lower().split(','):
+            name, _, params = item.partition(';')
+            quality = params.strip()
+            try:
+                if quality.startswith('q=') and float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+            offered.add(name.strip())
+        if BROTLI_AVAILABLE and 'br' in offered:
+            return _BrotliEncoder(self.brotli_quality)
+        if 'gzip' in offered:
+            return _GzipEncoder(self.level)
+        return None
+
+    def _should_compress(self, environ, status, headers):
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return False
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in NO_BODY_STATUSES:
+            return False
+        values = {name.lower(): value for name, value in headers}
+        if 'content-encoding' in values:
+            return False
+        if values.get('content-type', '').split(';', 1)[0].strip().lower() not in COMPRESSIBLE_TYPES:
+            return False
+        if 'no-transform' in values.get('cache-control', '').lower():
+            return False
+        length = values.get('content-length')
+        if length is not None and length.isdigit() and int(length) < self.min_size:
+            return False
+        return True
+
+    def __call__(self, environ, start_response):
+        encoder = self._choose_encoding(environ)
+        if encoder is None:
+            return self.app(environ, start_response)
+
+        state = {'encoder': None, 'streaming': True, 'route': None}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            if self._should_compress(environ, status, headers):
+                state['encoder'] = encoder
+                state['route'] = _route_of(environ)
+                state['streaming'] = not any(name.lower() == 'content-length' for name, _ in headers)
+                headers = _compressed_headers(headers, encoder.name)
+            else:
+                headers = _with_vary(headers) if _is_negotiable(headers) else headers
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, compressing_start_response)
+        if state['encoder'] is None:
+            return app_iter
+        return self._compress(app_iter, state['encoder'], state['streaming'], state['route'])
+
+    def _compress(self, app_iter, encoder, streaming, route):
+        bytes_in = bytes_out = 0
+        cpu = 0.0
+        try:
+            for chunk in app_iter:
+                if not chunk:
+                    continue
+                started = time.thread_time()
+                output = encoder.compress(chunk)
+                if streaming:
+                    output += encoder.flush()
+                cpu += time.thread_time() - started
+                bytes_in += len(chunk)
+                bytes_out += len(output)
+                if output:
+                    yield output
+            started = time.thread_time()
+            output = encoder.finish()
+            cpu += time.thread_time() - started
+            bytes_out += len(output)
+            yield output
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+            self._record(route, bytes_in, bytes_out, cpu)
+
+    def _record(self, route, bytes_in, bytes_out, cpu):
+        with self._stats_lock:
+            stats = self._stats[route]
+            stats['responses'] += 1
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+            stats['cpu_seconds'] += cpu
+
+    def stats(self):
+        """Per-route compression totals, largest savings first"""
+        with self._stats_lock:
+            rows = [dict(route=route, **values) for route, values in self._stats.items()]
+        for row in rows:
+            row['bytes_saved'] = row['bytes_in'] - row['bytes_out']
+            row['ratio'] = round(row['bytes_out'] / row['bytes_in'], 3) if row['bytes_in'] else None
+            # Bytes saved per millisecond of CPU: low values are not worth compressing
+            row['saved_per_cpu_ms'] = round(row['bytes_saved'] / (row['cpu_seconds'] * 1000)) if row['cpu_seconds'] else None
+        return sorted(rows, key=lambda row: row['bytes_saved'], reverse=True)
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+
+def _route_of(environ):
+    # Flask's request object registers itself in the environ until its
+    # context is popped, so this must run from start_response. The matched
+    # rule groups /doctor/7/... and /doctor/8/... under one route
+    request = environ.get('werkzeug.request')
+    rule = getattr(request, 'url_rule', None)
+    return rule.rule if rule is not None else '<unmatched>'
+
+
+def _is_negotiable(headers):
+    content_type = next((value for name, value in headers if name.lower() == 'content-type'), '')
+    return content_type.split(';', 1)[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+def _with_vary(headers):
+    vary = [value for name, value in headers if name.lower() == 'vary']
+    if any('accept-encoding' in value.lower() or value.strip() == '*' for value in vary):
+        return headers
+    headers = [(name, value) for name, value in headers if name.lower() != 'vary']
+    headers.append(('Vary', ', '.join(vary + ['Accept-Encoding'])))
+    return headers
+
+
+def _compressed_headers(headers, encoding):
+    result = []
+    for name, value in headers:
+        lower = name.lower()
+        # Ranges of the identity body cannot be resumed into an encoded one
+        if lower in ('content-length', 'accept-ranges'):
+            continue
+        if lower == 'etag' and not value.startswith('W/'):
+            value = 'W/' + value
+        result.append((name, value))
+    result.append(('Content-Encoding', encoding))
+    return _with_vary(result)
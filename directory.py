@@ -0,0 +1,211 @@
+"""
+Doctor directory queries: filters, sorting and keyset pagination in SQL
+
+Sorts are keyset-paginated on (sort value, doctor_info.id); the opaque
+cursor returned with each page resumes right after its last row, so deep
+pages cost the same as the first one.
+
+"Soonest" is the number of days until the doctor's next active
+availability window (weekly or one-off), not an individual free slot:
+slot-level booking checks stay in get_available_slots.
+
+shared_search_doctors() lets identical searches running at the same time
+(the same filters, cursor and day) share one query.
+"""
+import base64
+import json
+from datetime import date
+
+from extensions import db
+from models import User, DoctorInfo, Availability
+from page_cache import cached_fragment
+from app_cache import coalesce
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+SORTS = ('experience', 'soonest')
+NO_AVAILABILITY = 9999  # sorts doctors without any availability last
+
+
+def encode_cursor(value, doctor_id):
+    raw = json.dumps([value, doctor_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor):
+    """(sort value, doctor id) from a cursor, or None if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, doctor_id = json.loads(base64.urlsafe_b64decode(padded))
+        return int(value), int(doctor_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _days_until_expr(today):
+    """Days from today until an availability row next applies"""
+    recurring = (Availability.day_of_week - today.weekday() + 7) % 7
+    if db.session.get_bind().dialect.name == 'sqlite':
+        one_off = db.cast(db.func.julianday(Availability.specific_date) - db.func.julianday(today.isoformat()),
+                          db.Integer)
+    else:
+        one_off = Availability.specific_date - today
+    return db.case((Availability.specific_date.isnot(None), one_off), else_=recurring)
+
+
+def _next_availability(today):
+    """Subquery of doctor_id -> days until that doctor's next availability window"""
+    return db.session.query(
+        Availability.doctor_id.label('doctor_id'),
+        db.func.min(_days_until_expr(today)).label('next_days')
+    ).filter(
+        Availability.is_active == True,
+        db.or_(
+            db.and_(Availability.specific_date.is_(None), Availability.day_of_week.isnot(None)),
+            Availability.specific_date >= today
+        )
+    ).group_by(Availability.doctor_id).subquery()
+
+
+def search_doctors(specialization=None, min_experience=None, max_experience=None,
+                   available_within=None, sort='experience', cursor=None, limit=PAGE_SIZE, today=None):
+    """
+    One page of approved doctors
+
+    Args:
+        specialization: Exact specialization to filter on
+        min_experience, max_experience: Inclusive bounds on experience_years
+        available_within: Only doctors with availability in the next N days
+        sort: 'experience' (most first) or 'soonest' (next availability first)
+        cursor: Value from a previous page's next_cursor
+        limit: Page size, capped at MAX_PAGE_SIZE
+
+    Returns:
+        (list of (User with doctor_info loaded, days until next availability or None),
+         next_cursor or None)
+    """
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    today = today or date.today()
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    next_slot = _next_availability(today)
+    next_days = db.func.coalesce(next_slot.c.next_days, NO_AVAILABILITY)
+    experience = db.func.coalesce(DoctorInfo.experience_years, -1)
+
+    query = db.session.query(User, next_slot.c.next_days).join(
+        DoctorInfo, DoctorInfo.user_id == User.id
+    ).outerjoin(
+        next_slot, next_slot.c.doctor_id == DoctorInfo.id
+    ).options(
+        db.contains_eager(User.doctor_info)
+    ).filter(
+        User.role == 'doctor',
+        DoctorInfo.is_approved == True
+    )
+
+    if specialization:
+        query = query.filter(DoctorInfo.specialization == specialization)
+    if min_experience is not None:
+        query = query.filter(DoctorInfo.experience_years >= min_experience)
+    if max_experience is not None:
+        query = query.filter(DoctorInfo.experience_years <= max_experience)
+    if available_within is not None:
+        query = query.filter(next_slot.c.next_days <= available_within)
+
+    # Keyset: continue strictly after the previous page's last (value, id)
+    position = decode_cursor(cursor) if cursor else None
+    if sort == 'experience':
+        if position:
+            query = query.filter(db.or_(experience < position[0],
+                                        db.and_(experience == position[0], DoctorInfo.id > position[1])))
+        query = query.order_by(experience.desc(), DoctorInfo.id)
+    else:
+        if position:
+            query = query.filter(db.or_(next_days > position[0],
+                                        db.and_(next_days == position[0], DoctorInfo.id > position[1])))
+        query = query.order_by(next_days, DoctorInfo.id)
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_user, last_days = rows[-1]
+        if sort == 'experience':
+            value = last_user.doctor_info.experience_years
+            value = -1 if value is None else value
+        else:
+            value = NO_AVAILABILITY if last_days is None else last_days
+        next_cursor = encode_cursor(value, last_user.doctor_info.id)
+    return rows, next_cursor
+
+
+def shared_search_doctors(specialization=None, min_experience=None, max_experience=None,
+                          available_within=None, sort='experience', cursor=None, limit=PAGE_SIZE, today=None):
+    """
+    search_doctors() coalesced with identical concurrent searches
+
+    The page is shared by every waiting request (in this worker, or in
+    others through a shared cache backend), so it holds plain values
+    rather than ORM objects bound to one request's session.
+
+    Returns:
+        (list of doctor_row() dicts, next_cursor or None)
+    """
+    today = today or date.today()
+    key = 'directory:' + json.dumps([specialization, min_experience, max_experience, available_within,
+                                     sort, cursor, limit, today.isoformat()], separators=(',', ':'))
+
+    def search():
+        rows, next_cursor = search_doctors(specialization, min_experience, max_experience,
+                                           available_within, sort, cursor, limit, today)
+        return [doctor_row(doctor, days) for doctor, days in rows], next_cursor
+
+    return coalesce(key, search)
+
+
+def load_doctor_users(rows):
+    """
+    The Users (with doctor_info) behind doctor_row() dicts, in page order
+
+    For HTML views, whose templates take User objects: one query, in the
+    request's own session, so any relationship may still be lazy-loaded.
+    """
+    user_ids = [row['user_id'] for row in rows]
+    if not user_ids:
+        return []
+    users = User.query.options(db.joinedload(User.doctor_info)).filter(User.id.in_(user_ids)).all()
+    by_id = {user.id: user for user in users}
+    return [by_id[user_id] for user_id in user_ids if user_id in by_id]
+
+
+def doctor_row(doctor, next_available_in_days):
+    """Directory fields of a doctor (User with doctor_info loaded)"""
+    return {
+        'id': doctor.doctor_info.id,
+        'user_id': doctor.id,
+        'name': doctor.get_full_name(),
+        'specialization': doctor.doctor_info.specialization,
+        'qualification': doctor.doctor_info.qualification,
+        'experience_years': doctor.doctor_info.experience_years,
+        'profile_photo': doctor.doctor_info.profile_photo,
+        'next_available_in_days': next_available_in_days,
+    }
+
+
+def _load_specialization_facets():
+    return [
+        (specialization, count) for specialization, count in db.session.query(
+            DoctorInfo.specialization, db.func.count(DoctorInfo.id)
+        ).join(
+            User, DoctorInfo.user_id == User.id
+        ).filter(
+            User.role == 'doctor',
+            DoctorInfo.is_approved == True
+        ).group_by(DoctorInfo.specialization).order_by(DoctorInfo.specialization).all()
+    ]
+
+
+def specialization_facets():
+    """(specialization, approved doctor count) pairs, cached until the doctor list changes"""
+    return cached_fragment('doctors', _load_specialization_facets, key='specialization_facets')
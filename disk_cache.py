@@ -0,0 +1,94 @@
+"""
+Bounded on-disk cache with least-recently-used eviction
+
+Entries are files named by key. A file's mtime is its last use, so
+recency survives restarts and is shared by every worker on the host.
+Each worker keeps an estimate of the directory size and rescans it only
+when the estimate goes over budget or RESCAN_INTERVAL has passed (other
+workers' writes are not in the estimate), so a put is not a full scan.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+RESCAN_INTERVAL = 60
+
+
+class DiskLRUCache:
+
+    def __init__(self, directory, max_bytes, suffix=''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._estimated_bytes = None
+        self._scanned_at = 0.0
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def get(self, key):
+        """
+        Look up an entry and mark it as recently used
+
+        Returns:
+            Path of the cached file, or None on a miss
+        """
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put_bytes(self, key, data):
+        """Store data under key, evicting old entries if over budget"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path_for(key))
+        with self._lock:
+            if self._estimated_bytes is not None:
+                self._estimated_bytes += len(data)
+            due = (self._estimated_bytes is None or self._estimated_bytes > self.max_bytes
+                   or time.monotonic() - self._scanned_at >= RESCAN_INTERVAL)
+        if due:
+            self.evict()
+        return self.path_for(key)
+
+    def copy_to(self, key, destination):
+        """Copy a cached entry to destination; returns False on a miss"""
+        path = self.get(key)
+        if path is None:
+            return False
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(path, destination)
+        return True
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.is_file() or entry.name.startswith('.tmp-'):
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._estimated_bytes = total
+            self._scanned_at = time.monotonic()
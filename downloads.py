@@ -0,0 +1,65 @@
+"""
+Signed, expiring download URLs for private files
+
+URLs carry an HMAC over (kind, filename, user id, expiry), so the file
+endpoint can authorise a download from the URL and the session cookie
+alone, without a database lookup. Files live outside the static folder
+under PRIVATE_FILES_FOLDER/<kind>/.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+from flask import current_app, url_for
+
+# Kinds of private files the download endpoint may serve
+DOWNLOAD_KINDS = ('reports', 'recordings')
+
+
+def get_private_folder(kind):
+    """Directory holding private files of one kind"""
+    if kind not in DOWNLOAD_KINDS:
+        raise ValueError(f"Unknown download kind: {kind}")
+    folder = os.path.join(current_app.config['PRIVATE_FILES_FOLDER'], kind)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _signature(kind, filename, user_id, expires):
+    key = current_app.config.get('DOWNLOAD_SIGNING_KEY') or current_app.secret_key
+    message = f"{kind}\n{filename}\n{user_id}\n{expires}".encode('utf-8')
+    digest = hmac.new(key.encode('utf-8'), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def signed_download_url(kind, filename, user_id, expires_in=None):
+    """
+    Build a download URL valid for one user until it expires
+
+    Args:
+        kind: One of DOWNLOAD_KINDS
+        filename: File name inside the kind's private folder
+        user_id: Id of the user the link is issued to
+        expires_in: Lifetime in seconds (defaults to DOWNLOAD_URL_TTL)
+    """
+    if expires_in is None:
+        expires_in = current_app.config.get('DOWNLOAD_URL_TTL', 900)
+    expires = int(time.time()) + expires_in
+    return url_for('download_file', kind=kind, filename=filename,
+                   expires=expires, sig=_signature(kind, filename, str(user_id), expires))
+
+
+def verify_download(kind, filename, user_id, expires, signature):
+    """Check a download signature and expiry; never touches the database"""
+    if kind not in DOWNLOAD_KINDS or not signature or user_id is None:
+        return False
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    expected = _signature(kind, filename, str(user_id), expires)
+    return hmac.compare_digest(expected, signature)
@@ -0,0 +1,190 @@
+"""
+Streaming ZIP export of a patient's complete record
+
+The archive is produced incrementally: each compressed chunk is yielded to
+the client as soon as zipfile writes it, and table data is read in
+batches, so memory stays flat however long the patient's history is.
+
+The response has started by the time a report PDF is rendered, so a
+failure cannot become an error page. An entry that fails before its
+first chunk is left out, and one that fails partway through is cut
+short. Both are listed in a final errors.txt member, so the archive is
+never silently incomplete.
+"""
+import csv
+import io
+import json
+import logging
+import zipfile
+from datetime import datetime
+
+from extensions import db
+from models import User, Appointment, CallSession, PatientReport, Complaint
+from pdf_renderers import get_renderer
+from reports import get_report_pdf_path, get_pdf_cache, is_report_pdf_fresh, report_content_hash, report_query
+from utils import build_report_html
+
+BATCH_SIZE = 500
+FILE_CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class _ZipSink:
+    """Write-only, non-seekable buffer that zipfile writes into and we drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def stream_zip(entries):
+    """
+    Generate a ZIP archive from (name, iterable of bytes) entries
+
+    Entry bodies are consumed lazily, one chunk at a time. Failed entries
+    are listed in errors.txt (see the module docstring).
+    """
+    sink = _ZipSink()
+    errors = []
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in entries:
+            chunks = iter(chunks)
+            try:
+                first = next(chunks, b'')
+            except Exception as e:
+                logger.exception(f"Export entry {name} failed")
+                errors.append(f"{name}: not included ({e})")
+                continue
+            with archive.open(name, 'w', force_zip64=True) as member:
+                try:
+                    member.write(first)
+                    for chunk in chunks:
+                        member.write(chunk)
+                        yield from sink.drain()
+                except Exception as e:
+                    logger.exception(f"Export entry {name} failed")
+                    errors.append(f"{name}: incomplete ({e})")
+            yield from sink.drain()
+        if errors:
+            archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+    yield from sink.drain()
+
+
+def _csv_chunks(header, rows):
+    """Encode rows as CSV, flushing one batch at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(['' if value is None else value for value in row])
+        if count % BATCH_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _file_chunks(path):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(FILE_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _report_pdf_chunks(report, patient_user):
+    """
+    Stream a report's PDF, rendering (and caching) it if it is missing or stale
+
+    Rendering finishes before the first chunk, so a failure leaves the
+    entry out rather than cutting it short.
+    """
+    if is_report_pdf_fresh(report):
+        yield from _file_chunks(get_report_pdf_path(report.id))
+        return
+
+    cache = get_pdf_cache()
+    content_hash = report_content_hash(report)
+    cached_path = cache.get(content_hash)
+    if cached_path is None:
+        doctor = report.doctor.user if report.doctor is not None else None
+        if doctor is None or doctor.doctor_info is None:
+            raise ValueError(f"the doctor of report {report.id} no longer has a profile")
+        html = build_report_html(report, patient_user, doctor)
+        cached_path = cache.put_bytes(content_hash, get_renderer().render(html))
+    yield from _file_chunks(cached_path)
+
+
+def patient_export_entries(patient_info):
+    """Archive entries for one patient: profile, tables as CSV, and report PDFs"""
+    patient_user = db.session.get(User, patient_info.user_id)
+
+    profile = {
+        'patient_id': patient_info.id,
+        'name': patient_user.get_full_name(),
+        'email': patient_user.email,
+        'dob': patient_info.dob.isoformat() if patient_info.dob else None,
+        'gender': patient_info.gender,
+        'contact_number': patient_info.contact_number,
+        'medical_history': patient_info.medical_history,
+        'exported_at': datetime.utcnow().isoformat(),
+    }
+    yield 'patient.json', [json.dumps(profile, indent=2).encode('utf-8')]
+
+    appointments = db.session.query(
+        Appointment.id, Appointment.doctor_id, Appointment.appointment_date,
+        Appointment.start_time, Appointment.end_time, Appointment.status,
+        Appointment.notes, Appointment.created_at
+    ).filter(
+        Appointment.patient_id == patient_info.id
+    ).order_by(Appointment.id).yield_per(BATCH_SIZE)
+    yield 'appointments.csv', _csv_chunks(
+        ['id', 'doctor_id', 'appointment_date', 'start_time', 'end_time', 'status', 'notes', 'created_at'],
+        appointments
+    )
+
+    call_sessions = db.session.query(
+        CallSession.id, CallSession.appointment_id, CallSession.start_time,
+        CallSession.end_time, CallSession.status, CallSession.recording_path
+    ).join(
+        Appointment, CallSession.appointment_id == Appointment.id
+    ).filter(
+        Appointment.patient_id == patient_info.id
+    ).order_by(CallSession.id).yield_per(BATCH_SIZE)
+    yield 'call_sessions.csv', _csv_chunks(
+        ['id', 'appointment_id', 'start_time', 'end_time', 'status', 'recording_path'],
+        call_sessions
+    )
+
+    complaints = db.session.query(
+        Complaint.id, Complaint.subject, Complaint.description, Complaint.status,
+        Complaint.created_at, Complaint.resolved_at, Complaint.admin_response
+    ).filter(
+        Complaint.patient_id == patient_info.id
+    ).order_by(Complaint.id).yield_per(BATCH_SIZE)
+    yield 'complaints.csv', _csv_chunks(
+        ['id', 'subject', 'description', 'status', 'created_at', 'resolved_at', 'admin_response'],
+        complaints
+    )
+
+    # Report ids first, then one row at a time, so only the current report is held
+    report_ids = db.session.query(PatientReport.id).filter(
+        PatientReport.patient_id == patient_info.id
+    ).order_by(PatientReport.id).yield_per(BATCH_SIZE)
+    for (report_id,) in report_ids:
+        # Profiles shown in the PDF come with the report (see report_query)
+        report = report_query().filter(PatientReport.id == report_id).one()
+        yield f"reports/report_{report.id}.pdf", _report_pdf_chunks(report, patient_user)
+        db.session.expunge(report)
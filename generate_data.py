@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Generate large, realistic synthetic data for load and capacity testing
+
+    python generate_data.py --patients 100000 --doctors 2000 --appointments 5000000
+    python generate_data.py --scale 0.01 --seed 7
+
+Output is deterministic for a given --seed, --today and set of volumes.
+Rows are built with explicit ids and written through bulk.py (COPY on
+PostgreSQL, executemany elsewhere) in batches, parents before children.
+Existing data is left alone; generated usernames carry --prefix so a
+second run with the same prefix is refused rather than duplicated.
+
+Shapes:
+    doctors      popularity follows a power law, so a few doctors carry
+                 most of the appointments (capped by their slot capacity)
+    appointments past ones mostly completed with some cancellations and
+                 no-shows, future ones pending or confirmed
+    chats        messages per conversation are Pareto distributed
+    reports      written for a share of completed appointments
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from models import (User, DoctorInfo, PatientInfo, Availability, Appointment, CallSession,
+                    PatientReport, ChatConversation, ChatMessage, Complaint)
+from bulk import bulk_insert, next_id, sync_id_sequence
+from page_cache import bump_fragment
+
+FIRST_NAMES = ['Aarav', 'Aditi', 'Amit', 'Ananya', 'Arjun', 'Divya', 'Farhan', 'Gauri', 'Ishaan', 'Kavya',
+               'Meera', 'Neha', 'Nikhil', 'Priya', 'Rahul', 'Riya', 'Rohan', 'Sara', 'Tanvi', 'Vikram',
+               'Emma', 'Liam', 'Olivia', 'Noah', 'Ava', 'Lucas', 'Mia', 'Ethan', 'Zara', 'Omar']
+LAST_NAMES = ['Sharma', 'Verma', 'Gupta', 'Singh', 'Kumar', 'Patel', 'Reddy', 'Nair', 'Iyer', 'Khan',
+              'Das', 'Mehta', 'Joshi', 'Kapoor', 'Malhotra', 'Smith', 'Johnson', 'Brown', 'Garcia', 'Lee']
+SPECIALIZATIONS = [('Clinical Psychology', 30), ('Counseling Psychology', 25), ('Child Psychology', 10),
+                   ('Cognitive Behavioral Therapy', 12), ('Neuropsychology', 6), ('Health Psychology', 7),
+                   ('Educational Psychology', 5), ('Psychoanalysis', 5)]
+QUALIFICATIONS = ['Ph.D. in Psychology', 'M.Phil in Clinical Psychology', "Master's in Counseling Psychology",
+                  'M.D. in Psychiatry', 'M.S. in Clinical Mental Health']
+DIAGNOSES = ['Generalized anxiety disorder', 'Mild depressive episode', 'Adjustment disorder',
+             'Insomnia related to stress', 'Social anxiety', 'Work-related burnout', 'Panic disorder']
+PLANS = ['Weekly CBT sessions for eight weeks.', 'Fortnightly counseling with sleep hygiene routine.',
+         'Mindfulness practice and journaling; review in one month.', 'Graded exposure exercises.']
+MESSAGES = ['Hello doctor, I wanted to follow up on our last session.', 'Thank you, that helps a lot.',
+            'Could we move the next appointment?', 'Please keep up the breathing exercises.',
+            'I have been sleeping better this week.', 'How are you feeling today?',
+            'Let us discuss this in detail during the session.', 'Sure, see you then.']
+COMPLAINT_SUBJECTS = ['Appointment was rescheduled', 'Video call dropped', 'Billing question',
+                      'Could not download report', 'Doctor was late']
+
+# (status, weight) for appointments before and after --today
+PAST_STATUSES = [('completed', 72), ('cancelled', 15), ('confirmed', 5), ('pending', 8)]
+FUTURE_STATUSES = [('confirmed', 55), ('pending', 35), ('cancelled', 10)]
+SLOT_HOURS = range(9, 17)  # one-hour slots, 9:00 to 17:00
+
+
+class BatchWriter:
+    """
+    Buffers rows per table and flushes all buffers when one fills
+
+    Tables are written in the order given, which must list parents before
+    children; a child row may only be added once its parent row has been.
+    """
+
+    def __init__(self, tables, batch_size):
+        self.tables = tables
+        self.batch_size = batch_size
+        self.buffers = {table: [] for table in tables}
+        self.counts = {table: 0 for table in tables}
+
+    def add(self, table, row):
+        buffer = self.buffers[table]
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table in self.tables:
+            rows = self.buffers[table]
+            if rows:
+                bulk_insert(table, rows)
+                self.counts[table] += len(rows)
+                self.buffers[table] = []
+        db.session.commit()
+
+
+def _weighted(rng, choices):
+    values = [value for value, _ in choices]
+    weights = [weight for _, weight in choices]
+    return lambda: rng.choices(values, weights)[0]
+
+
+def allocate(total, weights, capacity):
+    """Split total across weights without giving any bucket more than capacity"""
+    allocation = [0] * len(weights)
+    open_buckets = list(range(len(weights)))
+    remaining = total
+    while remaining > 0 and open_buckets:
+        weight_sum = sum(weights[i] for i in open_buckets)
+        assigned = 0
+        for i in open_buckets:
+            share = min(capacity - allocation[i], max(1, round(remaining * weights[i] / weight_sum)))
+            share = min(share, remaining - assigned)
+            allocation[i] += share
+            assigned += share
+            if assigned >= remaining:
+                break
+        remaining -= assigned
+        open_buckets = [i for i in open_buckets if allocation[i] < capacity]
+        if assigned == 0:
+            break
+    return allocation
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    today = args.today
+    first_day = today - timedelta(days=args.days_back)
+    n_days = args.days_back + args.days_ahead
+    batch = BatchWriter([User, DoctorInfo, PatientInfo, Availability, Appointment, CallSession,
+                         PatientReport, ChatConversation, ChatMessage, Complaint], args.batch_size)
+    started = time.perf_counter()
+
+    def progress(label):
+        elapsed = time.perf_counter() - started
+        print(f"  {label:<14} done at {elapsed:7.1f}s")
+
+    if User.query.filter(User.username.like(f"{args.prefix}%")).first() is not None:
+        raise SystemExit(f"Users with prefix '{args.prefix}' already exist; pick another --prefix")
+    if db.engine.dialect.name == 'sqlite':
+        # Scratch load-test data: trade durability for speed
+        db.session.execute(db.text('PRAGMA synchronous=OFF'))
+
+    # One hash for every generated account; hashing each would dominate the run
+    password_hash = generate_password_hash(args.password)
+    user_base = next_id(User)
+    doctor_base = next_id(DoctorInfo)
+    patient_base = next_id(PatientInfo)
+    created = datetime.combine(first_day, dt_time(8))
+
+    # Users and profiles: doctors take user ids first, then patients
+    specialization = _weighted(rng, SPECIALIZATIONS)
+    for i in range(args.doctors):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{args.prefix}d{i}"
+        batch.add(User, {
+            'id': user_base + i, 'username': username, 'email': f"{username}@example.test",
+            'password_hash': password_hash, 'role': 'doctor', 'first_name': first, 'last_name': last,
+            'created_at': created, 'is_active': True,
+        })
+        batch.add(DoctorInfo, {
+            'id': doctor_base + i, 'user_id': user_base + i, 'specialization': specialization(),
+            'qualification': rng.choice(QUALIFICATIONS), 'experience_years': rng.randint(1, 35),
+            'bio': f"{rng.randint(1, 35)} years helping clients with anxiety, mood and stress.",
+            'profile_photo': None, 'is_approved': rng.random() < 0.92,
+        })
+        for day_of_week in rng.sample(range(6), rng.randint(2, 5)):
+            start_hour = rng.choice((9, 10, 13, 14))
+            batch.add(Availability, {
+                'doctor_id': doctor_base + i, 'day_of_week': day_of_week, 'specific_date': None,
+                'start_time': dt_time(start_hour), 'end_time': dt_time(start_hour + 3),
+                'is_active': True, 'is_recurring': True,
+            })
+    progress('doctors')
+
+    patient_user_base = user_base + args.doctors
+    for i in range(args.patients):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{args.prefix}p{i}"
+        batch.add(User, {
+            'id': patient_user_base + i, 'username': username, 'email': f"{username}@example.test",
+            'password_hash': password_hash, 'role': 'patient', 'first_name': first, 'last_name': last,
+            'created_at': created + timedelta(minutes=rng.randrange(n_days * 1440 // 2)), 'is_active': True,
+        })
+        batch.add(PatientInfo, {
+            'id': patient_base + i, 'user_id': patient_user_base + i,
+            'dob': date(1950, 1, 1) + timedelta(days=rng.randrange(58 * 365)),
+            'gender': rng.choices(('Female', 'Male', 'Other'), (52, 45, 3))[0],
+            'contact_number': f"9{rng.randrange(10 ** 9):09d}", 'medical_history': None,
+        })
+    batch.flush()
+    progress('patients')
+
+    # Appointments: power-law doctor popularity, distinct slots per doctor
+    capacity = n_days * len(SLOT_HOURS)
+    weights = [1 / (rank + 1) ** args.popularity_skew for rank in range(args.doctors)]
+    per_doctor = allocate(args.appointments, weights, capacity)
+    past_status = _weighted(rng, PAST_STATUSES)
+    future_status = _weighted(rng, FUTURE_STATUSES)
+    appointment_id = next_id(Appointment)
+    n_slots = len(SLOT_HOURS)
+
+    for i, count in enumerate(per_doctor):
+        doctor_id = doctor_base + i
+        for slot in sorted(rng.sample(range(capacity), count)):
+            day = first_day + timedelta(days=slot // n_slots)
+            hour = SLOT_HOURS[slot % n_slots]
+            # Skewed towards low indexes: some patients book far more often than others
+            patient = int(args.patients * rng.random() ** 2)
+            status = past_status() if day < today else future_status()
+            batch.add(Appointment, {
+                'id': appointment_id, 'doctor_id': doctor_id, 'patient_id': patient_base + patient,
+                'appointment_date': day, 'start_time': dt_time(hour), 'end_time': dt_time(hour + 1),
+                'status': status, 'notes': None,
+                'created_at': datetime.combine(day, dt_time(hour)) - timedelta(days=rng.randint(1, 21)),
+            })
+            if status == 'completed':
+                call_start = datetime.combine(day, dt_time(hour, rng.randrange(5)))
+                batch.add(CallSession, {
+                    'appointment_id': appointment_id, 'start_time': call_start,
+                    'end_time': call_start + timedelta(minutes=rng.randint(30, 58)),
+                    'recording_path': None, 'status': 'completed',
+                })
+                if rng.random() < args.report_rate:
+                    batch.add(PatientReport, {
+                        'patient_id': patient_base + patient, 'doctor_id': doctor_id,
+                        'appointment_id': appointment_id,
+                        'report_date': call_start + timedelta(hours=rng.randint(1, 48)),
+                        'diagnosis': rng.choice(DIAGNOSES), 'treatment_plan': rng.choice(PLANS),
+                        'recommendations': rng.choice(PLANS), 'next_appointment': None,
+                        'pdf_path': None, 'status': 'pending', 'content_hash': None,
+                    })
+            appointment_id += 1
+    batch.flush()
+    progress('appointments')
+
+    # Chats: Pareto-distributed message counts per conversation
+    conversation_id = next_id(ChatConversation)
+    for _ in range(args.conversations):
+        patient = rng.randrange(args.patients)
+        doctor = int(args.doctors * rng.random() ** 2)
+        n_messages = min(args.max_messages, int(rng.paretovariate(args.message_alpha)))
+        opened_at = created + timedelta(minutes=rng.randrange(n_days * 1440))
+        sent_times = []
+        for _ in range(n_messages):
+            sent_times.append((sent_times[-1] if sent_times else opened_at) + timedelta(minutes=rng.randint(1, 720)))
+        # The conversation goes into the batch first: a flush triggered by
+        # one of its messages must already include it
+        batch.add(ChatConversation, {
+            'id': conversation_id, 'patient_id': patient_base + patient, 'doctor_id': doctor_base + doctor,
+            'created_at': opened_at, 'last_message_at': sent_times[-1] if sent_times else opened_at,
+            'is_active': True,
+        })
+        senders = (patient_user_base + patient, user_base + doctor)
+        for m, sent_at in enumerate(sent_times):
+            batch.add(ChatMessage, {
+                'conversation_id': conversation_id, 'sender_id': senders[m % 2],
+                'message_text': rng.choice(MESSAGES), 'created_at': sent_at, 'is_read': True, 'message_type': 'text',
+            })
+        conversation_id += 1
+    batch.flush()
+    progress('chats')
+
+    for _ in range(args.complaints):
+        opened_at = created + timedelta(minutes=rng.randrange(n_days * 1440))
+        status = rng.choices(('open', 'under_review', 'resolved', 'closed'), (20, 15, 45, 20))[0]
+        resolved = status in ('resolved', 'closed')
+        batch.add(Complaint, {
+            'patient_id': patient_base + rng.randrange(args.patients), 'subject': rng.choice(COMPLAINT_SUBJECTS),
+            'description': 'Generated complaint for load testing.', 'status': status, 'created_at': opened_at,
+            'resolved_at': opened_at + timedelta(days=rng.randint(1, 10)) if resolved else None,
+            'admin_response': 'Resolved with the patient.' if resolved else None,
+        })
+    batch.flush()
+    progress('complaints')
+
+    for table in batch.tables:
+        sync_id_sequence(table)
+    db.session.commit()
+    bump_fragment('doctors')
+
+    elapsed = time.perf_counter() - started
+    total = sum(batch.counts.values())
+    for table in batch.tables:
+        print(f"  {table.__tablename__:<20} {batch.counts[table]:>10,}")
+    print(f"Wrote {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic PsychCare data at scale')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply every volume below')
+    parser.add_argument('--patients', type=int, default=100000)
+    parser.add_argument('--doctors', type=int, default=2000)
+    parser.add_argument('--appointments', type=int, default=5000000)
+    parser.add_argument('--conversations', type=int, default=30000)
+    parser.add_argument('--complaints', type=int, default=2000)
+    parser.add_argument('--report-rate', type=float, default=0.3, help='Share of completed appointments with a report')
+    parser.add_argument('--message-alpha', type=float, default=1.2, help='Pareto shape of messages per conversation')
+    parser.add_argument('--max-messages', type=int, default=5000)
+    parser.add_argument('--popularity-skew', type=float, default=0.8, help='Power-law exponent of doctor popularity')
+    parser.add_argument('--days-back', type=int, default=730)
+    parser.add_argument('--days-ahead', type=int, default=60)
+    parser.add_argument('--today', type=date.fromisoformat, default=date.today(),
+                        help='Anchor date (YYYY-MM-DD); fix it for reproducible output')
+    parser.add_argument('--prefix', default='gen_', help='Username prefix for generated accounts')
+    parser.add_argument('--password', default='password123', help='Password shared by generated accounts')
+    parser.add_argument('--batch-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    for volume in ('patients', 'doctors', 'appointments', 'conversations', 'complaints'):
+        setattr(args, volume, max(1, int(getattr(args, volume) * args.scale)))
+
+    with app.app_context():
+        generate(args)
+
+
+if __name__ == '__main__':
+    main()
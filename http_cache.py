@@ -0,0 +1,53 @@
+"""
+Helpers for conditional GET responses (ETag / Last-Modified validators)
+"""
+import hashlib
+from flask import request, make_response
+
+
+def make_etag(*parts):
+    """
+    Build an opaque ETag value from a handful of cheap version parts
+
+    Args:
+        parts: Values that change whenever the response body changes
+               (ids, counters, timestamps)
+
+    Returns:
+        Hex digest usable as a strong ETag
+    """
+    raw = ':'.join('' if part is None else str(part) for part in parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def is_not_modified(etag, last_modified=None):
+    """
+    Check the current request's validators against the given ones
+
+    If-None-Match takes precedence over If-Modified-Since, as in RFC 9110.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if last_modified is not None and request.if_modified_since is not None:
+        since = request.if_modified_since.replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+
+    return False
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attach ETag / Last-Modified headers and force revalidation on reuse"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Responses are per-user, so keep them out of shared caches
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """Return an empty 304 response carrying the current validators"""
+    response = make_response('', 304)
+    return set_validators(response, etag, last_modified)
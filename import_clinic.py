@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Bulk-import a clinic's doctors and patients from CSV or JSON
+
+    python import_clinic.py staff.csv --default-password 'Welcome123!' --approve
+    python import_clinic.py clinic.json --batch-size 2000 --workers 8
+
+One record per user. Columns / keys:
+    username, email, role (doctor|patient), first_name, last_name,
+    password or password_hash (otherwise --default-password),
+    doctor: specialization, qualification, experience_years, bio, is_approved
+    patient: dob (YYYY-MM-DD), gender, contact_number, medical_history
+    availability: "Mon 09:00-12:00; Wed 14:00-17:00" (or a JSON list of
+                  {"day_of_week", "start_time", "end_time"})
+    availability_template: name of a template from --templates or from the
+                  JSON file's "availability_templates" object
+
+Existing usernames/emails are fetched in one query up front. Passwords are
+hashed in a process pool, and each batch of users, profiles and weekly
+availability is inserted with executemany (COPY on PostgreSQL) and
+committed on its own. Users that already exist with the same username and
+email are skipped, so re-running after a failure resumes where it stopped.
+"""
+import argparse
+import csv
+import functools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from models import User, DoctorInfo, PatientInfo, Availability
+from passwords import configured_method
+from bulk import bulk_insert, bulk_insert_returning_ids
+from page_cache import bump_fragment
+
+DAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+
+
+class RecordError(ValueError):
+    """A record that cannot be imported"""
+
+
+def read_records(path, file_format=None):
+    """
+    Load records and any availability templates from a CSV or JSON file
+
+    Returns:
+        (list of record dicts, dict of template name -> slot list)
+    """
+    file_format = file_format or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'json':
+            data = json.load(f)
+            if isinstance(data, dict):
+                return data.get('users', []), data.get('availability_templates', {})
+            return data, {}
+        if file_format == 'csv':
+            return list(csv.DictReader(f)), {}
+    raise SystemExit(f"Unsupported file format: {file_format}")
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _parse_bool(value, default):
+    value = _clean(value)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'y')
+
+
+def _parse_time(value):
+    return datetime.strptime(value.strip(), '%H:%M').time()
+
+
+def parse_availability(value):
+    """Weekly slots as (day_of_week, start_time, end_time) tuples"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        slots = []
+        for part in value.split(';'):
+            part = part.strip()
+            if not part:
+                continue
+            day, _, hours = part.partition(' ')
+            start, _, end = hours.partition('-')
+            day = day.strip().lower()
+            day_of_week = int(day) if day.isdigit() else DAYS.get(day[:3])
+            if day_of_week is None:
+                raise RecordError(f"Unknown day '{day}'")
+            slots.append({'day_of_week': day_of_week, 'start_time': start, 'end_time': end})
+        value = slots
+
+    parsed = []
+    for slot in value:
+        day_of_week = int(slot['day_of_week'])
+        start_time = _parse_time(slot['start_time'])
+        end_time = _parse_time(slot['end_time'])
+        if not 0 <= day_of_week <= 6 or start_time >= end_time:
+            raise RecordError(f"Invalid availability slot {slot}")
+        parsed.append((day_of_week, start_time, end_time))
+    return parsed
+
+
+def normalize_record(record, templates, args):
+    """Validate one input record and convert it to column values"""
+    username = _clean(record.get('username'))
+    email = _clean(record.get('email'))
+    role = (_clean(record.get('role')) or '').lower()
+    if not username or not email:
+        raise RecordError("username and email are required")
+    if role not in ('doctor', 'patient'):
+        raise RecordError(f"role must be doctor or patient, not '{role}'")
+
+    password_hash = _clean(record.get('password_hash'))
+    password = _clean(record.get('password')) or args.default_password
+    if not password_hash and not password:
+        raise RecordError("no password, password_hash or --default-password")
+
+    entry = {
+        'user': {
+            'username': username,
+            'email': email,
+            'role': role,
+            'first_name': _clean(record.get('first_name')),
+            'last_name': _clean(record.get('last_name')),
+            'password_hash': password_hash,
+            'created_at': datetime.utcnow(),
+            'is_active': True,
+        },
+        'password': None if password_hash else password,
+        'availability': [],
+    }
+
+    if role == 'doctor':
+        specialization = _clean(record.get('specialization'))
+        if not specialization:
+            raise RecordError("doctors need a specialization")
+        experience = _clean(record.get('experience_years'))
+        entry['profile'] = {
+            'specialization': specialization,
+            'qualification': _clean(record.get('qualification')),
+            'experience_years': int(experience) if experience else None,
+            'bio': _clean(record.get('bio')),
+            'profile_photo': None,
+            'is_approved': _parse_bool(record.get('is_approved'), args.approve),
+        }
+        slots = record.get('availability')
+        template = _clean(record.get('availability_template'))
+        if template:
+            if template not in templates:
+                raise RecordError(f"unknown availability template '{template}'")
+            slots = templates[template]
+        entry['availability'] = parse_availability(slots)
+    else:
+        dob = _clean(record.get('dob'))
+        entry['profile'] = {
+            'dob': datetime.strptime(dob, '%Y-%m-%d').date() if dob else None,
+            'gender': _clean(record.get('gender')),
+            'contact_number': _clean(record.get('contact_number')),
+            'medical_history': _clean(record.get('medical_history')),
+        }
+    return entry
+
+
+def existing_accounts():
+    """Every existing username and email, in a single query"""
+    rows = db.session.query(User.username, User.email).all()
+    return {username: email.lower() for username, email in rows}, {email.lower() for _, email in rows}
+
+
+def plan_import(records, templates, args):
+    """
+    Split records into new entries, already-imported users and errors
+
+    Returns:
+        (entries to insert, skipped count, list of (record number, message))
+    """
+    usernames, emails = existing_accounts()
+    seen_usernames, seen_emails = set(), set()
+    entries, skipped, errors = [], 0, []
+
+    for number, record in enumerate(records, start=1):
+        try:
+            entry = normalize_record(record, templates, args)
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append((number, str(e)))
+            continue
+
+        username = entry['user']['username']
+        email = entry['user']['email'].lower()
+        if usernames.get(username) == email:
+            skipped += 1  # Imported by an earlier run
+            continue
+        if username in usernames or username in seen_usernames:
+            errors.append((number, f"username '{username}' is taken"))
+            continue
+        if email in emails or email in seen_emails:
+            errors.append((number, f"email '{email}' is taken"))
+            continue
+
+        seen_usernames.add(username)
+        seen_emails.add(email)
+        entries.append(entry)
+    return entries, skipped, errors
+
+
+def insert_batch(entries):
+    """Insert one batch of users with their profiles and availability"""
+    user_ids = bulk_insert_returning_ids(User, [entry['user'] for entry in entries], 'username')
+
+    doctor_rows, patient_rows = [], []
+    for entry in entries:
+        row = dict(entry['profile'], user_id=user_ids[entry['user']['username']])
+        (doctor_rows if entry['user']['role'] == 'doctor' else patient_rows).append(row)
+    bulk_insert(PatientInfo, patient_rows)
+
+    doctor_ids = bulk_insert_returning_ids(DoctorInfo, doctor_rows, 'user_id')
+    availability_rows = [
+        {
+            'doctor_id': doctor_ids[user_ids[entry['user']['username']]],
+            'day_of_week': day_of_week,
+            'specific_date': None,
+            'start_time': start_time,
+            'end_time': end_time,
+            'is_active': True,
+            'is_recurring': True,
+        }
+        for entry in entries if entry['user']['role'] == 'doctor'
+        for day_of_week, start_time, end_time in entry['availability']
+    ]
+    bulk_insert(Availability, availability_rows)
+
+
+def run_import(args):
+    started = time.perf_counter()
+    records, templates = read_records(args.path, args.format)
+    if args.templates:
+        with open(args.templates, encoding='utf-8') as f:
+            templates.update(json.load(f))
+
+    with app.app_context():
+        entries, skipped, errors = plan_import(records, templates, args)
+        for number, message in errors:
+            print(f"record {number}: {message}", file=sys.stderr)
+        print(f"{len(records)} records: {len(entries)} to import, {skipped} already imported, {len(errors)} rejected")
+        if args.dry_run or not entries:
+            return
+
+        hasher = functools.partial(generate_password_hash, method=configured_method())
+        hash_seconds = insert_seconds = 0.0
+        imported = 0
+
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for start in range(0, len(entries), args.batch_size):
+                batch = entries[start:start + args.batch_size]
+
+                t = time.perf_counter()
+                to_hash = [entry for entry in batch if entry['password'] is not None]
+                chunksize = max(1, len(to_hash) // (args.workers * 4))
+                for entry, password_hash in zip(to_hash, pool.map(hasher, [e['password'] for e in to_hash],
+                                                                  chunksize=chunksize)):
+                    entry['user']['password_hash'] = password_hash
+                hash_seconds += time.perf_counter() - t
+
+                t = time.perf_counter()
+                try:
+                    insert_batch(batch)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    print(f"Batch starting at entry {start + 1} failed; re-run to resume from there", file=sys.stderr)
+                    raise
+                insert_seconds += time.perf_counter() - t
+
+                imported += len(batch)
+                elapsed = time.perf_counter() - started
+                print(f"  {imported}/{len(entries)} users  {imported / elapsed:8.1f} users/s")
+
+        if any(entry['user']['role'] == 'doctor' for entry in entries):
+            bump_fragment('doctors')
+
+    elapsed = time.perf_counter() - started
+    print(f"Imported {imported} users in {elapsed:.1f}s ({imported / elapsed:.1f} users/s); "
+          f"hashing {hash_seconds:.1f}s, inserts {insert_seconds:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-import clinic doctors and patients')
+    parser.add_argument('path', help='CSV or JSON file of user records')
+    parser.add_argument('--format', choices=('csv', 'json'), help='Override detection from the file extension')
+    parser.add_argument('--templates', help='JSON file of availability templates (name -> slot list)')
+    parser.add_argument('--default-password', help='Password for records without password/password_hash')
+    parser.add_argument('--approve', action='store_true', help='Approve doctors unless is_approved says otherwise')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Password hashing processes')
+    parser.add_argument('--dry-run', action='store_true', help='Validate and report without writing')
+    run_import(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Background job queue backed by the database
+
+Jobs are rows in the background_job table, so they survive restarts and
+can be retried. Each worker process runs them on a local executor:
+
+    JOB_BACKEND = 'thread'   # ThreadPoolExecutor (default)
+    JOB_BACKEND = 'process'  # ProcessPoolExecutor, one app instance per child
+
+A poller thread per worker picks up jobs that are due for a retry or were
+left behind by a crashed worker. `python run_jobs.py` drains the queue from
+a standalone process instead.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# job_type -> (handler, on_failure)
+_handlers = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+_poller_started = False
+
+
+def register_job(job_type, on_failure=None):
+    """
+    Decorator registering the handler for a job type
+
+    The handler receives the decoded payload as keyword arguments and runs
+    inside an app context. on_failure(error, **payload) is called once the
+    job has used up all of its attempts.
+    """
+    def decorator(func):
+        _handlers[job_type] = (func, on_failure)
+        return func
+    return decorator
+
+
+def enqueue_job(job_type, payload, max_attempts=3):
+    """
+    Add a job to the current session
+
+    The caller commits, then calls submit_job(job.id) so workers never see
+    a job before its row is visible.
+    """
+    job = BackgroundJob()
+    job.job_type = job_type
+    job.payload = json.dumps(payload)
+    job.status = 'queued'
+    job.attempts = 0
+    job.max_attempts = max_attempts
+    job.run_after = datetime.utcnow()
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+def submit_job(job_id, app=None):
+    """Hand a committed job to this worker's executor"""
+    from flask import current_app
+    app = app or current_app._get_current_object()
+
+    executor = _get_executor(app)
+    if isinstance(executor, ProcessPoolExecutor):
+        executor.submit(_run_job_in_child, job_id)
+    else:
+        executor.submit(_run_job_with_app, app, job_id)
+    _start_poller(app)
+
+
+def run_job(job_id):
+    """
+    Claim and run a single job; must be called inside an app context
+
+    Returns:
+        True if this call ran the job, False if another worker claimed it
+    """
+    now = datetime.utcnow()
+    claimed = BackgroundJob.query.filter(
+        BackgroundJob.id == job_id,
+        BackgroundJob.status == 'queued',
+        BackgroundJob.run_after <= now
+    ).update({
+        BackgroundJob.status: 'running',
+        BackgroundJob.attempts: BackgroundJob.attempts + 1,
+        BackgroundJob.updated_at: now
+    }, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return False
+
+    job = db.session.get(BackgroundJob, job_id)
+    handler, on_failure = _handlers[job.job_type]
+    payload = json.loads(job.payload)
+
+    try:
+        handler(**payload)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(BackgroundJob, job_id)
+        job.last_error = str(e)[:1000]
+        job.updated_at = datetime.utcnow()
+        if job.attempts < job.max_attempts:
+            # Exponential backoff: 10s, 20s, 40s, ...
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(seconds=10 * 2 ** (job.attempts - 1))
+            logger.warning(f"Job {job_id} ({job.job_type}) failed, retrying: {e}")
+        else:
+            job.status = 'failed'
+            logger.error(f"Job {job_id} ({job.job_type}) failed permanently: {e}")
+            if on_failure:
+                on_failure(e, **payload)
+        db.session.commit()
+        return True
+
+    job.status = 'done'
+    job.updated_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+def run_due_jobs(limit=50, stale_after=600):
+    """
+    Run queued jobs that are due, requeueing ones stuck in 'running'
+
+    Returns:
+        Number of jobs run by this call
+    """
+    now = datetime.utcnow()
+
+    # A job still 'running' long after its last update belonged to a dead worker
+    BackgroundJob.query.filter(
+        BackgroundJob.status == 'running',
+        BackgroundJob.updated_at < now - timedelta(seconds=stale_after)
+    ).update({BackgroundJob.status: 'queued'}, synchronize_session=False)
+    db.session.commit()
+
+    due_ids = [row.id for row in db.session.query(BackgroundJob.id).filter(
+        BackgroundJob.status == 'queued',
+        BackgroundJob.run_after <= now
+    ).order_by(BackgroundJob.run_after).limit(limit).all()]
+
+    return sum(1 for job_id in due_ids if run_job(job_id))
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = app.config.get('JOB_WORKERS', 2)
+            if app.config.get('JOB_BACKEND', 'thread') == 'process':
+                _executor = ProcessPoolExecutor(max_workers=workers)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        return _executor
+
+
+def _run_job_with_app(app, job_id):
+    with app.app_context():
+        try:
+            run_job(job_id)
+        except Exception:
+            logger.exception(f"Job {job_id} crashed the job runner")
+        finally:
+            db.session.remove()
+
+
+def _run_job_in_child(job_id):
+    # Child processes build their own app instance on first use
+    from app import app
+    _run_job_with_app(app, job_id)
+
+
+def _start_poller(app):
+    global _poller_started
+    with _executor_lock:
+        if _poller_started:
+            return
+        _poller_started = True
+
+    interval = app.config.get('JOB_POLL_INTERVAL', 15)
+
+    def poll():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    run_due_jobs()
+                except Exception:
+                    logger.exception("Job poller failed")
+                finally:
+                    db.session.remove()
+
+    threading.Thread(target=poll, name='job-poller', daemon=True).start()
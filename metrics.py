@@ -0,0 +1,358 @@
+"""
+Per-endpoint request metrics in Prometheus text format
+
+MetricsMiddleware wraps the whole WSGI stack (see app.py), so latency and
+response size cover streamed bodies and are measured as sent, after
+compression. While a request runs, SQLAlchemy engine events and Flask's
+template signals add to a thread-local record; when the body is closed
+the record is folded into per-worker totals:
+
+    psychcare_http_requests_total                   endpoint, method, status
+    psychcare_http_request_duration_seconds         histogram, endpoint, method
+    psychcare_http_response_size_bytes              histogram, endpoint
+    psychcare_sql_statements_total                  endpoint
+    psychcare_sql_duration_seconds_total            endpoint
+    psychcare_template_render_seconds_total         endpoint
+
+Each worker writes a snapshot of its totals to METRICS_FOLDER every
+METRICS_FLUSH_INTERVAL seconds; render() sums the snapshots of all
+workers, so histogram_quantile() over the buckets gives percentiles for
+the whole deployment. Recording costs a few dict updates per request.
+Responses the server sends through wsgi.file_wrapper (sendfile) are
+passed through as is, with their size taken from Content-Length.
+"""
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+DEFAULT_FLUSH_INTERVAL = 5
+# Snapshots of workers gone for longer than this are dropped
+RETENTION = 24 * 3600
+
+_local = threading.local()
+
+
+class _RequestRecord:
+
+    __slots__ = ('started', 'endpoint', 'method', 'status', 'bytes', 'sql_count', 'sql_seconds',
+                 'template_seconds', 'render_started')
+
+    def __init__(self, method):
+        self.started = time.perf_counter()
+        self.endpoint = None
+        self.method = method
+        self.status = '500'
+        self.bytes = 0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.render_started = []
+
+
+def current_record():
+    """Metrics record of the request running on this thread, if any"""
+    return getattr(_local, 'record', None)
+
+
+def _new_histogram(buckets):
+    # Per-bucket counts, then sum and count
+    return [0] * len(buckets) + [0.0, 0]
+
+
+def _observe(histogram, buckets, value):
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            histogram[index] += 1
+            break
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+class Registry:
+    """Totals of one worker process, periodically written to the shared folder"""
+
+    def __init__(self, folder=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.folder = folder
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._requests = defaultdict(int)
+        self._latency = defaultdict(lambda: _new_histogram(LATENCY_BUCKETS))
+        self._sizes = defaultdict(lambda: _new_histogram(SIZE_BUCKETS))
+        self._sql_count = defaultdict(int)
+        self._sql_seconds = defaultdict(float)
+        self._template_seconds = defaultdict(float)
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._snapshot_id = None
+        self._last_flush = time.monotonic()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # A forked worker starts from zero; the master's totals stay in its own snapshot
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        for series in (self._requests, self._latency, self._sizes, self._sql_count,
+                       self._sql_seconds, self._template_seconds):
+            series.clear()
+
+    def record(self, record):
+        duration = time.perf_counter() - record.started
+        endpoint = record.endpoint or 'unmatched'
+        with self._lock:
+            self._requests[(endpoint, record.method, record.status)] += 1
+            _observe(self._latency[(endpoint, record.method)], LATENCY_BUCKETS, duration)
+            _observe(self._sizes[(endpoint,)], SIZE_BUCKETS, record.bytes)
+            if record.sql_count:
+                self._sql_count[(endpoint,)] += record.sql_count
+                self._sql_seconds[(endpoint,)] += record.sql_seconds
+            if record.template_seconds:
+                self._template_seconds[(endpoint,)] += record.template_seconds
+            due = self.folder and time.monotonic() - self._last_flush >= self.flush_interval
+            if due:
+                self._last_flush = time.monotonic()
+        if due:
+            self.flush()
+
+    def _snapshot_name(self):
+        # Workers forked from a --preload master must not share the master's name
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._snapshot_id = f"{pid}-{time.time_ns()}.json"
+        return self._snapshot_id
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': [[list(k), v] for k, v in self._requests.items()],
+                'latency': [[list(k), list(v)] for k, v in self._latency.items()],
+                'sizes': [[list(k), list(v)] for k, v in self._sizes.items()],
+                'sql_count': [[list(k), v] for k, v in self._sql_count.items()],
+                'sql_seconds': [[list(k), v] for k, v in self._sql_seconds.items()],
+                'template_seconds': [[list(k), v] for k, v in self._template_seconds.items()],
+            }
+
+    def flush(self):
+        """Write this worker's totals where render() in any worker can read them"""
+        if not self.folder:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        with self._flush_lock:
+            path = os.path.join(self.folder, self._snapshot_name())
+            fd, temp_path = tempfile.mkstemp(dir=self.folder, prefix='.tmp-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f, separators=(',', ':'))
+            os.replace(temp_path, path)
+
+    def collect(self):
+        """This worker's current totals merged with every other worker's last snapshot"""
+        self.flush()
+        snapshots = [self.snapshot()]
+        if self.folder and os.path.isdir(self.folder):
+            now = time.time()
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.json') or entry.name == self._snapshot_name():
+                        continue
+                    try:
+                        if now - entry.stat().st_mtime > RETENTION:
+                            os.remove(entry.path)
+                            continue
+                        with open(entry.path) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+        return _merge(snapshots)
+
+
+def _merge(snapshots):
+    merged = {name: {} for name in ('requests', 'latency', 'sizes', 'sql_count', 'sql_seconds', 'template_seconds')}
+    for snapshot in snapshots:
+        for name, series in merged.items():
+            for key, value in snapshot.get(name, []):
+                key = tuple(key)
+                if isinstance(value, list):
+                    current = series.get(key)
+                    series[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    series[key] = series.get(key, 0) + value
+    return merged
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _render_histogram(lines, name, help_text, series, label_names, buckets):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, values in sorted(series.items()):
+        cumulative = 0
+        for bound, count in zip(buckets, values):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(label_names, key, ('le', bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(label_names, key, ('le', '+Inf'))} {values[-1]}")
+        lines.append(f"{name}_sum{_labels(label_names, key)} {values[-2]}")
+        lines.append(f"{name}_count{_labels(label_names, key)} {values[-1]}")
+
+
+def _render_counter(lines, name, help_text, series, label_names):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for key, value in sorted(series.items()):
+        lines.append(f"{name}{_labels(label_names, key)} {value}")
+
+
+def render(registry):
+    """All workers' metrics in the Prometheus text exposition format"""
+    merged = registry.collect()
+    lines = []
+    _render_counter(lines, 'psychcare_http_requests_total', 'HTTP requests handled.',
+                    merged['requests'], ('endpoint', 'method', 'status'))
+    _render_histogram(lines, 'psychcare_http_request_duration_seconds',
+                      'Time from the start of a request until its body was sent.',
+                      merged['latency'], ('endpoint', 'method'), LATENCY_BUCKETS)
+    _render_histogram(lines, 'psychcare_http_response_size_bytes', 'Response body bytes sent.',
+                      merged['sizes'], ('endpoint',), SIZE_BUCKETS)
+    _render_counter(lines, 'psychcare_sql_statements_total', 'SQL statements executed.',
+                    merged['sql_count'], ('endpoint',))
+    _render_counter(lines, 'psychcare_sql_duration_seconds_total', 'Time spent executing SQL statements.',
+                    merged['sql_seconds'], ('endpoint',))
+    _render_counter(lines, 'psychcare_template_render_seconds_total', 'Time spent rendering templates.',
+                    merged['template_seconds'], ('endpoint',))
+    return '\n'.join(lines) + '\n'
+
+
+class _MeteredBody:
+    """Counts bytes as the server sends them and records the request once the body is done"""
+
+    def __init__(self, app_iter, record, registry):
+        self._app_iter = app_iter
+        self._record = record
+        self._registry = registry
+        self._finished = False
+
+    def __iter__(self):
+        for chunk in self._app_iter:
+            self._record.bytes += len(chunk)
+            yield chunk
+        self._finish()
+
+    def close(self):
+        try:
+            if hasattr(self._app_iter, 'close'):
+                self._app_iter.close()
+        finally:
+            self._finish()
+
+    def _finish(self):
+        # Servers call close() after the last chunk; some clients never do
+        if not self._finished:
+            self._finished = True
+            _local.record = None
+            self._registry.record(self._record)
+
+
+class MetricsMiddleware:
+
+    def __init__(self, app, registry):
+        self.app = app
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        record = _RequestRecord(environ.get('REQUEST_METHOD', 'GET'))
+        _local.record = record
+
+        content_length = []
+
+        def metered_start_response(status, headers, exc_info=None):
+            record.status = status.split(' ', 1)[0]
+            # Flask's request is still in the environ while the view responds
+            flask_request = environ.get('werkzeug.request')
+            record.endpoint = getattr(flask_request, 'endpoint', None)
+            content_length[:] = [value for name, value in headers if name.lower() == 'content-length']
+            return start_response(status, headers, exc_info)
+
+        try:
+            app_iter = self.app(environ, metered_start_response)
+        except Exception:
+            _local.record = None
+            self.registry.record(record)
+            raise
+
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(app_iter, file_wrapper):
+            # Left as is so the server can use sendfile; the size comes from
+            # Content-Length and the latency stops before the transfer
+            if content_length and content_length[0].isdigit():
+                record.bytes = int(content_length[0])
+            _local.record = None
+            self.registry.record(record)
+            return app_iter
+        return _MeteredBody(app_iter, record, self.registry)
+
+
+# SQL and template timing for the request on the current thread
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record = current_record()
+    if record is not None and context is not None:
+        record.sql_count += 1
+        record.sql_seconds += time.perf_counter() - getattr(context, '_metrics_started', time.perf_counter())
+
+
+def _before_render(sender, template, context, **extra):
+    record = current_record()
+    if record is not None:
+        record.render_started.append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    record = current_record()
+    if record is not None and record.render_started:
+        record.template_seconds += time.perf_counter() - record.render_started.pop()
+
+
+def is_scrape_request():
+    """True when the request carries the configured METRICS_SCRAPE_TOKEN as a bearer token"""
+    expected = current_app.config.get('METRICS_SCRAPE_TOKEN')
+    header = request.headers.get('Authorization', '')
+    if not expected or not header.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(header[len('Bearer '):].strip(), expected)
+
+
+def init_app(app):
+    """Wrap app.wsgi_app; call after every other WSGI middleware so sizes are as sent"""
+    registry = Registry(app.config.get('METRICS_FOLDER'),
+                        app.config.get('METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL))
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app, registry)
+    app.extensions['metrics'] = registry
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    return registry
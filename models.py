@@ -1,11 +1,38 @@
 from datetime import datetime
 from extensions import db, login_manager
+from flask import current_app
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+import user_cache
+from app_cache import invalidate_after_commit
+from passwords import hash_password, verify_password, needs_rehash
+
+def format_full_name(first_name, last_name, username):
+    """Display name shared by User.get_full_name and column-projected rows"""
+    if first_name and last_name:
+        return f"{first_name} {last_name}"
+    return username
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    """
+    Load the principal with its role profile, at most one query per request
+    
+    The user and doctor_info/patient_info come from one joined query and are
+    kept detached in a short-TTL per-worker cache; each request merges a
+    copy into its own session without touching the database.
+    """
+    user_id = int(user_id)
+    user = user_cache.get_user(user_id)
+    if user is None:
+        user = User.query.options(
+            db.joinedload(User.doctor_info),
+            db.joinedload(User.patient_info)
+        ).filter_by(id=user_id).first()
+        if user is None:
+            return None
+        db.session.expunge(user)
+        user_cache.set_user(user_id, user, current_app.config.get('USER_CACHE_TTL', user_cache.DEFAULT_TTL))
+    return db.session.merge(user, load=False)
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,17 +43,23 @@ class User(UserMixin, db.Model):
     first_name = db.Column(db.String(50), nullable=True)
     last_name = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on every change to the row; HTTP validators that embed names depend on it
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     
     # Role-specific fields
     doctor_info = db.relationship('DoctorInfo', backref='user', uselist=False, cascade="all, delete-orphan")
     patient_info = db.relationship('PatientInfo', backref='user', uselist=False, cascade="all, delete-orphan")
+    refresh_tokens = db.relationship('RefreshToken', backref='user', cascade="all, delete-orphan")
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
     
     def is_admin(self):
         return self.role == 'admin'
@@ -38,9 +71,7 @@ class User(UserMixin, db.Model):
         return self.role == 'patient'
     
     def get_full_name(self):
-        if self.first_name and self.last_name:
-            return f"{self.first_name} {self.last_name}"
-        return self.username
+        return format_full_name(self.first_name, self.last_name, self.username)
 
 class DoctorInfo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -55,6 +86,20 @@ class DoctorInfo(db.Model):
     # Relationships
     availability = db.relationship('Availability', backref='doctor', cascade="all, delete-orphan")
     appointments = db.relationship('Appointment', backref='doctor_info', cascade="all, delete-orphan")
+    
+    # Doctor directory filters and keyset sorts (see directory.py)
+    __table_args__ = (
+        db.Index('ix_doctor_info_approved_specialization', 'is_approved', 'specialization', 'id'),
+        db.Index('ix_doctor_info_approved_experience', 'is_approved', 'experience_years', 'id'),
+        db.Index('ix_doctor_info_user_id', 'user_id'),
+    )
+
+# Case-insensitive prefix lookups for typeahead search before its index is built
+db.Index('ix_user_first_name_lower', db.func.lower(User.first_name))
+db.Index('ix_user_last_name_lower', db.func.lower(User.last_name))
+db.Index('ix_user_username_lower', db.func.lower(User.username))
+db.Index('ix_user_email_lower', db.func.lower(User.email))
+db.Index('ix_doctor_info_specialization_lower', db.func.lower(DoctorInfo.specialization))
 
 class PatientInfo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -78,6 +123,10 @@ class Availability(db.Model):
     end_time = db.Column(db.Time, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
     is_recurring = db.Column(db.Boolean, default=True)  # True for weekly recurring, False for specific date
+    
+    __table_args__ = (
+        db.Index('ix_availability_doctor_active', 'doctor_id', 'is_active'),
+    )
 
 class Appointment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -101,6 +150,53 @@ class CallSession(db.Model):
     recording_path = db.Column(db.String(255), nullable=True)
     status = db.Column(db.String(20), nullable=False, default='scheduled')  # scheduled, in_progress, completed, failed
 
+class ScheduleVersion(db.Model):
+    """Change counter for a doctor's bookable slots, used as a cheap HTTP validator"""
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_info.id', ondelete='CASCADE'), nullable=False)
+    slot_date = db.Column(db.Date, nullable=True)  # null for the recurring weekly schedule
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_schedule_version_doctor_date', 'doctor_id', 'slot_date'),
+    )
+    
+    @staticmethod
+    def bump(doctor_id, slot_date=None):
+        """Record a change to a doctor's slots on a date (or to the weekly schedule if no date)"""
+        invalidate_after_commit(f'doctor:{doctor_id}')
+        updated = ScheduleVersion.query.filter_by(
+            doctor_id=doctor_id,
+            slot_date=slot_date
+        ).update({
+            ScheduleVersion.version: ScheduleVersion.version + 1,
+            ScheduleVersion.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+        
+        if not updated:
+            schedule_version = ScheduleVersion()
+            schedule_version.doctor_id = doctor_id
+            schedule_version.slot_date = slot_date
+            schedule_version.version = 1
+            schedule_version.updated_at = datetime.utcnow()
+            db.session.add(schedule_version)
+    
+    @staticmethod
+    def current(doctor_id, slot_date):
+        """
+        Get the combined version and last change time for a doctor's slots on a date
+        
+        Reads at most two rows through the (doctor_id, slot_date) index.
+        """
+        return db.session.query(
+            db.func.coalesce(db.func.sum(ScheduleVersion.version), 0),
+            db.func.max(ScheduleVersion.updated_at)
+        ).filter(
+            ScheduleVersion.doctor_id == doctor_id,
+            db.or_(ScheduleVersion.slot_date == slot_date, ScheduleVersion.slot_date.is_(None))
+        ).one()
+
 class PatientReport(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient_info.id', ondelete='CASCADE'), nullable=False)
@@ -112,10 +208,25 @@ class PatientReport(db.Model):
     recommendations = db.Column(db.Text, nullable=True)
     next_appointment = db.Column(db.Date, nullable=True)
     pdf_path = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, ready, failed (PDF rendering)
+    content_hash = db.Column(db.String(64), nullable=True)  # hash of the fields the current PDF was rendered from
     
     doctor = db.relationship('DoctorInfo')
     appointment = db.relationship('Appointment')
 
+class PatientReportRevision(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.Integer, db.ForeignKey('patient_report.id', ondelete='CASCADE'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    is_snapshot = db.Column(db.Boolean, nullable=False, default=False)  # full fields vs delta from previous revision
+    data = db.Column(db.Text, nullable=False)  # JSON
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('report_id', 'revision', name='uq_patient_report_revision'),
+    )
+
 class Complaint(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient_info.id', ondelete='CASCADE'), nullable=False)
@@ -141,7 +252,7 @@ class ChatConversation(db.Model):
 
 class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    conversation_id = db.Column(db.Integer, db.ForeignKey('chat_conversation.id', ondelete='CASCADE'), nullable=False)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('chat_conversation.id', ondelete='CASCADE'), nullable=False, index=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     message_text = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -150,6 +261,41 @@ class ChatMessage(db.Model):
     
     # Relationships
     sender = db.relationship('User')
+    attachment = db.relationship('ChatAttachment', backref='message', uselist=False, cascade="all, delete-orphan")
+
+class ChatAttachment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('chat_message.id', ondelete='CASCADE'), nullable=False, index=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)  # blob key in the attachment store
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False, default='application/octet-stream')
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class BackgroundJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON-encoded handler arguments
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    last_error = db.Column(db.Text, nullable=True)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_background_job_status_run_after', 'status', 'run_after'),
+    )
+
+class RefreshToken(db.Model):
+    """Issued API refresh token; a set revoked_at puts it on the revocation list"""
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    issued_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=True)
 
 class SliderImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
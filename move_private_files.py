@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Move report PDFs out of the public static folder into the private files folder
+"""
+import os
+import shutil
+
+from app import app
+from downloads import get_private_folder
+
+def move_private_files():
+    with app.app_context():
+        static_folder = app.static_folder if app.static_folder else 'static'
+        source = os.path.join(static_folder, 'reports')
+        if not os.path.isdir(source):
+            print("No public report PDFs to move")
+            return
+
+        destination = get_private_folder('reports')
+        moved = 0
+        for filename in os.listdir(source):
+            if filename.endswith('.pdf'):
+                shutil.move(os.path.join(source, filename), os.path.join(destination, filename))
+                moved += 1
+        print(f"Moved {moved} report PDFs to {destination}")
+
+if __name__ == '__main__':
+    move_private_files()
@@ -0,0 +1,127 @@
+"""
+Cached public pages with fragment-level invalidation
+
+Public pages are built from content fragments ('sliders', 'doctors'). Each
+fragment has a version stamp file under CACHE_VERSION_FOLDER; any process
+(web worker or maintenance script) bumps it with bump_fragment() after
+changing that content, and every worker sees the change on its next
+request with a stat() call instead of a query.
+
+    fragment data    cached_fragment('doctors', loader) runs loader once per
+                     fragment version and reuses the detached result
+    whole pages      @cached_page('sliders', 'doctors') serves anonymous
+                     requests from HTML rendered for the current versions,
+                     without loading a user or touching the database
+"""
+import functools
+import os
+import threading
+import time
+
+from flask import current_app, request, session, make_response
+
+from http_cache import make_etag, is_not_modified, set_validators, not_modified
+
+FRAGMENTS = ('sliders', 'doctors')
+
+_fragments = {}  # key -> (version, value)
+_pages = {}  # endpoint -> (version, html)
+_lock = threading.Lock()
+
+
+def _stamp_path(name, folder=None):
+    if name not in FRAGMENTS:
+        raise ValueError(f"Unknown page fragment: {name}")
+    folder = folder or current_app.config['CACHE_VERSION_FOLDER']
+    return os.path.join(folder, name)
+
+
+def fragment_version(name):
+    """Version token of one fragment; changes whenever bump_fragment() runs"""
+    try:
+        stat = os.stat(_stamp_path(name))
+    except FileNotFoundError:
+        return 0
+    return stat.st_mtime_ns, stat.st_ino
+
+
+def bump_fragment(*names, folder=None):
+    """
+    Mark fragments as changed in every worker
+
+    Call after the change is committed. Scripts without an app context can
+    pass the folder explicitly.
+    """
+    for name in names:
+        path = _stamp_path(name, folder)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A fresh inode per bump keeps versions distinct even within one mtime tick
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temp_path, 'w') as f:
+            f.write(str(time.time_ns()))
+        os.replace(temp_path, path)
+
+
+def cached_fragment(name, loader, key=None):
+    """
+    Return loader()'s result for the current version of a fragment
+
+    The result is shared between requests, so loader should return
+    detached, read-only objects. Several values derived from the same
+    fragment are cached side by side under different keys.
+    """
+    key = key or name
+    version = fragment_version(name)
+    with _lock:
+        entry = _fragments.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    value = loader()
+    with _lock:
+        _fragments[key] = (version, value)
+    return value
+
+
+def _is_anonymous_request():
+    # Checked on the raw session so no user is loaded; pending flash messages
+    # are per visitor and must not end up in a shared page
+    remember_cookie = current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token')
+    return (request.method == 'GET' and '_user_id' not in session and '_flashes' not in session
+            and remember_cookie not in request.cookies)
+
+
+def cached_page(*fragments):
+    """Serve a public view from cache for anonymous visitors until a fragment changes"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            if not current_app.config.get('PAGE_CACHE_ENABLED', True) or not _is_anonymous_request():
+                return view(*args, **kwargs)
+
+            version = tuple(fragment_version(name) for name in fragments)
+            etag = make_etag('page', request.endpoint, version)
+            if is_not_modified(etag):
+                return not_modified(etag, None)
+
+            with _lock:
+                entry = _pages.get(request.endpoint)
+            if entry is not None and entry[0] == version:
+                html = entry[1]
+            else:
+                html = view(*args, **kwargs)
+                if not isinstance(html, str):
+                    # Redirects and error responses are not cached
+                    return html
+                with _lock:
+                    _pages[request.endpoint] = (version, html)
+
+            return set_validators(make_response(html), etag, None)
+        return wrapped
+    return decorator
+
+
+def clear():
+    with _lock:
+        _fragments.clear()
+        _pages.clear()
@@ -0,0 +1,80 @@
+"""
+Password hashing with configurable cost and a bounded hashing pool
+
+PASSWORD_HASH_METHOD takes any Werkzeug method string, e.g.
+'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'. Hashes stored with other
+parameters are upgraded (or downgraded) on the user's next successful login.
+
+Hashing and verification run on a small thread pool. hashlib releases the
+GIL while deriving keys, so other requests keep running, and admission is
+bounded so a burst of logins queues here instead of piling onto the CPU.
+Run `python calibrate_password_hashing.py` to pick parameters for a host.
+"""
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool's queue stays full for too long"""
+
+
+_executor = None
+_admission = None
+_pool_lock = threading.Lock()
+
+
+def _config(key, default):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+
+def _get_pool():
+    global _executor, _admission
+    with _pool_lock:
+        if _executor is None:
+            workers = _config('PASSWORD_HASH_WORKERS', 2)
+            queue_size = _config('PASSWORD_HASH_QUEUE', 16)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            # Running plus waiting jobs never exceed workers + queue_size
+            _admission = threading.BoundedSemaphore(workers + queue_size)
+        return _executor, _admission
+
+
+def _run_in_pool(func, *args):
+    executor, admission = _get_pool()
+    if not admission.acquire(timeout=_config('PASSWORD_HASH_ADMISSION_TIMEOUT', 5)):
+        raise PasswordHasherBusy("Too many password hashing requests in flight")
+    try:
+        return executor.submit(func, *args).result()
+    finally:
+        admission.release()
+
+
+@functools.lru_cache(maxsize=8)
+def normalize_method(method):
+    """Expand a method string to the full form stored in hashes ('scrypt' -> 'scrypt:32768:8:1')"""
+    return generate_password_hash('calibration', method=method, salt_length=1).split('$', 1)[0]
+
+
+def configured_method():
+    return normalize_method(_config('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+
+
+def hash_password(password):
+    return _run_in_pool(generate_password_hash, password, configured_method())
+
+
+def verify_password(password_hash, password):
+    return _run_in_pool(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True if a stored hash was made with parameters other than the configured ones"""
+    return password_hash.split('$', 1)[0] != configured_method()
@@ -0,0 +1,324 @@
+"""
+Pluggable HTML-to-PDF renderers
+
+Backends, selected with app.config['PDF_RENDERER']:
+
+    'wkhtmltopdf'  pdfkit/wkhtmltopdf, one process per call from the caller
+    'pool'         long-lived renderer processes fed over pipes
+    'simple'       pure-Python text layout, no external binary
+    'auto'         pool of wkhtmltopdf workers if the binary is installed,
+                   otherwise the simple renderer (default)
+"""
+import atexit
+import multiprocessing
+import queue
+import shutil
+import threading
+from html.parser import HTMLParser
+
+try:
+    import pdfkit
+    PDFKIT_AVAILABLE = True
+except ImportError:
+    PDFKIT_AVAILABLE = False
+
+
+class RenderError(Exception):
+    pass
+
+
+class PdfRenderer:
+    """Interface: render an HTML document to PDF bytes"""
+
+    name = 'base'
+
+    def render(self, html):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class WkhtmltopdfRenderer(PdfRenderer):
+    name = 'wkhtmltopdf'
+
+    def render(self, html):
+        if not PDFKIT_AVAILABLE:
+            raise RenderError("pdfkit is not installed")
+        try:
+            return pdfkit.from_string(html, False)
+        except OSError as e:
+            raise RenderError(str(e))
+
+
+class _TextExtractor(HTMLParser):
+    """Flatten report HTML into (style, text) blocks"""
+
+    BLOCK_TAGS = {'h1': 'title', 'h2': 'heading', 'h3': 'heading', 'p': 'body', 'div': 'body', 'li': 'body'}
+
+    def __init__(self):
+        super().__init__()
+        self.blocks = []
+        self._style = 'body'
+        self._text = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('style', 'script', 'head'):
+            self._skip += 1
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+            self._style = self.BLOCK_TAGS[tag]
+        elif tag == 'br':
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in ('style', 'script', 'head'):
+            self._skip -= 1
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+            self._style = 'body'
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._text.append(data)
+
+    def _flush(self):
+        text = ' '.join(''.join(self._text).split())
+        if text:
+            self.blocks.append((self._style, text))
+        self._text = []
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+class SimplePdfRenderer(PdfRenderer):
+    """
+    Minimal pure-Python PDF writer
+
+    Keeps headings and paragraphs but drops CSS layout; good enough for
+    text reports when wkhtmltopdf is unavailable.
+    """
+
+    name = 'simple'
+
+    PAGE_WIDTH = 612  # US Letter in points
+    PAGE_HEIGHT = 792
+    MARGIN = 56
+    STYLES = {
+        # style: (font resource, size, space before)
+        'title': ('F2', 18, 12),
+        'heading': ('F2', 13, 10),
+        'body': ('F1', 11, 4),
+    }
+
+    def render(self, html):
+        parser = _TextExtractor()
+        parser.feed(html)
+        parser.close()
+        return self._build_pdf(self._layout(parser.blocks))
+
+    def _layout(self, blocks):
+        """Wrap blocks into lines and split them into pages of content streams"""
+        pages = []
+        ops = []
+        y = self.PAGE_HEIGHT - self.MARGIN
+        usable_width = self.PAGE_WIDTH - 2 * self.MARGIN
+
+        for style, text in blocks:
+            font, size, space_before = self.STYLES[style]
+            leading = size * 1.3
+            # Helvetica averages roughly half an em per character
+            max_chars = max(int(usable_width / (size * 0.5)), 10)
+            y -= space_before
+
+            for line in self._wrap(text, max_chars):
+                if y - leading < self.MARGIN:
+                    pages.append('\n'.join(ops))
+                    ops = []
+                    y = self.PAGE_HEIGHT - self.MARGIN
+                y -= leading
+                ops.append(f"BT /{font} {size} Tf {self.MARGIN} {y:.1f} Td ({self._escape(line)}) Tj ET")
+
+        pages.append('\n'.join(ops))
+        return pages
+
+    @staticmethod
+    def _wrap(text, max_chars):
+        line = ''
+        for word in text.split(' '):
+            if line and len(line) + 1 + len(word) > max_chars:
+                yield line
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        if line:
+            yield line
+
+    @staticmethod
+    def _escape(text):
+        text = text.encode('latin-1', 'replace').decode('latin-1')
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    def _build_pdf(self, page_streams):
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            None,  # page tree, filled in once page object ids are known
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        ]
+        page_ids = []
+        for stream in page_streams:
+            content = stream.encode('latin-1')
+            objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+            content_id = len(objects)
+            objects.append((
+                "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                "/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+                % (self.PAGE_WIDTH, self.PAGE_HEIGHT, content_id)
+            ).encode('ascii'))
+            page_ids.append(len(objects))
+        kids = ' '.join(f"{page_id} 0 R" for page_id in page_ids)
+        objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode('ascii')
+
+        out = bytearray(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        xref_offset = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        for offset in offsets:
+            out += b"%010d 00000 n \n" % offset
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+        return bytes(out)
+
+
+_ENGINES = {
+    'wkhtmltopdf': WkhtmltopdfRenderer,
+    'simple': SimplePdfRenderer,
+}
+
+
+def _pool_worker(conn, engine_name):
+    """Renderer process loop: receive HTML, send back ('ok', pdf) or ('error', message)"""
+    engine = _ENGINES[engine_name]()
+    while True:
+        try:
+            html = conn.recv()
+        except EOFError:
+            break
+        if html is None:
+            break
+        try:
+            conn.send(('ok', engine.render(html)))
+        except Exception as e:
+            conn.send(('error', str(e)))
+    conn.close()
+
+
+class RendererPool(PdfRenderer):
+    """
+    Fixed set of long-lived renderer processes, each reached over a pipe
+
+    Callers borrow an idle worker per render, so concurrent renders are
+    bounded by the pool size. A worker that times out or dies is replaced.
+    """
+
+    name = 'pool'
+
+    def __init__(self, engine='wkhtmltopdf', size=2, timeout=60):
+        self.engine = engine
+        self.timeout = timeout
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._workers = []
+        for _ in range(size):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_pool_worker, args=(child_conn, self.engine), daemon=True)
+        process.start()
+        child_conn.close()
+        self._workers.append(process)
+        return process, parent_conn
+
+    def render(self, html):
+        try:
+            process, conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RenderError("No renderer worker became available")
+
+        try:
+            conn.send(html)
+            if not conn.poll(self.timeout):
+                raise RenderError("Renderer worker timed out")
+            status, result = conn.recv()
+        except BaseException:
+            # The worker is in an unknown state; replace it
+            process.kill()
+            conn.close()
+            self._workers.remove(process)
+            self._idle.put(self._start_worker())
+            raise
+
+        self._idle.put((process, conn))
+        if status == 'error':
+            raise RenderError(result)
+        return result
+
+    def close(self):
+        while True:
+            try:
+                process, conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        for process in self._workers:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+        self._workers = []
+
+
+def wkhtmltopdf_installed():
+    return PDFKIT_AVAILABLE and shutil.which('wkhtmltopdf') is not None
+
+
+def create_renderer(name, pool_size=2):
+    """Build a renderer by configuration name"""
+    if name == 'auto':
+        if wkhtmltopdf_installed():
+            return RendererPool('wkhtmltopdf', size=pool_size)
+        return SimplePdfRenderer()
+    if name == 'pool':
+        engine = 'wkhtmltopdf' if wkhtmltopdf_installed() else 'simple'
+        return RendererPool(engine, size=pool_size)
+    if name in _ENGINES:
+        return _ENGINES[name]()
+    raise ValueError(f"Unknown PDF renderer: {name}")
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """Per-process renderer built from the app config on first use"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            from flask import current_app
+            _renderer = create_renderer(
+                current_app.config.get('PDF_RENDERER', 'auto'),
+                pool_size=current_app.config.get('PDF_RENDERER_WORKERS', 2)
+            )
+            atexit.register(_renderer.close)
+        return _renderer
@@ -0,0 +1,202 @@
+"""
+Per-route rate limiting with a sliding-window counter
+
+    @app.route('/login', methods=['GET', 'POST'])
+    @rate_limit('10/minute', key='ip', methods=['POST'])
+    def login(): ...
+
+Each limit keeps two fixed-window counters per key and weights the previous
+window by how much of it still overlaps the sliding window, which costs one
+dict update (or one Redis round trip) per check.
+
+Backends, chosen with RATELIMIT_BACKEND:
+    'memory'  per-process counters (default)
+    'redis'   counters shared by every worker, via RATELIMIT_REDIS_URL
+"""
+import functools
+import math
+import threading
+import time
+
+from flask import current_app, request, jsonify, render_template
+from flask_login import current_user
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(limit):
+    """Parse '10/minute' or '100/5minute' into (count, window seconds)"""
+    count, _, period = limit.partition('/')
+    multiplier = ''
+    while period and period[0].isdigit():
+        multiplier += period[0]
+        period = period[1:]
+    return int(count), _PERIODS[period.rstrip('s')] * int(multiplier or 1)
+
+
+class MemoryBackend:
+    """Counters for this worker process only"""
+
+    PRUNE_EVERY = 10000
+
+    def __init__(self):
+        self._counters = {}  # key -> [window_start, current, previous, window]
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def hit(self, key, window, now):
+        start = int(now // window) * window
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None or entry[0] < start - window:
+                entry = [start, 0, 0, window]
+            elif entry[0] == start - window:
+                entry = [start, 0, entry[1], window]
+            entry[1] += 1
+            self._counters[key] = entry
+
+            self._hits += 1
+            if self._hits % self.PRUNE_EVERY == 0:
+                self._prune(now)
+            return entry[1], entry[2], start
+
+    def _prune(self, now):
+        # Entries idle for two of their own windows can no longer affect any decision
+        for key in [key for key, entry in self._counters.items() if entry[0] < now - 2 * entry[3]]:
+            del self._counters[key]
+
+
+class RedisBackend:
+    """
+    Counters shared by all workers through Redis
+
+    Fails open: while Redis is unreachable every hit is allowed (and the
+    outage logged at most once per ERROR_LOG_INTERVAL), so login and
+    booking keep working without rate limits.
+    """
+
+    ERROR_LOG_INTERVAL = 60
+
+    def __init__(self, url):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("RATELIMIT_BACKEND='redis' requires the redis package")
+        self._client = redis.Redis.from_url(url)
+        self._last_error_logged = 0.0
+
+    def hit(self, key, window, now):
+        start = int(now // window) * window
+        current_key = f"rl:{key}:{start}"
+        pipe = self._client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, window * 2)
+        pipe.get(f"rl:{key}:{start - window}")
+        try:
+            current, _, previous = pipe.execute()
+        except redis.RedisError as e:
+            if now - self._last_error_logged >= self.ERROR_LOG_INTERVAL:
+                self._last_error_logged = now
+                current_app.logger.warning(f"Rate limiting disabled, Redis unavailable: {e}")
+            return 0, 0, start
+        return int(current), int(previous or 0), start
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if current_app.config.get('RATELIMIT_BACKEND', 'memory') == 'redis':
+                _backend = RedisBackend(current_app.config['RATELIMIT_REDIS_URL'])
+            else:
+                _backend = MemoryBackend()
+        return _backend
+
+
+def check_limit(key, count, window):
+    """
+    Record a hit and decide whether it is over the limit
+
+    Returns:
+        None if allowed, otherwise seconds until a retry can succeed
+    """
+    now = time.time()
+    current, previous, start = get_backend().hit(key, window, now)
+    elapsed = now - start
+    weighted = previous * (1 - elapsed / window) + current
+    if weighted <= count:
+        return None
+
+    if current > count or previous == 0:
+        # Only the next window can bring this key back under the limit
+        return max(1, math.ceil(window - elapsed))
+    # Wait until enough of the previous window has slid out
+    return max(1, math.ceil((weighted - count) / previous * window))
+
+
+def _client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def _resolve_key(key):
+    if callable(key):
+        return key()
+    if key == 'ip':
+        return _client_ip()
+    if key == 'user':
+        if current_user.is_authenticated:
+            return f"user:{current_user.get_id()}"
+        return f"ip:{_client_ip()}"
+    raise ValueError(f"Unknown rate limit key: {key}")
+
+
+def too_many_requests(retry_after, as_json=False):
+    if as_json or request.path.startswith('/api/') or request.is_json:
+        response = jsonify({'error': 'Too many requests', 'retry_after': retry_after})
+    else:
+        response = current_app.make_response(
+            render_template('error.html', error_code=429, error_message='Too many requests. Please slow down.')
+        )
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limit(limit, key='ip', methods=None, scope=None, as_json=False):
+    """
+    Limit how often a view can be hit
+
+    Args:
+        limit: 'count/period', e.g. '10/minute', '1000/day'
+        key: 'ip', 'user' (falls back to ip when anonymous) or a callable
+             returning the identity to count against (None skips the check)
+        methods: Only count these HTTP methods (all methods when None)
+        scope: Bucket name; defaults to the view function name
+        as_json: Answer with a JSON error instead of the HTML error page
+    """
+    count, window = parse_limit(limit)
+    key_name = key if isinstance(key, str) else getattr(key, '__name__', 'custom')
+
+    def decorator(view):
+        bucket = scope or view.__name__
+
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            if current_app.config.get('RATELIMIT_ENABLED', True) and (methods is None or request.method in methods):
+                identity = _resolve_key(key)
+                if identity is not None:
+                    retry_after = check_limit(f"{bucket}:{key_name}:{limit}:{identity}", count, window)
+                    if retry_after is not None:
+                        current_app.logger.warning(f"Rate limit {limit} hit on {bucket} for {identity}")
+                        return too_many_requests(retry_after, as_json)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
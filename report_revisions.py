@@ -0,0 +1,191 @@
+"""
+Revision history for patient reports
+
+Each save of a report is stored as a revision. Most revisions hold only a
+token-level delta against the previous one; every SNAPSHOT_INTERVAL-th
+revision holds the full text, so rebuilding any revision replays at most
+SNAPSHOT_INTERVAL - 1 deltas from a single range query.
+"""
+import difflib
+import json
+import re
+
+from extensions import db
+from models import PatientReport, PatientReportRevision
+
+TRACKED_FIELDS = ('diagnosis', 'treatment_plan', 'recommendations', 'next_appointment')
+FIELD_LABELS = {
+    'diagnosis': 'Diagnosis',
+    'treatment_plan': 'Treatment Plan',
+    'recommendations': 'Recommendations',
+    'next_appointment': 'Next Appointment',
+}
+SNAPSHOT_INTERVAL = 10
+
+_TOKEN_RE = re.compile(r'\S+|\s+')
+
+
+def report_fields(report):
+    """Current values of the tracked fields, as JSON-friendly strings"""
+    return {
+        'diagnosis': report.diagnosis,
+        'treatment_plan': report.treatment_plan,
+        'recommendations': report.recommendations,
+        'next_appointment': report.next_appointment.isoformat() if report.next_appointment else None,
+    }
+
+
+def _text_delta(old, new):
+    """
+    Encode new as edits against old
+
+    Ops: [n] keeps n tokens, [-n] drops n tokens, "text" inserts text.
+    """
+    old_tokens = _TOKEN_RE.findall(old or '')
+    new_tokens = _TOKEN_RE.findall(new or '')
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+        else:
+            if i2 > i1:
+                ops.append(-(i2 - i1))
+            if j2 > j1:
+                ops.append(''.join(new_tokens[j1:j2]))
+    return ops
+
+
+def _apply_text_delta(old, ops):
+    old_tokens = _TOKEN_RE.findall(old or '')
+    position = 0
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        elif op >= 0:
+            parts.extend(old_tokens[position:position + op])
+            position += op
+        else:
+            position -= op
+    return ''.join(parts)
+
+
+def _encode_delta(previous, current):
+    delta = {}
+    for field in TRACKED_FIELDS:
+        if previous.get(field) == current.get(field):
+            continue
+        if field == 'next_appointment' or current.get(field) is None:
+            # Short or null values are cheaper to store whole
+            delta[field] = {'set': current.get(field)}
+        else:
+            delta[field] = {'ops': _text_delta(previous.get(field), current.get(field))}
+    return delta
+
+
+def _apply_delta(fields, delta):
+    fields = dict(fields)
+    for field, change in delta.items():
+        if 'set' in change:
+            fields[field] = change['set']
+        else:
+            fields[field] = _apply_text_delta(fields.get(field), change['ops'])
+    return fields
+
+
+def _add_revision(report_id, number, is_snapshot, data, user_id):
+    revision = PatientReportRevision()
+    revision.report_id = report_id
+    revision.revision = number
+    revision.is_snapshot = is_snapshot
+    revision.data = json.dumps(data, separators=(',', ':'))
+    revision.created_by = user_id
+    db.session.add(revision)
+    return revision
+
+
+def latest_revision_number(report_id):
+    return db.session.query(db.func.max(PatientReportRevision.revision)).filter(
+        PatientReportRevision.report_id == report_id
+    ).scalar() or 0
+
+
+def record_revision(report, previous_fields, user_id):
+    """
+    Store the report's current fields as a new revision
+
+    Args:
+        report: PatientReport with its new values (flushed, so it has an id)
+        previous_fields: report_fields() captured before the edit, or None
+                         for a newly created report
+        user_id: Id of the user making the edit
+
+    Returns:
+        The new PatientReportRevision, or None if nothing changed
+    """
+    current = report_fields(report)
+    # Concurrent saves of one report wait here, so each numbers its revision
+    # after the other's is in. SQLite ignores FOR UPDATE; there the flushed
+    # write of the report already holds the database lock
+    db.session.query(PatientReport.id).filter(PatientReport.id == report.id).with_for_update().one()
+    last = latest_revision_number(report.id)
+
+    if last == 0 and previous_fields is not None:
+        # Report predates revision tracking: keep its original text as revision 1
+        _add_revision(report.id, 1, True, previous_fields, None)
+        last = 1
+
+    if last and previous_fields == current:
+        return None
+
+    number = last + 1
+    if (number - 1) % SNAPSHOT_INTERVAL == 0:
+        return _add_revision(report.id, number, True, current, user_id)
+    return _add_revision(report.id, number, False, _encode_delta(previous_fields, current), user_id)
+
+
+def reconstruct_revision(report_id, number):
+    """
+    Rebuild a revision's fields from the nearest snapshot at or before it
+
+    Returns:
+        Dict of field values, or None if the revision does not exist
+    """
+    snapshot_number = ((number - 1) // SNAPSHOT_INTERVAL) * SNAPSHOT_INTERVAL + 1
+    rows = db.session.query(
+        PatientReportRevision.revision,
+        PatientReportRevision.is_snapshot,
+        PatientReportRevision.data
+    ).filter(
+        PatientReportRevision.report_id == report_id,
+        PatientReportRevision.revision.between(snapshot_number, number)
+    ).order_by(PatientReportRevision.revision).all()
+
+    if not rows or rows[-1].revision != number:
+        return None
+
+    fields = {}
+    for row in rows:
+        data = json.loads(row.data)
+        fields = data if row.is_snapshot else _apply_delta(fields, data)
+    return fields
+
+
+def side_by_side_diff(old_fields, new_fields):
+    """
+    HTML side-by-side tables for each changed field
+
+    Returns:
+        List of (field label, HTML table) tuples
+    """
+    html_diff = difflib.HtmlDiff(wrapcolumn=70)
+    tables = []
+    for field in TRACKED_FIELDS:
+        old = old_fields.get(field) or ''
+        new = new_fields.get(field) or ''
+        if old == new:
+            continue
+        tables.append((FIELD_LABELS[field], html_diff.make_table(old.splitlines(), new.splitlines(),
+                                                                  'Previous', 'This revision')))
+    return tables
@@ -0,0 +1,176 @@
+"""
+Patient report PDF rendering, run through the background job queue
+
+A report's PDF is identified by a hash of the fields it is rendered from
+(including the patient's and doctor's profile details) plus the report
+template version. Unchanged reports are never re-rendered,
+and previously rendered content is reused from a bounded on-disk cache.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from flask import current_app
+
+from extensions import db
+from models import User, PatientInfo, DoctorInfo, PatientReport, BackgroundJob
+from jobs import register_job, enqueue_job, submit_job
+from disk_cache import DiskLRUCache
+from utils import create_pdf_report, REPORT_TEMPLATE_VERSION
+from downloads import get_private_folder, signed_download_url
+
+
+def get_report_pdf_path(report_id):
+    """Filesystem path of a report's rendered PDF (outside the public static folder)"""
+    return os.path.join(get_private_folder('reports'), f"report_{report_id}.pdf")
+
+
+_pdf_caches = {}
+_pdf_caches_lock = threading.Lock()
+
+
+def report_query():
+    """PatientReport query that loads both profiles shown in the PDF in the same SELECT"""
+    return PatientReport.query.options(
+        db.joinedload(PatientReport.patient).joinedload(PatientInfo.user),
+        db.joinedload(PatientReport.doctor).joinedload(DoctorInfo.user)
+    )
+
+
+def get_pdf_cache():
+    """The worker's PDF cache for the configured folder, shared by all threads"""
+    folder = current_app.config['PDF_CACHE_FOLDER']
+    with _pdf_caches_lock:
+        cache = _pdf_caches.get(folder)
+        if cache is None:
+            cache = _pdf_caches[folder] = DiskLRUCache(
+                folder,
+                current_app.config['PDF_CACHE_MAX_BYTES'],
+                suffix='.pdf'
+            )
+        return cache
+
+
+def report_content_hash(report):
+    """Hash of everything that ends up in the report PDF"""
+    parts = [
+        REPORT_TEMPLATE_VERSION,
+        report.id,
+        report.patient_id,
+        report.doctor_id,
+        report.report_date.isoformat() if report.report_date else '',
+        report.diagnosis or '',
+        report.treatment_plan or '',
+        report.recommendations or '',
+        report.next_appointment.isoformat() if report.next_appointment else '',
+    ]
+    # Names, email and specialization printed in the PDF header; load the
+    # report with report_query() to avoid a query per relationship
+    patient = report.patient.user if report.patient else None
+    doctor = report.doctor.user if report.doctor else None
+    parts += [
+        patient.get_full_name() if patient else '',
+        patient.email if patient else '',
+        doctor.get_full_name() if doctor else '',
+        report.doctor.specialization if report.doctor else '',
+    ]
+    raw = '\x1f'.join(str(part) for part in parts)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def is_report_pdf_fresh(report):
+    """True if the rendered PDF matches the report's current fields and template"""
+    return (report.status == 'ready'
+            and report.pdf_path is not None
+            and report.content_hash == report_content_hash(report))
+
+
+def get_report_pdf_url(report, user_id):
+    """Signed URL of the report's PDF for a user, or None while it is pending, failed or stale"""
+    if not is_report_pdf_fresh(report):
+        return None
+    return signed_download_url('reports', report.pdf_path, user_id)
+
+
+def queue_report_pdf(report):
+    """
+    Mark a report's PDF as pending and enqueue its rendering
+
+    Adds the job to the current session; commit, then submit_job(job.id).
+    """
+    report.status = 'pending'
+    return enqueue_job('render_report_pdf', {'report_id': report.id})
+
+
+def report_pdf_status(report):
+    """The report's PDF status, 'pending' for a ready PDF that is stale"""
+    if report.status == 'ready' and not is_report_pdf_fresh(report):
+        return 'pending'
+    return report.status
+
+
+def refresh_stale_report_pdf(report):
+    """
+    Queue re-rendering of a ready PDF whose fields, profiles or template changed
+
+    Only a job row is written here (once per report while one is waiting);
+    the job itself marks the report pending and renders it.
+    """
+    if report.status != 'ready' or is_report_pdf_fresh(report):
+        return
+    payload = {'report_id': report.id}
+    waiting = BackgroundJob.query.filter(
+        BackgroundJob.job_type == 'refresh_report_pdf',
+        BackgroundJob.payload == json.dumps(payload),
+        BackgroundJob.status.in_(('queued', 'running'))
+    ).first()
+    if waiting is None:
+        job = enqueue_job('refresh_report_pdf', payload)
+        db.session.commit()
+        submit_job(job.id)
+
+
+def _mark_report_failed(error, report_id):
+    report = db.session.get(PatientReport, report_id)
+    if report is not None:
+        report.status = 'failed'
+
+
+@register_job('refresh_report_pdf', on_failure=_mark_report_failed)
+def refresh_report_pdf(report_id):
+    report = db.session.get(PatientReport, report_id)
+    if report is None or is_report_pdf_fresh(report):
+        return
+    report.status = 'pending'
+    db.session.commit()
+    render_report_pdf(report_id)
+
+
+@register_job('render_report_pdf', on_failure=_mark_report_failed)
+def render_report_pdf(report_id):
+    report = db.session.get(PatientReport, report_id)
+    if report is None:
+        # Report was deleted while the job was queued
+        return
+
+    content_hash = report_content_hash(report)
+    pdf_path = get_report_pdf_path(report.id)
+    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+
+    # Reuse an earlier rendering of identical content when it is still cached
+    cache = get_pdf_cache()
+    if not cache.copy_to(content_hash, pdf_path):
+        patient = db.session.get(User, report.patient.user_id)
+        doctor = db.session.get(User, report.doctor.user_id)
+
+        if not create_pdf_report(report, patient, doctor, pdf_path):
+            raise RuntimeError(f"PDF rendering failed for report {report.id}")
+
+        with open(pdf_path, 'rb') as f:
+            cache.put_bytes(content_hash, f.read())
+
+    report.pdf_path = os.path.basename(pdf_path)
+    report.content_hash = content_hash
+    report.status = 'ready'
+    db.session.commit()
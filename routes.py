@@ -1,36 +1,76 @@
 import os
 from datetime import datetime, time, timedelta
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory, abort
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory, send_file, abort, Response, stream_with_context, session
 from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash
-import pdfkit
+from werkzeug.utils import secure_filename
 
 from app import app, db
-from models import User, DoctorInfo, PatientInfo, Availability, Appointment, CallSession, PatientReport, Complaint, SliderImage, ChatConversation, ChatMessage
+from models import User, DoctorInfo, PatientInfo, Availability, Appointment, CallSession, PatientReport, Complaint, SliderImage, ChatConversation, ChatMessage, ChatAttachment, ScheduleVersion, PatientReportRevision, format_full_name
 from forms import AvailabilityForm, BookAppointmentForm, ComplaintForm, PatientReportForm, SliderImageForm, ChatMessageForm
-from utils import get_availability_slots, create_pdf_report
-
-try:
-    import pdfkit
-    PDFKIT_AVAILABLE = True
-except ImportError:
-    PDFKIT_AVAILABLE = False
+from utils import get_availability_slots
+from http_cache import make_etag, is_not_modified, set_validators, not_modified
+from attachments import store_stream, blob_path, AttachmentTooLarge, INLINE_CONTENT_TYPES
+from jobs import submit_job
+from reports import (queue_report_pdf, get_report_pdf_url, is_report_pdf_fresh, refresh_stale_report_pdf,
+                     report_query, report_pdf_status)
+from pdf_renderers import get_renderer
+from exports import stream_zip, patient_export_entries
+from downloads import get_private_folder, signed_download_url, verify_download
+from user_cache import invalidate_user, stats as user_cache_stats
+from app_cache import memoize, invalidate, get_cache
+from template_cache import stats as template_stats
+from metrics import render as render_metrics, is_scrape_request
+from slow_queries import aggregate as aggregate_slow_queries
+from ratelimit import rate_limit
+from page_cache import cached_page, cached_fragment, bump_fragment
+from directory import shared_search_doctors, load_doctor_users, specialization_facets, decode_cursor, PAGE_SIZE, SORTS
+from search_index import search_users, ensure_started as ensure_search_index_started
+from api_tokens import token_or_login_required, revoke_user_tokens, bearer_user_id
+from report_revisions import report_fields, record_revision, reconstruct_revision, latest_revision_number, side_by_side_diff
+
+
+@app.before_request
+def start_search_index():
+    # Built in the background on each worker's first request
+    ensure_search_index_started(app)
 
 
 # Common routes
+def load_active_sliders():
+    sliders = SliderImage.query.filter_by(is_active=True).order_by(SliderImage.display_order).all()
+    # Detached so the list can be shared across requests
+    for slider in sliders:
+        db.session.expunge(slider)
+    return sliders
+
+
+def load_approved_doctors():
+    doctors = User.query.join(DoctorInfo).options(
+        db.contains_eager(User.doctor_info)
+    ).filter(User.role == 'doctor', DoctorInfo.is_approved == True).all()
+    # Expunging cascades to doctor_info, which is already loaded
+    for doctor in doctors:
+        db.session.expunge(doctor)
+    return doctors
+
+
 @app.route('/')
+@cached_page('sliders', 'doctors')
 def index():
-    sliders = SliderImage.query.filter_by(is_active=True).order_by(SliderImage.display_order).all()
-    doctors = User.query.join(DoctorInfo).filter(User.role == 'doctor', DoctorInfo.is_approved == True).all()
+    sliders = cached_fragment('sliders', load_active_sliders)
+    doctors = cached_fragment('doctors', load_approved_doctors)
     return render_template('index.html', sliders=sliders, doctors=doctors)
 
 
 @app.route('/about')
+@cached_page()
 def about():
     return render_template('about.html')
 
 
 @app.route('/contact')
+@cached_page()
 def contact():
     return render_template('contact.html')
 
@@ -69,19 +109,74 @@ def patient_doctors():
         flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Get all approved doctors
-    doctors = User.query.join(DoctorInfo).filter(
-        User.role == 'doctor',
-        DoctorInfo.is_approved == True
-    ).all()
+    filters = directory_filters()
+    if filters is None:
+        flash('Invalid search filters', 'warning')
+        return redirect(url_for('patient_doctors'))
     
-    # Get specializations for filtering
-    specializations = db.session.query(DoctorInfo.specialization).distinct().all()
-    specializations = [s[0] for s in specializations]
+    # The search is shared with concurrent identical ones as plain rows; the
+    # template gets the doctors' User objects, loaded in one query
+    rows, next_cursor = shared_search_doctors(**filters)
+    doctors = load_doctor_users(rows)
+    next_available = {row['user_id']: row['next_available_in_days'] for row in rows}
+    
+    # Facet list and counts come from a cached aggregate
+    facets = specialization_facets()
+    specializations = [specialization for specialization, _ in facets]
     
     return render_template('patient/doctors.html', 
                            doctors=doctors, 
-                           specializations=specializations)
+                           specializations=specializations,
+                           specialization_counts=dict(facets),
+                           next_available=next_available,
+                           filters=filters,
+                           next_cursor=next_cursor)
+
+
+def int_arg(name, default=None):
+    # Unlike request.args.get(type=int), malformed values raise ValueError;
+    # empty ones (a blank form field) mean "not given"
+    value = request.args.get(name, '').strip()
+    return int(value) if value else default
+
+
+def directory_filters():
+    """Directory search arguments from the query string, or None if any are malformed"""
+    try:
+        filters = {
+            'specialization': request.args.get('specialization') or None,
+            'min_experience': int_arg('min_experience'),
+            'max_experience': int_arg('max_experience'),
+            'available_within': int_arg('available_within'),
+            'sort': request.args.get('sort', 'experience'),
+            'cursor': request.args.get('cursor') or None,
+            'limit': int_arg('limit', PAGE_SIZE),
+        }
+    except ValueError:
+        return None
+    if filters['sort'] not in SORTS:
+        return None
+    if filters['cursor'] and decode_cursor(filters['cursor']) is None:
+        return None
+    return filters
+
+
+@app.route('/api/doctors')
+@token_or_login_required
+def api_doctors():
+    if not current_user.is_patient():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    filters = directory_filters()
+    if filters is None:
+        return jsonify({'error': 'Invalid search filters'}), 400
+    
+    doctors, next_cursor = shared_search_doctors(**filters)
+    return jsonify({
+        'doctors': doctors,
+        'next_cursor': next_cursor,
+        'specializations': [{'name': name, 'count': count} for name, count in specialization_facets()]
+    })
 
 
 @app.route('/patient/book_appointment/<int:doctor_id>', methods=['GET', 'POST'])
@@ -114,8 +209,10 @@ def book_appointment(doctor_id):
         selected_date = appointment_date
         day_of_week = selected_date.weekday()  # 0 = Monday, 6 = Sunday
         
-        # Get doctor's availability for this day
-        availabilities = Availability.query.filter_by(
+        # Get doctor's availability for this day (only the time columns are needed)
+        availabilities = db.session.query(
+            Availability.start_time, Availability.end_time
+        ).filter_by(
             doctor_id=doctor_id,
             day_of_week=day_of_week,
             is_active=True,
@@ -123,7 +220,9 @@ def book_appointment(doctor_id):
         ).all()
         
         # Also check for specific date availability
-        specific_availabilities = Availability.query.filter_by(
+        specific_availabilities = db.session.query(
+            Availability.start_time, Availability.end_time
+        ).filter_by(
             doctor_id=doctor_id,
             specific_date=selected_date,
             is_active=True,
@@ -133,7 +232,9 @@ def book_appointment(doctor_id):
         availabilities.extend(specific_availabilities)
         
         # Get existing appointments for this doctor on this date
-        existing_appointments = Appointment.query.filter_by(
+        existing_appointments = db.session.query(
+            Appointment.start_time, Appointment.end_time
+        ).filter_by(
             doctor_id=doctor_id,
             appointment_date=selected_date
         ).filter(
@@ -161,6 +262,7 @@ def book_appointment(doctor_id):
         appointment.notes = form.notes.data
         appointment.status = 'pending'
         db.session.add(appointment)
+        ScheduleVersion.bump(doctor_info.id, appointment.appointment_date)
         db.session.commit()
         
         # Create call session for this appointment
@@ -181,44 +283,65 @@ def book_appointment(doctor_id):
                            doctor_info=doctor_info)
 
 
-@app.route('/patient/get_available_slots', methods=['POST'])
-@login_required
+@memoize(ttl=300, tags=('doctor:{doctor_id}',))
+def compute_available_slots(doctor_id, selected_date, version):
+    """
+    Free slots of a doctor on a date, cached per schedule version
+
+    The version in the key keeps every worker's entries correct after a
+    change made elsewhere; the tag frees them as soon as it happens here.
+    """
+    # Get doctor's availability for this day (only the time columns are needed)
+    availabilities = db.session.query(
+        Availability.start_time, Availability.end_time
+    ).filter_by(
+        doctor_id=doctor_id,
+        day_of_week=selected_date.weekday(),
+        is_active=True
+    ).all()
+    
+    if not availabilities:
+        return []
+    
+    # Get existing appointments for this doctor on this date
+    existing_appointments = db.session.query(
+        Appointment.start_time, Appointment.end_time
+    ).filter_by(
+        doctor_id=doctor_id,
+        appointment_date=selected_date
+    ).filter(
+        Appointment.status.in_(['pending', 'confirmed'])
+    ).all()
+    
+    return get_availability_slots(availabilities, existing_appointments)
+
+
+@app.route('/patient/get_available_slots', methods=['GET', 'POST'])
+@token_or_login_required
+@rate_limit('60/minute', key='user', as_json=True)
 def get_available_slots():
     if not current_user.is_patient():
         return jsonify({'error': 'Access denied'}), 403
     
-    doctor_id = request.form.get('doctor_id')
-    date_str = request.form.get('date')
+    doctor_id = request.values.get('doctor_id')
+    date_str = request.values.get('date')
     
     if not doctor_id or not date_str:
         return jsonify({'error': 'Missing parameters'}), 400
     
     try:
+        doctor_id = int(doctor_id)
         selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        day_of_week = selected_date.weekday()  # 0 = Monday, 6 = Sunday
         
-        # Get doctor's availability for this day
-        availabilities = Availability.query.filter_by(
-            doctor_id=doctor_id,
-            day_of_week=day_of_week,
-            is_active=True
-        ).all()
+        # Answer revalidations from the schedule version before touching any slot rows
+        version, last_modified = ScheduleVersion.current(doctor_id, selected_date)
+        etag = make_etag('slots', doctor_id, selected_date, version)
+        if is_not_modified(etag, last_modified):
+            return not_modified(etag, last_modified)
         
-        if not availabilities:
-            return jsonify({'available_slots': []})
+        available_slots = compute_available_slots(doctor_id, selected_date, version)
         
-        # Get existing appointments for this doctor on this date
-        existing_appointments = Appointment.query.filter_by(
-            doctor_id=doctor_id,
-            appointment_date=selected_date
-        ).filter(
-            Appointment.status.in_(['pending', 'confirmed'])
-        ).all()
-        
-        # Calculate available slots
-        available_slots = get_availability_slots(availabilities, existing_appointments)
-        
-        return jsonify({'available_slots': available_slots})
+        return set_validators(jsonify({'available_slots': available_slots}), etag, last_modified)
     
     except Exception as e:
         app.logger.error(f"Error getting available slots: {str(e)}")
@@ -272,6 +395,7 @@ def cancel_appointment(appointment_id):
     
     # Cancel the appointment
     appointment.status = 'cancelled'
+    ScheduleVersion.bump(appointment.doctor_id, appointment.appointment_date)
     db.session.commit()
     
     flash('Appointment cancelled successfully', 'success')
@@ -352,17 +476,21 @@ def view_patient_report(report_id):
         flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
     
-    report = PatientReport.query.get_or_404(report_id)
+    # One query for the report and both profiles (the PDF freshness check reads them)
+    report = report_query().filter(PatientReport.id == report_id).first_or_404()
     
-    # Check if this report belongs to the current patient
-    if report.patient_id != current_user.patient_info.id:
+    # Check if this report belongs to the current patient (who may have no profile yet)
+    if current_user.patient_info is None or report.patient_id != current_user.patient_info.id:
         flash('Access denied', 'danger')
         return redirect(url_for('patient_reports'))
     
     # Get doctor details
-    doctor = User.query.get(report.doctor.user_id)
+    doctor = report.doctor.user
+    
+    refresh_stale_report_pdf(report)
     
-    return render_template('patient/view_report.html', report=report, doctor=doctor)
+    return render_template('patient/view_report.html', report=report, doctor=doctor,
+                           pdf_url=get_report_pdf_url(report, current_user.id))
 
 
 @app.route('/patient/complaint', methods=['GET', 'POST'])
@@ -382,6 +510,7 @@ def patient_complaint():
         complaint.status = 'open'
         db.session.add(complaint)
         db.session.commit()
+        invalidate('admin:dashboard')
         
         flash('Your complaint has been submitted successfully', 'success')
         return redirect(url_for('patient_dashboard'))
@@ -490,6 +619,10 @@ def doctor_availability():
                 db.session.add(availability)
                 slot_count += 1
         
+        if form.availability_type.data == 'recurring':
+            ScheduleVersion.bump(current_user.doctor_info.id)
+        else:
+            ScheduleVersion.bump(current_user.doctor_info.id, form.specific_date.data)
         db.session.commit()
         
         if form.availability_type.data == 'recurring':
@@ -541,6 +674,7 @@ def delete_availability(availability_id):
         return redirect(url_for('doctor_availability'))
     
     db.session.delete(availability)
+    ScheduleVersion.bump(availability.doctor_id, None if availability.is_recurring else availability.specific_date)
     db.session.commit()
     
     flash('Availability deleted successfully', 'success')
@@ -584,6 +718,7 @@ def update_appointment_status(appointment_id):
         return redirect(url_for('doctor_appointments'))
     
     appointment.status = status
+    ScheduleVersion.bump(appointment.doctor_id, appointment.appointment_date)
     db.session.commit()
     
     flash('Appointment status updated successfully', 'success')
@@ -659,6 +794,7 @@ def end_call(appointment_id):
     
     # Update appointment status
     appointment.status = 'completed'
+    ScheduleVersion.bump(appointment.doctor_id, appointment.appointment_date)
     
     db.session.commit()
     
@@ -700,7 +836,8 @@ def create_patient_report(appointment_id):
         existing_report = PatientReport.query.filter_by(appointment_id=appointment.id).first()
         
         if existing_report:
-            # Update existing report
+            # Update existing report, keeping the previous text as a revision
+            previous_fields = report_fields(existing_report)
             existing_report.diagnosis = form.diagnosis.data
             existing_report.treatment_plan = form.treatment_plan.data
             existing_report.recommendations = form.recommendations.data
@@ -717,23 +854,23 @@ def create_patient_report(appointment_id):
             report.recommendations = form.recommendations.data
             report.next_appointment = form.next_appointment.data
             db.session.add(report)
+            previous_fields = None
         
-        db.session.commit()
-        
-        # Generate PDF report
-        pdf_filename = f"report_{report.id}.pdf"
-        static_folder = app.static_folder if app.static_folder else 'static'
-        pdf_path = os.path.join(static_folder, 'reports', pdf_filename)
-        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+        db.session.flush()  # Get report ID for the render job
+        record_revision(report, previous_fields, current_user.id)
         
-        # Create PDF using the utility function
-        create_pdf_report(report, patient, current_user, pdf_path)
+        # Identical content keeps its existing PDF
+        if is_report_pdf_fresh(report):
+            db.session.commit()
+            flash('Patient report saved. No changes to the PDF.', 'success')
+            return redirect(url_for('doctor_appointments'))
         
-        # Update report with PDF path
-        report.pdf_path = pdf_filename
+        # Render the PDF in the background instead of holding this worker
+        job = queue_report_pdf(report)
         db.session.commit()
+        submit_job(job.id)
         
-        flash('Patient report created successfully', 'success')
+        flash('Patient report saved. The PDF will be available shortly.', 'success')
         return redirect(url_for('doctor_appointments'))
     
     # Pre-fill form if report exists
@@ -757,7 +894,8 @@ def doctor_view_patient_report(report_id):
         flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
     
-    report = PatientReport.query.get_or_404(report_id)
+    # One query for the report and both profiles (the PDF freshness check reads them)
+    report = report_query().filter(PatientReport.id == report_id).first_or_404()
     
     # Check if this report was created by the current doctor
     if report.doctor_id != current_user.doctor_info.id:
@@ -765,14 +903,122 @@ def doctor_view_patient_report(report_id):
         return redirect(url_for('doctor_appointments'))
     
     # Get patient details
-    patient = User.query.get(report.patient.user_id)
+    patient = report.patient.user
+    
+    refresh_stale_report_pdf(report)
     
     return render_template('doctor/view_patient_report.html', 
                            report=report, 
-                           patient=patient)
+                           patient=patient,
+                           pdf_url=get_report_pdf_url(report, current_user.id))
+
+
+def can_access_report(report, user):
+    """The report's patient, its authoring doctor and admins may access a report"""
+    # Accounts without a role profile own no reports
+    if user.is_patient():
+        return user.patient_info is not None and report.patient_id == user.patient_info.id
+    if user.is_doctor():
+        return user.doctor_info is not None and report.doctor_id == user.doctor_info.id
+    return user.is_admin()
+
+
+@app.route('/reports/<int:report_id>/status')
+@token_or_login_required
+def report_status(report_id):
+    report = report_query().filter(PatientReport.id == report_id).first_or_404()
+    
+    if not can_access_report(report, current_user):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # Read-only: a stale PDF shows as pending until the page view's refresh job renders it
+    return jsonify({'status': report_pdf_status(report), 'pdf_url': get_report_pdf_url(report, current_user.id)})
+
+
+@app.route('/export/patient/<int:patient_id>')
+@login_required
+def export_patient_record(patient_id):
+    patient_info = PatientInfo.query.get_or_404(patient_id)
+    
+    # Admins can export anyone; doctors only patients they have seen
+    if current_user.is_doctor():
+        treated = Appointment.query.filter_by(
+            patient_id=patient_info.id,
+            doctor_id=current_user.doctor_info.id
+        ).first()
+        if not treated:
+            flash('Access denied', 'danger')
+            return redirect(url_for('doctor_appointments'))
+    elif not current_user.is_admin():
+        flash('Access denied', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    # Built and sent chunk by chunk; no temp file holds the whole archive
+    archive = stream_zip(patient_export_entries(patient_info))
+    filename = f"patient_{patient_info.id}_record_{datetime.now().strftime('%Y%m%d')}.zip"
+    return Response(
+        stream_with_context(archive),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+@app.route('/reports/<int:report_id>/revisions')
+@login_required
+def report_revisions(report_id):
+    report = PatientReport.query.get_or_404(report_id)
+    
+    # Revision history is for clinicians and admins
+    if current_user.is_patient() or not can_access_report(report, current_user):
+        flash('Access denied', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    revisions = db.session.query(
+        PatientReportRevision.revision,
+        PatientReportRevision.created_at,
+        PatientReportRevision.created_by
+    ).filter(
+        PatientReportRevision.report_id == report.id
+    ).order_by(PatientReportRevision.revision.desc()).all()
+    
+    return render_template('doctor/report_revisions.html', report=report, revisions=revisions)
+
+
+@app.route('/reports/<int:report_id>/revisions/<int:revision>')
+@login_required
+def report_revision_diff(report_id, revision):
+    report = PatientReport.query.get_or_404(report_id)
+    
+    if current_user.is_patient() or not can_access_report(report, current_user):
+        flash('Access denied', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    fields = reconstruct_revision(report.id, revision)
+    if fields is None:
+        abort(404)
+    previous = reconstruct_revision(report.id, revision - 1) if revision > 1 else {}
+    
+    return render_template('doctor/report_revision_diff.html',
+                           report=report,
+                           revision=revision,
+                           latest_revision=latest_revision_number(report.id),
+                           fields=fields,
+                           diffs=side_by_side_diff(previous, fields))
 
 
 # Admin routes
+@memoize(ttl=30, tags=('admin:dashboard',))
+def admin_dashboard_counts():
+    """Dashboard statistics; admin actions invalidate them, signups show up within the TTL"""
+    return {
+        'total_patients': User.query.filter_by(role='patient').count(),
+        'total_doctors': User.query.filter_by(role='doctor').count(),
+        'total_appointments': Appointment.query.count(),
+        'pending_doctors': DoctorInfo.query.filter_by(is_approved=False).count(),
+        'open_complaints': Complaint.query.filter_by(status='open').count(),
+    }
+
+
 @app.route('/admin/dashboard')
 @login_required
 def admin_dashboard():
@@ -780,25 +1026,87 @@ def admin_dashboard():
         flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Count statistics
-    total_patients = User.query.filter_by(role='patient').count()
-    total_doctors = User.query.filter_by(role='doctor').count()
-    total_appointments = Appointment.query.count()
-    pending_doctors = DoctorInfo.query.filter_by(is_approved=False).count()
-    open_complaints = Complaint.query.filter_by(status='open').count()
+    counts = admin_dashboard_counts()
     
     # Get recent appointments
     recent_appointments = Appointment.query.order_by(Appointment.created_at.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html', 
-                           total_patients=total_patients,
-                           total_doctors=total_doctors,
-                           total_appointments=total_appointments,
-                           pending_doctors=pending_doctors,
-                           open_complaints=open_complaints,
+                           total_patients=counts['total_patients'],
+                           total_doctors=counts['total_doctors'],
+                           total_appointments=counts['total_appointments'],
+                           pending_doctors=counts['pending_doctors'],
+                           open_complaints=counts['open_complaints'],
                            recent_appointments=recent_appointments)
 
 
+@app.route('/metrics')
+def prometheus_metrics():
+    # Prometheus presents METRICS_SCRAPE_TOKEN; anyone else must be an admin
+    if not is_scrape_request():
+        return admin_prometheus_metrics()
+    return metrics_response()
+
+
+@token_or_login_required
+def admin_prometheus_metrics():
+    if not current_user.is_admin():
+        return jsonify({'error': 'Access denied'}), 403
+    return metrics_response()
+
+
+def metrics_response():
+    response = Response(render_metrics(app.extensions['metrics']), mimetype='text/plain')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.cache_control.no_store = True
+    return response
+
+
+@app.route('/admin/slow-queries')
+@login_required
+def admin_slow_queries():
+    if not current_user.is_admin():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify({
+        'threshold_ms': app.config['SLOW_QUERY_THRESHOLD_MS'],
+        'statements': aggregate_slow_queries(app.config['SLOW_QUERY_FOLDER'], limit),
+    })
+
+
+@app.route('/admin/template-stats')
+@login_required
+def admin_template_stats():
+    if not current_user.is_admin():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # Counts are per worker process
+    return jsonify({'routes': template_stats()})
+
+
+@app.route('/admin/cache-stats')
+@login_required
+def admin_cache_stats():
+    if not current_user.is_admin():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # Counts are per worker process
+    return jsonify({'app_cache': get_cache().stats(), 'user_cache': user_cache_stats()})
+
+
+@app.route('/admin/compression-stats')
+@login_required
+def admin_compression_stats():
+    if not current_user.is_admin():
+        return jsonify({'error': 'Access denied'}), 403
+
+    middleware = app.extensions.get('compression')
+    # Counts are per worker process
+    return jsonify({'enabled': middleware is not None,
+                    'routes': middleware.stats() if middleware is not None else []})
+
+
 @app.route('/admin/doctors')
 @login_required
 def admin_doctors():
@@ -824,6 +1132,9 @@ def approve_doctor(doctor_id):
     
     doctor_info.is_approved = True
     db.session.commit()
+    invalidate_user(doctor.id)
+    invalidate(f'doctor:{doctor_info.id}', 'admin:dashboard')
+    bump_fragment('doctors')
     
     flash(f'Doctor {doctor.username} has been approved', 'success')
     return redirect(url_for('admin_doctors'))
@@ -842,6 +1153,9 @@ def reject_doctor(doctor_id):
     # Delete doctor
     db.session.delete(doctor)
     db.session.commit()
+    invalidate_user(doctor_id)
+    invalidate(f'doctor:{doctor_info.id}', 'admin:dashboard')
+    bump_fragment('doctors')
     
     flash(f'Doctor {doctor.username} has been rejected and deleted', 'success')
     return redirect(url_for('admin_doctors'))
@@ -871,7 +1185,14 @@ def block_user(user_id):
     
     # Toggle active status
     user.is_active = not user.is_active
+    if not user.is_active:
+        revoke_user_tokens(user.id)
     db.session.commit()
+    invalidate_user(user.id)
+    if user.role == 'doctor':
+        if user.doctor_info:
+            invalidate(f'doctor:{user.doctor_info.id}')
+        bump_fragment('doctors')
     
     status = 'blocked' if not user.is_active else 'unblocked'
     flash(f'User {user.username} has been {status}', 'success')
@@ -901,8 +1222,16 @@ def delete_user(user_id):
     redirect_url = url_for('admin_patients') if user.role == 'patient' else url_for('admin_doctors')
     
     # Delete user
+    doctor_info_id = user.doctor_info.id if user.role == 'doctor' and user.doctor_info else None
+    revoke_user_tokens(user.id)
     db.session.delete(user)
     db.session.commit()
+    invalidate_user(user_id)
+    invalidate('admin:dashboard')
+    if user.role == 'doctor':
+        if doctor_info_id:
+            invalidate(f'doctor:{doctor_info_id}')
+        bump_fragment('doctors')
     
     flash(f'User {user.username} has been deleted', 'success')
     return redirect(redirect_url)
@@ -957,6 +1286,7 @@ def update_complaint(complaint_id):
         complaint.resolved_at = datetime.now()
     
     db.session.commit()
+    invalidate('admin:dashboard')
     
     flash('Complaint updated successfully', 'success')
     return redirect(url_for('admin_complaints'))
@@ -972,7 +1302,13 @@ def admin_recordings():
     # Get all completed call sessions with recordings
     call_sessions = CallSession.query.filter_by(status='completed').filter(CallSession.recording_path != None).all()
     
-    return render_template('admin/recordings.html', call_sessions=call_sessions)
+    # Recordings are private files; hand out short-lived signed links
+    recording_urls = {
+        call_session.id: signed_download_url('recordings', call_session.recording_path, current_user.id)
+        for call_session in call_sessions
+    }
+    
+    return render_template('admin/recordings.html', call_sessions=call_sessions, recording_urls=recording_urls)
 
 
 @app.route('/admin/slider', methods=['GET', 'POST'])
@@ -993,6 +1329,7 @@ def admin_slider():
         slider.is_active = form.is_active.data
         db.session.add(slider)
         db.session.commit()
+        bump_fragment('sliders')
         
         flash('Slider image added successfully', 'success')
         return redirect(url_for('admin_slider'))
@@ -1014,12 +1351,57 @@ def delete_slider(slider_id):
     
     db.session.delete(slider)
     db.session.commit()
+    bump_fragment('sliders')
     
     flash('Slider image deleted successfully', 'success')
     return redirect(url_for('admin_slider'))
 
 
+@app.route('/api/search/users')
+@token_or_login_required
+def search_users_typeahead():
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 10, type=int)
+    if len(query) < 1:
+        return jsonify({'results': []})
+    
+    if current_user.is_admin():
+        role = request.args.get('role')
+        roles = (role,) if role in ('patient', 'doctor', 'admin') else ('patient', 'doctor', 'admin')
+        entries = search_users(query, roles, limit=limit)
+        results = [{
+            'id': entry.id,
+            'name': format_full_name(entry.first_name, entry.last_name, entry.username),
+            'username': entry.username,
+            'email': entry.email,
+            'role': entry.role,
+            'specialization': entry.specialization,
+            'is_active': entry.is_active
+        } for entry in entries]
+    elif current_user.is_patient():
+        # Patients look up approved doctors by name or specialization only
+        entries = search_users(query, ('doctor',), public_only=True, approved_doctors_only=True, limit=limit)
+        results = [{
+            'id': entry.doctor_info_id,
+            'name': format_full_name(entry.first_name, entry.last_name, entry.username),
+            'specialization': entry.specialization
+        } for entry in entries]
+    else:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify({'results': results})
+
+
 # Chat functionality routes
+def is_conversation_participant(conversation, user):
+    """Patients and doctors may only access conversations they take part in"""
+    if user.is_patient():
+        return conversation.patient.user_id == user.id
+    if user.is_doctor():
+        return conversation.doctor.user_id == user.id
+    return False
+
+
 @app.route('/patient/chat')
 @login_required
 def patient_chat():
@@ -1060,16 +1442,12 @@ def chat_conversation(conversation_id):
     conversation = ChatConversation.query.get_or_404(conversation_id)
     
     # Check if user has access to this conversation
-    if current_user.is_patient():
-        if conversation.patient.user_id != current_user.id:
-            flash('Access denied', 'danger')
+    if not is_conversation_participant(conversation, current_user):
+        flash('Access denied', 'danger')
+        if current_user.is_patient():
             return redirect(url_for('patient_chat'))
-    elif current_user.is_doctor():
-        if conversation.doctor.user_id != current_user.id:
-            flash('Access denied', 'danger')
+        elif current_user.is_doctor():
             return redirect(url_for('doctor_chat'))
-    else:
-        flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
     
     # Mark messages as read for the current user
@@ -1137,31 +1515,197 @@ def start_chat_with_doctor(doctor_id):
     return redirect(url_for('chat_conversation', conversation_id=conversation.id))
 
 
+def get_chat_message_rows(conversation_id):
+    """
+    Fetch a conversation's messages with their sender names as plain rows
+    
+    Selects only the serialized columns and joins the sender in the same
+    statement, so no ChatMessage or User entities are built.
+    """
+    return db.session.query(
+        ChatMessage.id,
+        ChatMessage.sender_id,
+        ChatMessage.message_text,
+        ChatMessage.created_at,
+        ChatMessage.message_type,
+        ChatAttachment.id,
+        User.first_name,
+        User.last_name,
+        User.username
+    ).join(
+        User, ChatMessage.sender_id == User.id
+    ).outerjoin(
+        ChatAttachment, ChatAttachment.message_id == ChatMessage.id
+    ).filter(
+        ChatMessage.conversation_id == conversation_id
+    ).order_by(ChatMessage.created_at).all()
+
+
 @app.route('/api/chat/messages/<int:conversation_id>')
-@login_required
+@token_or_login_required
+@rate_limit('120/minute', key='user')
 def get_chat_messages(conversation_id):
-    conversation = ChatConversation.query.get_or_404(conversation_id)
+    # Fetch participants and validators in one statement; the latest message id
+    # comes from the chat_message.conversation_id index
+    latest_message_id = db.select(db.func.max(ChatMessage.id)).where(
+        ChatMessage.conversation_id == ChatConversation.id
+    ).correlate(ChatConversation).scalar_subquery()
+    
+    # Sender names come from the participants' User rows, so their updated_at
+    # is part of the validator too
+    patient_user = db.aliased(User)
+    doctor_user = db.aliased(User)
+    conversation = db.session.query(
+        ChatConversation.last_message_at,
+        PatientInfo.user_id.label('patient_user_id'),
+        DoctorInfo.user_id.label('doctor_user_id'),
+        patient_user.updated_at.label('patient_updated_at'),
+        doctor_user.updated_at.label('doctor_updated_at'),
+        latest_message_id.label('latest_message_id')
+    ).join(
+        PatientInfo, ChatConversation.patient_id == PatientInfo.id
+    ).join(
+        DoctorInfo, ChatConversation.doctor_id == DoctorInfo.id
+    ).join(
+        patient_user, PatientInfo.user_id == patient_user.id
+    ).join(
+        doctor_user, DoctorInfo.user_id == doctor_user.id
+    ).filter(ChatConversation.id == conversation_id).first()
+    
+    if conversation is None:
+        abort(404)
     
     # Check access
-    if current_user.is_patient() and conversation.patient.user_id != current_user.id:
+    if current_user.is_patient() and conversation.patient_user_id != current_user.id:
         return jsonify({'error': 'Access denied'}), 403
-    elif current_user.is_doctor() and conversation.doctor.user_id != current_user.id:
+    elif current_user.is_doctor() and conversation.doctor_user_id != current_user.id:
         return jsonify({'error': 'Access denied'}), 403
     
-    messages = ChatMessage.query.filter_by(conversation_id=conversation_id).order_by(ChatMessage.created_at).all()
+    # is_current_user differs per viewer, so the viewer is part of the validator
+    etag = make_etag('chat', conversation_id, conversation.latest_message_id,
+                     conversation.last_message_at, conversation.patient_updated_at,
+                     conversation.doctor_updated_at, current_user.id)
+    last_modified = max((stamp for stamp in (conversation.last_message_at,
+                                             conversation.patient_updated_at,
+                                             conversation.doctor_updated_at) if stamp is not None),
+                        default=None)
+    if is_not_modified(etag, last_modified):
+        return not_modified(etag, last_modified)
+    
+    messages_data = [
+        {
+            'id': message_id,
+            'sender_name': format_full_name(first_name, last_name, username),
+            'sender_id': sender_id,
+            'message_text': message_text,
+            'message_type': message_type,
+            'attachment_url': url_for('download_chat_attachment', attachment_id=attachment_id) if attachment_id else None,
+            'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'is_current_user': sender_id == current_user.id
+        }
+        for message_id, sender_id, message_text, created_at, message_type, attachment_id, first_name, last_name, username
+        in get_chat_message_rows(conversation_id)
+    ]
+    
+    return set_validators(jsonify({'messages': messages_data}), etag, last_modified)
+
+
+@app.route('/chat/<int:conversation_id>/attachments', methods=['POST', 'PUT'])
+@token_or_login_required
+def upload_chat_attachment(conversation_id):
+    conversation = ChatConversation.query.get_or_404(conversation_id)
     
-    messages_data = []
-    for message in messages:
-        messages_data.append({
-            'id': message.id,
-            'sender_name': message.sender.get_full_name(),
-            'sender_id': message.sender_id,
-            'message_text': message.message_text,
-            'created_at': message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'is_current_user': message.sender_id == current_user.id
-        })
+    if not is_conversation_participant(conversation, current_user):
+        return jsonify({'error': 'Access denied'}), 403
     
-    return jsonify({'messages': messages_data})
+    if request.method == 'PUT':
+        # Raw request body, read straight from the WSGI input stream
+        filename = request.args.get('filename', '')
+        content_type = request.mimetype or 'application/octet-stream'
+        stream = request.stream
+    else:
+        # Multipart form upload; Werkzeug spools large parts to a temp file
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'error': 'No file uploaded'}), 400
+        filename = upload.filename or ''
+        content_type = upload.mimetype or 'application/octet-stream'
+        stream = upload.stream
+    
+    filename = secure_filename(filename)
+    if not filename:
+        return jsonify({'error': 'Missing file name'}), 400
+    
+    try:
+        sha256, size = store_stream(stream, app.config['MAX_ATTACHMENT_SIZE'])
+    except AttachmentTooLarge:
+        return jsonify({'error': 'Attachment is too large'}), 413
+    
+    message = ChatMessage()
+    message.conversation_id = conversation.id
+    message.sender_id = current_user.id
+    message.message_text = filename
+    message.message_type = 'image' if content_type.startswith('image/') else 'file'
+    db.session.add(message)
+    
+    attachment = ChatAttachment()
+    attachment.sha256 = sha256
+    attachment.filename = filename
+    attachment.content_type = content_type
+    attachment.size = size
+    message.attachment = attachment
+    
+    conversation.last_message_at = datetime.utcnow()
+    db.session.commit()
+    
+    return jsonify({
+        'message_id': message.id,
+        'attachment_id': attachment.id,
+        'filename': attachment.filename,
+        'size': attachment.size,
+        'attachment_url': url_for('download_chat_attachment', attachment_id=attachment.id)
+    }), 201
+
+
+@app.route('/chat/attachments/<int:attachment_id>')
+@token_or_login_required
+def download_chat_attachment(attachment_id):
+    attachment = ChatAttachment.query.get_or_404(attachment_id)
+    
+    if not is_conversation_participant(attachment.message.conversation, current_user):
+        abort(403)
+    
+    # send_file handles Range/If-None-Match and hands the open file to the
+    # server's wsgi.file_wrapper (sendfile under gunicorn) or X-Sendfile
+    inline = attachment.message.message_type == 'image' and attachment.content_type in INLINE_CONTENT_TYPES
+    response = send_file(
+        blob_path(attachment.sha256),
+        mimetype=attachment.content_type,
+        as_attachment=not inline,
+        download_name=attachment.filename,
+        conditional=True,
+        etag=attachment.sha256,
+        max_age=0
+    )
+    # Clinical attachments must never be kept by shared caches
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+@app.route('/files/<kind>/<path:filename>')
+def download_file(kind, filename):
+    # Authorised by the signed URL and the session cookie (or bearer token)
+    # alone: no user loading or ownership queries on this path
+    user_id = bearer_user_id() or session.get('_user_id')
+    if not verify_download(kind, filename, user_id, request.args.get('expires'), request.args.get('sig')):
+        abort(403)
+    
+    # conditional=True adds ETag/Last-Modified checks and Range support
+    response = send_from_directory(get_private_folder(kind), filename, conditional=True, max_age=0)
+    response.cache_control.private = True
+    return response
 
 
 # Error handlers
@@ -1180,14 +1724,10 @@ def internal_server_error(e):
     return render_template('error.html', error_code=500, error_message='Internal server error'), 500
 
 
-def generate_pdf_report(report_data):
-    if not PDFKIT_AVAILABLE:
-        flash("PDF generation is not available. Please install wkhtmltopdf.", "warning")
-        return None
-        
+def generate_pdf_report(html_content):
+    # The configured renderer falls back to pure Python when wkhtmltopdf is missing
     try:
-        # Rest of the PDF generation code
-        return pdfkit.from_string(html_content, False)
+        return get_renderer().render(html_content)
     except Exception as e:
         flash(f"Error generating PDF: {str(e)}", "error")
         return None
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Run queued background jobs (report PDFs etc.) outside the web workers
+
+    python run_jobs.py          # poll forever
+    python run_jobs.py --once   # drain due jobs and exit
+"""
+import argparse
+import time
+
+from app import app, db
+from jobs import run_due_jobs
+
+def main():
+    parser = argparse.ArgumentParser(description='Run queued background jobs')
+    parser.add_argument('--once', action='store_true', help='run due jobs once and exit')
+    parser.add_argument('--interval', type=float, default=5, help='seconds between polls')
+    args = parser.parse_args()
+
+    with app.app_context():
+        while True:
+            count = run_due_jobs()
+            if count:
+                print(f"Ran {count} job(s)")
+            db.session.remove()
+            if args.once:
+                break
+            time.sleep(args.interval)
+
+if __name__ == '__main__':
+    main()
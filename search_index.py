@@ -0,0 +1,378 @@
+"""
+In-process typeahead index over users and doctor profiles
+
+Each worker builds the index in a background thread on its first request,
+then keeps it current two ways:
+    - ORM inserts, updates and deletes of User / DoctorInfo made in this
+      process are applied when their transaction commits
+    - a full rebuild every SEARCH_INDEX_REFRESH seconds picks up changes
+      made by other workers and by bulk scripts that bypass the ORM
+
+Lookups walk a sorted (token, user id) list from the bisect position of
+the query prefix, so they stop as soon as enough results pass the filters.
+Single terms of three or more characters that do not fill the page fall
+back to a trigram match inside names and usernames ("mith" -> "Smith");
+public searches match inside names and specializations only.
+Until the first build finishes, search_users() answers from indexed
+prefix range queries on lower(column).
+"""
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db
+from models import User, DoctorInfo
+
+MAX_RESULTS = 10
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+Entry = namedtuple('Entry', [
+    'id', 'role', 'first_name', 'last_name', 'username', 'email', 'is_active',
+    'doctor_info_id', 'specialization', 'is_approved',
+    'tokens',         # every searchable token
+    'public_tokens',  # tokens other users may match on: name and specialization
+    'text',           # lowercase name + username for trigram matches
+    'public_text',    # lowercase name + specialization, for public_only trigram matches
+])
+
+
+def _tokenize(*values):
+    tokens = set()
+    for value in values:
+        if value:
+            tokens.update(_TOKEN_RE.findall(value.lower()))
+    return tokens
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def make_entry(user_id, role, first_name, last_name, username, email, is_active,
+               doctor_info_id=None, specialization=None, is_approved=None):
+    public_tokens = _tokenize(first_name, last_name, specialization)
+    tokens = public_tokens | _tokenize(username, email)
+    if email:
+        tokens.add(email.lower())
+    return Entry(user_id, role, first_name, last_name, username, email, bool(is_active),
+                 doctor_info_id, specialization, bool(is_approved), frozenset(tokens), frozenset(public_tokens),
+                 ' '.join(filter(None, (first_name, last_name, username))).lower(),
+                 ' '.join(filter(None, (first_name, last_name, specialization))).lower())
+
+
+class SearchIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._tokens = []  # sorted (token, user_id)
+        self._trigrams = defaultdict(set)
+        self._public_trigrams = defaultdict(set)
+        self.ready = False
+        self.built_at = None
+        self._building = False
+        self._replay = []
+
+    @property
+    def building(self):
+        return self._building
+
+    # Maintenance
+
+    def _insert(self, entry):
+        self._entries[entry.id] = entry
+        for token in entry.tokens:
+            bisect.insort(self._tokens, (token, entry.id))
+        for trigram in _trigrams(entry.text):
+            self._trigrams[trigram].add(entry.id)
+        for trigram in _trigrams(entry.public_text):
+            self._public_trigrams[trigram].add(entry.id)
+
+    def _delete(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return None
+        for token in entry.tokens:
+            position = bisect.bisect_left(self._tokens, (token, user_id))
+            if position < len(self._tokens) and self._tokens[position] == (token, user_id):
+                del self._tokens[position]
+        for trigrams, text in ((self._trigrams, entry.text), (self._public_trigrams, entry.public_text)):
+            for trigram in _trigrams(text):
+                ids = trigrams.get(trigram)
+                if ids is not None:
+                    ids.discard(user_id)
+                    if not ids:
+                        del trigrams[trigram]
+        return entry
+
+    def apply(self, op, payload):
+        """
+        Apply one committed change
+
+        op is 'upsert' (payload: Entry), 'delete' (payload: user id) or
+        'profile' (payload: dict of doctor profile fields with user_id).
+        """
+        with self._lock:
+            if self._building:
+                self._replay.append((op, payload))
+            if op == 'upsert':
+                previous = self._delete(payload.id)
+                if previous is not None and payload.doctor_info_id is None and previous.doctor_info_id is not None:
+                    # Profile fields were not loaded with the user: keep the indexed ones
+                    payload = make_entry(payload.id, payload.role, payload.first_name, payload.last_name,
+                                         payload.username, payload.email, payload.is_active,
+                                         previous.doctor_info_id, previous.specialization, previous.is_approved)
+                self._insert(payload)
+            elif op == 'delete':
+                self._delete(payload)
+            elif op == 'profile':
+                previous = self._delete(payload['user_id'])
+                if previous is not None:
+                    self._insert(make_entry(previous.id, previous.role, previous.first_name, previous.last_name,
+                                            previous.username, previous.email, previous.is_active,
+                                            payload['doctor_info_id'], payload['specialization'],
+                                            payload['is_approved']))
+
+    def rebuild(self, batch_size=5000):
+        """Load every user from the database into a fresh index and swap it in"""
+        with self._lock:
+            self._building = True
+            self._replay = []
+        try:
+            fresh = SearchIndex()
+            rows = db.session.query(
+                User.id, User.role, User.first_name, User.last_name, User.username, User.email, User.is_active,
+                DoctorInfo.id, DoctorInfo.specialization, DoctorInfo.is_approved
+            ).outerjoin(DoctorInfo, DoctorInfo.user_id == User.id).yield_per(batch_size)
+            tokens = []
+            for row in rows:
+                entry = make_entry(*row)
+                fresh._entries[entry.id] = entry
+                tokens.extend((token, entry.id) for token in entry.tokens)
+                for trigram in _trigrams(entry.text):
+                    fresh._trigrams[trigram].add(entry.id)
+                for trigram in _trigrams(entry.public_text):
+                    fresh._public_trigrams[trigram].add(entry.id)
+            tokens.sort()
+            fresh._tokens = tokens
+            db.session.remove()
+
+            with self._lock:
+                self._entries, self._tokens = fresh._entries, fresh._tokens
+                self._trigrams, self._public_trigrams = fresh._trigrams, fresh._public_trigrams
+                replay, self._replay = self._replay, []
+                self._building = False
+                # Changes committed while the snapshot was being read
+                for op, payload in replay:
+                    self.apply(op, payload)
+                self.ready = True
+                self.built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._building = False
+
+    # Lookups
+
+    def search(self, query, accept, public_only=False, limit=MAX_RESULTS):
+        """
+        Entries matching every term of query by token prefix, then by trigram
+
+        Args:
+            accept: Predicate on Entry deciding who may appear
+            public_only: Match names and specializations only
+        """
+        terms = _TOKEN_RE.findall(query.lower())
+        if not terms:
+            return []
+
+        with self._lock:
+            # Drive the scan with the term that has the fewest prefix matches
+            ranges = []
+            for term in terms:
+                start = bisect.bisect_left(self._tokens, (term,))
+                end = bisect.bisect_left(self._tokens, (term + '\uffff',))
+                ranges.append((end - start, start, end, term))
+            _, start, end, driver = min(ranges)
+
+            results, seen = [], set()
+            for position in range(start, end):
+                token, user_id = self._tokens[position]
+                if user_id in seen:
+                    continue
+                entry = self._entries[user_id]
+                tokens = entry.public_tokens if public_only else entry.tokens
+                if public_only and token not in tokens:
+                    continue
+                if all(any(t.startswith(term) for t in tokens) for term in terms) and accept(entry):
+                    seen.add(user_id)
+                    results.append(entry)
+                    if len(results) >= limit:
+                        return results
+
+            if len(terms) == 1 and len(driver) >= 3:
+                # Public searches never match inside usernames
+                trigrams = self._public_trigrams if public_only else self._trigrams
+                candidates = None
+                for trigram in _trigrams(driver):
+                    ids = trigrams.get(trigram, set())
+                    candidates = ids if candidates is None else candidates & ids
+                    if not candidates:
+                        break
+                for user_id in sorted(candidates or ()):
+                    entry = self._entries[user_id]
+                    text = entry.public_text if public_only else entry.text
+                    if user_id not in seen and driver in text and accept(entry):
+                        seen.add(user_id)
+                        results.append(entry)
+                        if len(results) >= limit:
+                            break
+            return results
+
+
+index = SearchIndex()
+_start_lock = threading.Lock()
+_refresher = None
+
+
+def ensure_started(app):
+    """Build the index in the background once per worker and refresh it periodically"""
+    global _refresher
+    if _refresher is not None or not app.config.get('SEARCH_INDEX_ENABLED', True):
+        return
+    with _start_lock:
+        if _refresher is not None:
+            return
+
+        def refresh_loop():
+            interval = app.config.get('SEARCH_INDEX_REFRESH', 300)
+            while True:
+                try:
+                    with app.app_context():
+                        index.rebuild()
+                except Exception:
+                    app.logger.exception("Search index rebuild failed")
+                time.sleep(interval)
+
+        _refresher = threading.Thread(target=refresh_loop, name='search-index', daemon=True)
+        _refresher.start()
+
+
+def _sql_prefix_search(terms, roles, public_only, doctors_only_approved, limit):
+    """Cold-index fallback: prefix range scans on lower(column) expression indexes"""
+    term = terms[0]
+    upper = term[:-1] + chr(ord(term[-1]) + 1)
+    columns = [db.func.lower(User.first_name), db.func.lower(User.last_name), db.func.lower(DoctorInfo.specialization)]
+    if not public_only:
+        columns += [db.func.lower(User.username), db.func.lower(User.email)]
+
+    query = db.session.query(
+        User.id, User.role, User.first_name, User.last_name, User.username, User.email, User.is_active,
+        DoctorInfo.id, DoctorInfo.specialization, DoctorInfo.is_approved
+    ).outerjoin(
+        DoctorInfo, DoctorInfo.user_id == User.id
+    ).filter(
+        # The range uses the index; LIKE keeps exact prefix semantics under any collation
+        db.or_(*[db.and_(column >= term, column < upper, column.like(term + '%')) for column in columns]),
+        User.role.in_(roles)
+    )
+    if doctors_only_approved:
+        query = query.filter(User.is_active == True, DoctorInfo.is_approved == True)
+
+    results = []
+    for row in query.limit(limit * 5):
+        entry = make_entry(*row)
+        tokens = entry.public_tokens if public_only else entry.tokens
+        if all(any(t.startswith(term) for t in tokens) for term in terms):
+            results.append(entry)
+            if len(results) >= limit:
+                break
+    return results
+
+
+def search_users(query, roles, public_only=False, approved_doctors_only=False, limit=MAX_RESULTS):
+    """
+    Typeahead lookup
+
+    Args:
+        query: User input; every word must prefix-match a field
+        roles: Roles to include
+        public_only: Only match on names and specializations
+        approved_doctors_only: Hide inactive users and unapproved doctors
+    """
+    limit = max(1, min(limit, 50))
+
+    def accept(entry):
+        if entry.role not in roles:
+            return False
+        return not approved_doctors_only or (entry.is_active and entry.is_approved)
+
+    if index.ready:
+        return index.search(query, accept, public_only, limit)
+    terms = _TOKEN_RE.findall(query.lower())
+    if not terms:
+        return []
+    return _sql_prefix_search(terms, roles, public_only, approved_doctors_only, limit)
+
+
+# Incremental maintenance: collect changes per session at flush, apply on commit
+
+def _pending(target):
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault('search_index_changes', [])
+
+
+def _user_changed(mapper, connection, target):
+    pending = _pending(target)
+    if pending is None:
+        return
+    profile = target.__dict__.get('doctor_info')
+    pending.append(('upsert', make_entry(
+        target.id, target.role, target.first_name, target.last_name, target.username, target.email,
+        target.is_active if target.is_active is not None else True,
+        profile.id if profile is not None else None,
+        profile.specialization if profile is not None else None,
+        profile.is_approved if profile is not None else None,
+    )))
+
+
+def _user_deleted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.append(('delete', target.id))
+
+
+def _profile_changed(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.append(('profile', {
+            'user_id': target.user_id, 'doctor_info_id': target.id,
+            'specialization': target.specialization, 'is_approved': target.is_approved,
+        }))
+
+
+def _after_commit(session):
+    changes = session.info.pop('search_index_changes', None)
+    if changes and (index.ready or index.building):
+        for op, payload in changes:
+            index.apply(op, payload)
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop('search_index_changes', None)
+
+
+event.listen(User, 'after_insert', _user_changed)
+event.listen(User, 'after_update', _user_changed)
+event.listen(User, 'after_delete', _user_deleted)
+event.listen(DoctorInfo, 'after_insert', _profile_changed)
+event.listen(DoctorInfo, 'after_update', _profile_changed)
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_soft_rollback', _after_rollback)
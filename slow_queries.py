@@ -0,0 +1,220 @@
+"""
+Slow-query log with route and call-site attribution
+
+Every SQL statement slower than SLOW_QUERY_THRESHOLD_MS is written as one
+JSON line to a rotating file under SLOW_QUERY_FOLDER (one file per worker,
+so rotation never races between processes). A record holds:
+
+    sql           statement text as sent, with placeholders (bound values
+                  are never part of it)
+    normalized    the text with placeholders, literals and IN-lists folded,
+                  used to group records
+    params        parameter shapes only: type names, never values (PHI)
+    duration_ms, rowcount, endpoint
+    caller        the line in a view module (routes.py, auth.py) that
+                  issued the query
+    origin        the innermost application line, when different (a
+                  helper in models.py or directory.py)
+
+Call sites are resolved by walking the stack, only for slow statements.
+aggregate() reads every worker's files and ranks normalized statements
+by total time, for /admin/slow-queries.
+"""
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+VIEW_MODULES = ('routes.py', 'auth.py')
+MAX_SQL_LENGTH = 4000
+MAX_PARAMS = 20
+# Files of workers that stopped writing this long ago are deleted
+RETENTION = 7 * 24 * 3600
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+
+_settings = None  # (threshold seconds, folder, max bytes, backups) once init_app has run
+_logger = None  # (pid, logger): rebuilt in workers forked after the master logged
+_logger_lock = threading.Lock()
+
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)'
+_IN_LIST_RE = re.compile(r'\(\s*' + _PLACEHOLDER + r'(?:\s*,\s*' + _PLACEHOLDER + r')+\s*\)')
+_PLACEHOLDER_RE = re.compile(_PLACEHOLDER)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """Statement text with values and placeholder lists folded, for grouping"""
+    text = _STRING_RE.sub('?', statement)
+    text = _IN_LIST_RE.sub('(?...)', text)
+    text = _PLACEHOLDER_RE.sub('?', text)
+    text = _NUMBER_RE.sub('?', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+def _shape(parameters):
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in list(parameters.items())[:MAX_PARAMS]}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters[:MAX_PARAMS]]
+    return type(parameters).__name__
+
+
+def parameter_shape(parameters, executemany=False):
+    """Type names of the bound parameters; values are never recorded"""
+    if executemany and isinstance(parameters, (list, tuple)):
+        return {'rows': len(parameters), 'first': _shape(parameters[0]) if parameters else None}
+    return _shape(parameters)
+
+
+def _call_sites():
+    """(view module line, innermost application line) of the running query"""
+    caller = origin = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_ROOT) and filename != _THIS_FILE and 'site-packages' not in filename:
+            site = f"{os.path.relpath(filename, _ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+            if origin is None:
+                origin = site
+            if os.path.basename(filename) in VIEW_MODULES:
+                caller = site
+                break
+        frame = frame.f_back
+    return caller, origin
+
+
+def _get_logger():
+    global _logger
+    pid = os.getpid()
+    with _logger_lock:
+        if _logger is None or _logger[0] != pid:
+            _, folder, max_bytes, backups = _settings
+            os.makedirs(folder, exist_ok=True)
+            handler = RotatingFileHandler(os.path.join(folder, f"slow_queries-{pid}.log"),
+                                          maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger = logging.getLogger(f'psychcare.slow_queries.{pid}')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _logger = (pid, logger)
+        return _logger[1]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _settings is not None and context is not None:
+        context._slow_query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _settings is None or context is None:
+        return
+    started = getattr(context, '_slow_query_started', None)
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    if duration < _settings[0]:
+        return
+
+    caller, origin = _call_sites()
+    rowcount = getattr(cursor, 'rowcount', -1)
+    record = {
+        'at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'duration_ms': round(duration * 1000, 2),
+        'sql': statement[:MAX_SQL_LENGTH],
+        'normalized': normalize_sql(statement)[:MAX_SQL_LENGTH],
+        'params': parameter_shape(parameters, executemany),
+        'rowcount': rowcount if rowcount is not None and rowcount >= 0 else None,
+        'endpoint': request.endpoint if has_request_context() else None,
+        'caller': caller,
+        'origin': origin if origin != caller else None,
+    }
+    try:
+        _get_logger().info(json.dumps(record, default=str))
+    except OSError:
+        # Never fail the query because the log is unwritable
+        pass
+
+
+def _log_files(folder):
+    return glob.glob(os.path.join(folder, 'slow_queries-*.log*'))
+
+
+def aggregate(folder, limit=50):
+    """
+    Worst statements across every worker's log, by total time
+
+    Returns:
+        List of dicts per normalized statement: count, total/mean/p95/max
+        duration, largest row count, and the most frequent endpoints and
+        call sites
+    """
+    groups = {}
+    now = time.time()
+    for path in _log_files(folder):
+        try:
+            if now - os.path.getmtime(path) > RETENTION:
+                os.remove(path)
+                continue
+            with open(path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            group = groups.setdefault(record['normalized'], {
+                'statement': record['normalized'], 'durations': [], 'max_rowcount': None,
+                'last_seen': record['at'], 'endpoints': {}, 'callers': {},
+            })
+            group['durations'].append(record['duration_ms'])
+            group['last_seen'] = max(group['last_seen'], record['at'])
+            if record.get('rowcount') is not None:
+                group['max_rowcount'] = max(group['max_rowcount'] or 0, record['rowcount'])
+            endpoint = record.get('endpoint') or '(no request)'
+            group['endpoints'][endpoint] = group['endpoints'].get(endpoint, 0) + 1
+            caller = record.get('caller') or record.get('origin') or '(unknown)'
+            group['callers'][caller] = group['callers'].get(caller, 0) + 1
+
+    results = []
+    for group in groups.values():
+        durations = sorted(group.pop('durations'))
+        group['count'] = len(durations)
+        group['total_ms'] = round(sum(durations), 2)
+        group['mean_ms'] = round(group['total_ms'] / len(durations), 2)
+        group['p95_ms'] = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        group['max_ms'] = durations[-1]
+        group['endpoints'] = sorted(group['endpoints'].items(), key=lambda item: item[1], reverse=True)[:5]
+        group['callers'] = sorted(group['callers'].items(), key=lambda item: item[1], reverse=True)[:5]
+        results.append(group)
+    results.sort(key=lambda group: group['total_ms'], reverse=True)
+    return results[:limit]
+
+
+def init_app(app):
+    """Start recording statements slower than SLOW_QUERY_THRESHOLD_MS"""
+    global _settings
+    if not app.config.get('SLOW_QUERY_ENABLED', True):
+        return
+    _settings = (app.config.get('SLOW_QUERY_THRESHOLD_MS', 200) / 1000.0,
+                 app.config['SLOW_QUERY_FOLDER'],
+                 app.config.get('SLOW_QUERY_MAX_BYTES', 5 * 1024 * 1024),
+                 app.config.get('SLOW_QUERY_BACKUPS', 3))
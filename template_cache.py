@@ -0,0 +1,124 @@
+"""
+Persistent Jinja bytecode cache, template warm-up and timing
+
+Compiled templates are stored under TEMPLATE_CACHE_FOLDER, shared by
+every worker on the host and kept across restarts; Jinja checks each
+entry against the template source, so edited templates recompile on
+their own. warm_templates() (run at startup when TEMPLATE_WARMUP is on,
+or ahead of a deploy with `python warm_templates.py`) loads every
+template so no request pays for compilation.
+
+Per route it records how long was spent compiling templates (cold
+workers or an empty bytecode cache), loading them from the bytecode
+cache, and rendering them: stats().
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from flask.templating import Environment
+from jinja2 import FileSystemBytecodeCache, TemplateError
+
+_stats = defaultdict(lambda: {'requests': 0, 'compiled': 0, 'compile_seconds': 0.0,
+                              'loaded': 0, 'load_seconds': 0.0, 'rendered': 0, 'render_seconds': 0.0})
+_stats_lock = threading.Lock()
+
+
+def _timings():
+    if not has_request_context():
+        return None
+    timings = g.get('_template_timings')
+    if timings is None:
+        timings = g._template_timings = {'compiled': 0, 'compile_seconds': 0.0, 'loaded': 0, 'load_seconds': 0.0,
+                                         'rendered': 0, 'render_seconds': 0.0, 'render_started': []}
+    return timings
+
+
+class InstrumentedEnvironment(Environment):
+    """Flask's template environment, timing compilation"""
+
+    def compile(self, source, name=None, filename=None, raw=False, defer_init=False):
+        started = time.perf_counter()
+        try:
+            return super().compile(source, name, filename, raw, defer_init)
+        finally:
+            timings = _timings()
+            if timings is not None:
+                timings['compiled'] += 1
+                timings['compile_seconds'] += time.perf_counter() - started
+
+
+class TimedBytecodeCache(FileSystemBytecodeCache):
+    """On-disk bytecode cache counting the templates it serves"""
+
+    def load_bytecode(self, bucket):
+        started = time.perf_counter()
+        super().load_bytecode(bucket)
+        timings = _timings()
+        if timings is not None and bucket.code is not None:
+            timings['loaded'] += 1
+            timings['load_seconds'] += time.perf_counter() - started
+
+
+def _before_render(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None:
+        timings['render_started'].append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None and timings['render_started']:
+        timings['rendered'] += 1
+        timings['render_seconds'] += time.perf_counter() - timings['render_started'].pop()
+
+
+def _record_route(response):
+    timings = g.pop('_template_timings', None)
+    if timings is not None:
+        rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        with _stats_lock:
+            stats = _stats[rule]
+            stats['requests'] += 1
+            for field in ('compiled', 'compile_seconds', 'loaded', 'load_seconds', 'rendered', 'render_seconds'):
+                stats[field] += timings[field]
+    return response
+
+
+def stats():
+    """Per-route template totals, slowest compile + load first"""
+    with _stats_lock:
+        rows = [dict(route=route, **values) for route, values in _stats.items()]
+    return sorted(rows, key=lambda row: row['compile_seconds'] + row['load_seconds'], reverse=True)
+
+
+def warm_templates(app):
+    """
+    Load every template once, filling the bytecode cache
+
+    Returns:
+        (templates loaded, seconds taken, names that failed to compile)
+    """
+    started = time.perf_counter()
+    loaded, failed = 0, []
+    for name in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(name)
+            loaded += 1
+        except TemplateError:
+            app.logger.exception("Template %s failed to compile", name)
+            failed.append(name)
+    return loaded, time.perf_counter() - started, failed
+
+
+def init_app(app):
+    """Must run before anything touches app.jinja_env"""
+    folder = app.config['TEMPLATE_CACHE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    app.jinja_environment = InstrumentedEnvironment
+    app.jinja_options = dict(app.jinja_options, bytecode_cache=TimedBytecodeCache(folder))
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.after_request(_record_route)
@@ -5,6 +5,7 @@ Update doctor profile photos with appropriate SVG avatars
 
 from app import app, db
 from models import User, DoctorInfo
+from page_cache import bump_fragment
 
 def update_doctor_photos():
     """Update all doctors with appropriate profile photos"""
@@ -63,6 +64,7 @@ def update_doctor_photos():
         
         # Commit all changes
         db.session.commit()
+        bump_fragment('doctors')
         print(f"Successfully updated profile photos for {len(doctors)} doctors")
 
 if __name__ == '__main__':
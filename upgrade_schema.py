@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Add columns that db.create_all() cannot add to tables which already exist
+"""
+from app import app, db
+from sqlalchemy import inspect, text
+
+# (table, column, DDL, optional backfill statement)
+COLUMNS = [
+    ('patient_report', 'status', "VARCHAR(20) NOT NULL DEFAULT 'pending'",
+     "UPDATE patient_report SET status = CASE WHEN pdf_path IS NULL THEN 'failed' ELSE 'ready' END"),
+    ('patient_report', 'content_hash', 'VARCHAR(64)', None),
+    ('user', 'updated_at', 'TIMESTAMP',
+     'UPDATE "user" SET updated_at = created_at'),
+]
+
+def upgrade_schema():
+    with app.app_context():
+        inspector = inspect(db.engine)
+        quote = db.engine.dialect.identifier_preparer.quote
+        for table, column, ddl, backfill in COLUMNS:
+            existing = {c['name'] for c in inspector.get_columns(table)}
+            if column in existing:
+                continue
+            db.session.execute(text(f'ALTER TABLE {quote(table)} ADD COLUMN {column} {ddl}'))
+            if backfill:
+                db.session.execute(text(backfill))
+            print(f"Added {table}.{column}")
+        db.session.commit()
+        print("Schema is up to date")
+
+if __name__ == '__main__':
+    upgrade_schema()
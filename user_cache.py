@@ -0,0 +1,39 @@
+"""
+Short-lived, per-worker cache of authenticated principals
+
+Holds detached User objects (with their role profile loaded) keyed by id,
+in an app_cache.LocalBackend: ORM instances never leave the process, even
+when the application cache is shared. Entries expire after USER_CACHE_TTL
+seconds; admin actions and profile edits in this worker call
+invalidate_user() so they take effect at once, other workers pick them up
+when the entry expires. invalidate_user() also drops every application
+cache entry tagged 'user:<id>'.
+"""
+from app_cache import LocalBackend, MISSING, invalidate
+
+DEFAULT_TTL = 30
+MAX_ENTRIES = 10000
+
+_backend = LocalBackend(MAX_ENTRIES)
+
+
+def get_user(user_id):
+    user = _backend.get(int(user_id))
+    return None if user is MISSING else user
+
+
+def set_user(user_id, user, ttl=DEFAULT_TTL):
+    _backend.set(int(user_id), user, ttl, tags=(f'user:{user_id}',))
+
+
+def invalidate_user(user_id):
+    _backend.delete(int(user_id))
+    invalidate(f'user:{user_id}')
+
+
+def stats():
+    return _backend.info()
+
+
+def clear():
+    _backend.clear()
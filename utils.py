@@ -1,15 +1,16 @@
 from datetime import datetime, timedelta
 import os
-import pdfkit
 from flask import render_template
 
+from pdf_renderers import get_renderer
+
 def get_availability_slots(availabilities, existing_appointments):
     """
     Calculate available time slots based on doctor's availability and existing appointments
     
     Args:
-        availabilities: List of Availability objects
-        existing_appointments: List of Appointment objects
+        availabilities: Availability objects or rows with start_time/end_time
+        existing_appointments: Appointment objects or rows with start_time/end_time
     
     Returns:
         List of available time slots in format "HH:MM - HH:MM"
@@ -17,6 +18,13 @@ def get_availability_slots(availabilities, existing_appointments):
     available_slots = []
     slot_duration = 30  # 30 minutes per appointment
     
+    # Convert booked ranges once instead of once per candidate slot
+    booked_ranges = [
+        (datetime.combine(datetime.today(), appointment.start_time),
+         datetime.combine(datetime.today(), appointment.end_time))
+        for appointment in existing_appointments
+    ]
+    
     for availability in availabilities:
         # Convert to datetime for easier manipulation
         start_dt = datetime.combine(datetime.today(), availability.start_time)
@@ -29,10 +37,7 @@ def get_availability_slots(availabilities, existing_appointments):
             
             # Check if this slot overlaps with any existing appointment
             slot_available = True
-            for appointment in existing_appointments:
-                appt_start = datetime.combine(datetime.today(), appointment.start_time)
-                appt_end = datetime.combine(datetime.today(), appointment.end_time)
-                
+            for appt_start, appt_end in booked_ranges:
                 # Check for overlap
                 if (current_slot < appt_end and slot_end > appt_start):
                     slot_available = False
@@ -46,18 +51,19 @@ def get_availability_slots(availabilities, existing_appointments):
     
     return available_slots
 
-def create_pdf_report(report, patient, doctor, output_path):
+# Bump whenever build_report_html changes so cached report PDFs are re-rendered
+REPORT_TEMPLATE_VERSION = 1
+
+def build_report_html(report, patient, doctor):
     """
-    Generate a PDF report for a patient
+    Build the HTML document for a patient report
     
     Args:
         report: PatientReport object
         patient: User object for the patient
         doctor: User object for the doctor
-        output_path: Path to save the PDF
     """
-    # Create HTML content for PDF
-    html_content = f"""
+    return f"""
     <html>
     <head>
         <style>
@@ -118,11 +124,26 @@ def create_pdf_report(report, patient, doctor, output_path):
     </body>
     </html>
     """
+
+def create_pdf_report(report, patient, doctor, output_path):
+    """
+    Generate a PDF report for a patient
     
-    # Generate PDF
+    Args:
+        report: PatientReport object
+        patient: User object for the patient
+        doctor: User object for the doctor
+        output_path: Path to save the PDF
+    """
+    html_content = build_report_html(report, patient, doctor)
+    
+    # Generate PDF with the configured renderer backend
     try:
-        pdfkit.from_string(html_content, output_path)
-        return True
+        pdf_bytes = get_renderer().render(html_content)
     except Exception as e:
         print(f"Error generating PDF: {str(e)}")
         return False
+    
+    with open(output_path, 'wb') as f:
+        f.write(pdf_bytes)
+    return True
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Precompile every template into the shared bytecode cache (see template_cache.py)
+
+    python warm_templates.py
+
+Run at build or deploy time so the first requests of new workers load
+bytecode instead of compiling templates.
+"""
+import os
+import sys
+
+# Importing the app would already warm the templates; do it once, here
+os.environ['TEMPLATE_WARMUP'] = '0'
+
+from app import app
+from template_cache import warm_templates
+
+
+def main():
+    loaded, seconds, failed = warm_templates(app)
+    print(f"Compiled {loaded} templates into {app.config['TEMPLATE_CACHE_FOLDER']} in {seconds:.2f}s")
+    for name in failed:
+        print(f"  failed: {name}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())